@@ -7,9 +7,29 @@ from src.continuous import continuous_consensus
 from src.util import example_graph1, three_agents
 
 
-def display(X0, x, steps):
+MAX_DISPLAY_POINTS = 200_000
+"""
+Maximum number of trajectory points drawn (all agents together) : longer trajectories are downsampled
+to evenly spaced steps for display
+"""
+
+
+def display(X0, x, steps, epsilon: float = None, max_points: int = MAX_DISPLAY_POINTS):
     """
     Graphs the 2D consensus with a slider to see its progress over time.
+
+    Artists are created once and only their data is updated when the slider moves, with blitting
+    (only the trajectories, the current positions and the slider are redrawn), so that scrubbing
+    does not slow down with the number of steps.
+    Parameters:
+        - X0: Initial states (N, 2)
+        - x: States over time (T, N, 2)
+        - steps: Step shown initially
+        - (Optional) epsilon: Step size, shown in the title
+        - max_points: Trajectories of all agents are drawn with at most this number of points in total
+          (evenly spaced steps), the current positions are always exact
+    Returns:
+        The Slider, which has to be kept referenced when plt.show() does not block (interactive mode)
     """
     fig, ax = plt.subplots()
     fig.set_size_inches(8, 4)
@@ -22,11 +42,17 @@ def display(X0, x, steps):
         valinit=steps,
         valstep=1.  # step between values
     )
+    # the slider is redrawn by update(), along with the trajectories
+    freq_slider.drawon = False
     plt.title(f"2D formation based on discrete-time consensus, epsilon = {epsilon}")
     plt.xlabel("x")
     plt.ylabel("y")
-    lines = ax.plot(x[:, :, 0], x[:, :, 1])
-    ax.scatter(x[steps - 1, :, 0], x[steps - 1, :, 1], facecolors="none", edgecolors="r", linewidths=2)
+
+    # Downsampled steps, and trajectories laid out as (N, 2, steps) so that x[:val] of an agent is a contiguous view
+    shown = np.unique(np.linspace(0, x.shape[0] - 1, min(x.shape[0], max(2, max_points // x.shape[1]))).astype(int))
+    paths = np.ascontiguousarray(x[shown].transpose(1, 2, 0))
+    lines = ax.plot(x[shown, :, 0], x[shown, :, 1])  # full trajectories, to set the limits of the axes
+    current = ax.scatter(x[steps - 1, :, 0], x[steps - 1, :, 1], facecolors="none", edgecolors="r", linewidths=2)
 
     avg = np.average(X0, axis=0)
     ax.scatter(avg[0], avg[1])
@@ -36,17 +62,46 @@ def display(X0, x, steps):
     print(f"Expected meetup point (exact average) : {avg}")
     print(f"Final state positions (after {steps} steps): {x[-1]}")
     ax.set_aspect('equal', adjustable='box')
+    ax.autoscale(False)
+
+    animated = lines + [current, freq_slider.poly, freq_slider.valtext]
+    # knob of the slider : private attribute of matplotlib >= 3.5 (older versions only draw `poly`)
+    handle = getattr(freq_slider, '_handle', None)
+    if handle is not None:
+        animated.append(handle)
+    for artist in animated:
+        artist.set_animated(True)
+    background = None
+
+    def draw_animated():
+        for artist in animated:
+            artist.axes.draw_artist(artist)
+
+    def on_draw(event):
+        """Saves the figure without the animated artists (after a resize or a zoom for instance)"""
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        draw_animated()
 
     def update(val: float):
         """Callback function that is called when the slider is moved"""
         val = int(val)
-        ax.clear()
-        ax.plot(x[:val, :, 0], x[:val, :, 1])
-        ax.scatter(x[val - 1, :, 0], x[val - 1, :, 1], facecolors="none", edgecolors="r", linewidths=2)
-        ax.scatter(avg[0], avg[1])
+        end = np.searchsorted(shown, val)  # downsampled steps before val
+        for line, path in zip(lines, paths):
+            line.set_data(path[0, :end], path[1, :end])
+        current.set_offsets(x[val - 1])
+        if background is None:
+            fig.canvas.draw_idle()
+            return
+        fig.canvas.restore_region(background)
+        draw_animated()
+        fig.canvas.blit(fig.bbox)
 
+    update(steps)
+    fig.canvas.mpl_connect('draw_event', on_draw)
     freq_slider.on_changed(update)
     plt.show()
+    return freq_slider
 
 if __name__ == "__main__":
     """
@@ -80,4 +135,4 @@ if __name__ == "__main__":
     # steps = len(t)
     # x = continuous_consensus(G, X0, t, offsets=np.array([array([ 0.478125  , -0.00833333]), array([-0.23203125,  0.35416667]), array([-0.24609375, -0.34583333])]))
 
-    display(X0, x, steps)
+    display(X0, x, steps, epsilon)
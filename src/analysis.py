@@ -0,0 +1,227 @@
+"""
+Streaming analysis of recorded runs : runs written by src.recorder.RunRecorder, and the datasets of `src/data/`.
+
+    python3 -m src.analysis src/data/*/            # summary of every run, computed in parallel
+    python3 -m src.analysis src/data/line --plot   # also plots the achievement and the trajectories
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import networkx as nx
+import numpy as np
+
+from src.consensus_operator import ConsensusOperator
+from src.convergence import achievement as agent_achievement
+from src.recorder import Run, open_run
+
+CHUNK_TICKS = 4096
+"""Number of ticks read at once by the streaming passes"""
+
+SETTLE_FRACTION = 0.05
+"""A run has converged once its total achievement stays below this fraction of its maximum"""
+
+TAIL_FRACTION = 0.05
+"""Fraction of the run (its last ticks) over which the settling error is averaged"""
+
+MAX_PLOT_POINTS = 2000
+"""Default number of points of the decimated curves"""
+
+
+def load_run(path: str):
+    """
+    Memory-maps a run : either a directory written by RunRecorder, or a dataset of `src/data/`
+    (`real_results.npy` and `achievement.npy`).
+    Returns:
+        A src.recorder.Run
+    """
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return open_run(path)
+    positions = np.load(os.path.join(path, 'real_results.npy'), mmap_mode='r')
+    file = os.path.join(path, 'achievement.npy')
+    achievement = np.load(file, mmap_mode='r') if os.path.exists(file) else None
+    return Run(positions=positions, commands=None, achievement=achievement, params={},
+               meta={'ticks': len(positions), 'complete': True})
+
+
+def find_runs(root: str):
+    """Directories under `root` holding a run (see load_run())"""
+    return sorted(dirpath for dirpath, _, files in os.walk(root)
+                  if 'meta.json' in files or 'real_results.npy' in files)
+
+
+def _achievement_source(run: Run):
+    """
+    Function returning the achievement (T, N) of the positions of a chunk (see src.convergence.achievement()).
+    It is computed from the graph and offsets of the parameters of the run when they are known, so that all runs
+    are measured the same way. Otherwise (datasets of `src/data/`, whose graph is not stored) the recorded
+    values are used.
+    """
+    graph = run.params.get('graph')
+    if graph:
+        G = nx.DiGraph()
+        G.add_nodes_from(range(graph['nodes']))
+        G.add_edges_from(map(tuple, graph['edges']))
+        op = ConsensusOperator(G)
+        offsets = None if run.params.get('offsets') is None else np.asarray(run.params['offsets'])
+        return lambda start, positions: agent_achievement(op, positions, offsets)
+    if run.achievement is not None and not np.all(np.isnan(run.achievement[:1])):
+        return lambda start, positions: np.asarray(run.achievement[start:start + len(positions)])
+    return None
+
+
+def summarize_run(path: str, chunk: int = CHUNK_TICKS, settle: float = SETTLE_FRACTION, tail: float = TAIL_FRACTION):
+    """
+    Summary of a run, computed in a single pass over chunks of `chunk` ticks
+    (only the total achievement of each tick, of shape (T,), is kept in memory).
+
+    The achievement of a tick is the sum of the achievement of all agents (see src.convergence.achievement()),
+    and its percentage is computed as in `data/analyze_results.py` : 100 * (max - achievement) / max.
+    Returns:
+        Dictionary with :
+            - path, ticks, agents
+            - final_achievement_pct: Achievement percentage of the last tick
+            - max_achievement_pct: Highest achievement percentage reached
+            - convergence_tick: First tick after which the achievement stays below `settle` times its maximum,
+              None if it never does
+            - settling_error: Mean achievement per agent over the last `tail` fraction of the run
+            - path_length: Distance travelled by each agent (list of N values)
+    """
+    run = load_run(path)
+    positions = run.positions
+    T, N = positions.shape[:2]
+    source = _achievement_source(run)
+    total = np.full(T, np.nan)
+    path_length = np.zeros(N)
+    previous = None
+    for start in range(0, T, chunk):
+        p = np.asarray(positions[start:start + chunk])
+        steps = np.diff(p if previous is None else np.concatenate((previous[np.newaxis], p)), axis=0)
+        path_length += np.linalg.norm(steps, axis=2).sum(axis=0)
+        previous = p[-1]
+        if source is not None:
+            total[start:start + len(p)] = source(start, p).sum(axis=1)
+
+    summary = {'path': path, 'ticks': T, 'agents': N, 'path_length': path_length.tolist()}
+    if source is None or T == 0:
+        return summary
+    s_max = np.nanmax(total)
+    above = np.flatnonzero(total > settle * s_max)
+    convergence = 0 if len(above) == 0 else above[-1] + 1
+    summary.update({
+        'final_achievement_pct': float(100. * (s_max - total[-1]) / s_max) if s_max > 0 else 100.,
+        'max_achievement_pct': float(100. * (s_max - np.nanmin(total)) / s_max) if s_max > 0 else 100.,
+        'convergence_tick': int(convergence) if convergence < T else None,
+        'settling_error': float(np.nanmean(total[-max(1, int(tail * T)):]) / N),
+    })
+    return summary
+
+
+def summarize_runs(paths, workers: int = None, **kwargs):
+    """summarize_run() of every path, computed in `workers` processes (all CPUs by default)"""
+    paths = list(paths)
+    if len(paths) <= 1 or workers == 1:
+        return [summarize_run(path, **kwargs) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(summarize_run, **kwargs), paths))
+
+
+# -- Decimation
+# Both functions return the (sorted) indices of the samples to keep, so that memory-mapped arrays
+# are only read where needed : `x[indices]`.
+
+def minmax_indices(y: np.ndarray, n_bins: int = MAX_PLOT_POINTS // 2):
+    """
+    Min/max decimation : splits y (T,) into `n_bins` bins and keeps the first, minimum, maximum and last
+    samples of each bin, so that peaks are never lost.
+    """
+    T = len(y)
+    if T <= 4 * n_bins:
+        return np.arange(T)
+    edges = np.linspace(0, T, n_bins + 1).astype(int)
+    argmin, argmax = np.empty(n_bins, dtype=int), np.empty(n_bins, dtype=int)
+    for b, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        values = np.asarray(y[lo:hi])
+        argmin[b] = lo + np.argmin(values)
+        argmax[b] = lo + np.argmax(values)
+    return np.unique(np.concatenate((edges[:-1], edges[1:] - 1, argmin, argmax)))
+
+
+def lttb_indices(points: np.ndarray, n_out: int = MAX_PLOT_POINTS):
+    """
+    Largest-Triangle-Three-Buckets decimation of a curve `points` (T, 2), e.g. (t, y) of a time series,
+    or (x, y) of a trajectory : in each bucket, keeps the point forming the largest triangle
+    with the point kept in the previous bucket and the average of the next bucket.
+    """
+    T = len(points)
+    if T <= n_out or n_out < 3:
+        return np.arange(T)
+    edges = np.linspace(1, T - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, T - 1
+    a = np.asarray(points[0], dtype=float)
+    for i in range(n_out - 2):
+        bucket = np.asarray(points[edges[i]:edges[i + 1]], dtype=float)
+        following = np.asarray(points[edges[i + 1]:edges[i + 2]] if i + 2 < len(edges) else points[-1:], dtype=float)
+        c = following.mean(axis=0)
+        area = np.abs((a[0] - c[0]) * (bucket[:, 1] - a[1]) - (a[0] - bucket[:, 0]) * (c[1] - a[1]))
+        best = int(np.argmax(area))
+        indices[i + 1] = edges[i] + best
+        a = bucket[best]
+    return indices
+
+
+def plot_run(path: str, max_points: int = MAX_PLOT_POINTS):
+    """Plots the achievement progress and the trajectories of a run, as the scripts of `src/data/`, decimated"""
+    import matplotlib.pyplot as plt
+
+    run = load_run(path)
+    source = _achievement_source(run)
+    fig, (ax_progress, ax_paths) = plt.subplots(1, 2, figsize=(13, 4))
+    if source is not None:
+        T = len(run.positions)
+        total = np.concatenate([source(start, np.asarray(run.positions[start:start + CHUNK_TICKS])).sum(axis=1)
+                                for start in range(0, T, CHUNK_TICKS)])
+        progress = 100. * (total.max() - total) / total.max()
+        keep = minmax_indices(progress, max_points // 2)
+        ax_progress.plot(keep, progress[keep])
+        ax_progress.set_title(f"Formation achievement progress | Maximum : {progress.max():.2f} %")
+        ax_progress.set_xlabel("Discrete time steps (k)")
+        ax_progress.set_ylabel("Progress (%)")
+    for i in range(run.positions.shape[1]):
+        trajectory = run.positions[:, i, :2]
+        keep = lttb_indices(trajectory, max_points)
+        points = np.asarray(trajectory[keep])
+        line, = ax_paths.plot(points[:, 0], points[:, 1])
+        ax_paths.scatter(*points[0], color=line.get_color())
+        ax_paths.scatter(*points[-1], marker='x', c='r', s=65)
+    ax_paths.set_title("Trajectories of the agents")
+    fig.suptitle(path)
+    fig.tight_layout()
+    plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m src.analysis', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', default=[os.path.join(os.path.dirname(__file__), 'data')],
+                        help="run directories, or directories to search for runs (default : src/data)")
+    parser.add_argument('--workers', type=int, help="number of processes (default : number of CPUs)")
+    parser.add_argument('--plot', action='store_true', help="plot every run, decimated")
+    args = parser.parse_args(argv)
+
+    paths = [run for path in args.paths for run in find_runs(path)]
+    print(f"{'run':>40} | {'ticks':>7} | {'final (%)':>9} | {'max (%)':>7} | {'converged':>9} | "
+          f"{'settling error':>14} | {'mean path':>9}")
+    for s in summarize_runs(paths, args.workers):
+        convergence = '-' if s.get('convergence_tick') is None else s['convergence_tick']
+        print(f"{os.path.relpath(s['path'])[-40:]:>40} | {s['ticks']:>7} | {s.get('final_achievement_pct', np.nan):>9.2f} | "
+              f"{s.get('max_achievement_pct', np.nan):>7.2f} | {convergence:>9} | "
+              f"{s.get('settling_error', np.nan):>14.4f} | {np.mean(s['path_length']):>9.3f}")
+    if args.plot:
+        for path in paths:
+            plot_run(path)
+
+
+if __name__ == '__main__':
+    main()
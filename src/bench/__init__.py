@@ -0,0 +1,47 @@
+import time
+
+
+def time_per_call(fn, repeat: int = 100, min_time: float = 0.05, warmup: bool = True):
+    """
+    Measures the average wall-clock time of `fn()` in seconds.
+    `fn` is called at least `repeat` times, and until at least `min_time` seconds have elapsed.
+    Unless `warmup` is False, `fn` is called once beforehand (caches, lazy imports).
+    """
+    if warmup:
+        fn()
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.
+    while calls < repeat or elapsed < min_time:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / calls
+
+
+def measure(fn, repeat: int = 20, min_time: float = 0.05, max_time: float = 2., warmup: bool = True):
+    """
+    Measures the wall-clock time of each call to `fn()`.
+    `fn` is called at least `repeat` times and until at least `min_time` seconds have elapsed,
+    but no more once `max_time` seconds have elapsed (at least one call is always measured).
+    Returns:
+        Dictionary with the number of calls, and the mean, median and minimum time per call in seconds
+    """
+    if warmup:
+        fn()
+    times = []
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+        if elapsed >= max_time or (len(times) >= repeat and elapsed >= min_time):
+            break
+    times.sort()
+    return {
+        'calls': len(times),
+        'mean_s': sum(times) / len(times),
+        'median_s': times[len(times) // 2],
+        'min_s': times[0],
+    }
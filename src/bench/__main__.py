@@ -0,0 +1,187 @@
+"""
+Benchmark suite of the consensus and CBF algorithms, with a machine-readable baseline.
+
+    python3 -m src.bench                    # runs the suite and compares it with baseline.json
+    python3 -m src.bench --save             # runs the suite and overwrites baseline.json
+    python3 -m src.bench --quick -k cbf     # smaller sizes, only the workloads containing "cbf"
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from functools import partial
+
+import networkx as nx
+import numpy as np
+import scipy
+
+from src.bench import measure
+from src.bench.cbf import random_obstacles, stub_teams_data
+from src.bench.closed_loop import circle_offsets
+from src.bench.consensus import ring_graph
+from src.cbf import zeroing_cbf
+from src.continuous import continuous_consensus
+from src.discrete import discrete_consensus_cfunc, discrete_consensus_sim_complete, discrete_consensus_step
+from src.formation import make_formation_orders
+from src.util import example_graph1
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+"""Default baseline file, committed with the repository"""
+
+SIZES = (3, 10, 100, 1000, 10000)
+QUICK_SIZES = (3, 10, 100)
+
+CONTINUOUS_MAX_SIZE = 1000
+"""Largest graph solved by the continuous_consensus workload (odeint is too slow beyond)"""
+
+SIM_STEPS = 100
+"""Number of steps of the discrete_consensus_sim_complete workload"""
+
+
+def random_graph(n: int, degree: float = 3., seed: int = 0):
+    """Directed Erdős-Rényi graph of n agents with the given mean out-degree, plus a ring so that it is connected"""
+    G = nx.fast_gnp_random_graph(n, min(1., degree / max(n - 1, 1)), seed=seed, directed=True)
+    G.add_edges_from(ring_graph(n).edges)
+    return G
+
+
+def grid_graph(n: int):
+    """Bidirectional 2D grid of about n agents"""
+    side = max(2, int(round(np.sqrt(n))))
+    G = nx.convert_node_labels_to_integers(nx.grid_2d_graph(side, side))
+    return G.to_directed()
+
+
+FAMILIES = {
+    'ring': ring_graph,
+    'example_graph1': lambda n: example_graph1(),
+    'random': random_graph,
+    'grid': grid_graph,
+}
+"""Graph families of the consensus workloads : function of the requested number of agents"""
+
+
+def _graphs(sizes):
+    """(family, graph) pairs of all families and sizes, without duplicates (example_graph1 has a fixed size)"""
+    seen = set()
+    for family, make in FAMILIES.items():
+        for n in sizes:
+            G = make(n)
+            if (family, G.number_of_nodes()) in seen:
+                continue
+            seen.add((family, G.number_of_nodes()))
+            yield family, G
+
+
+def consensus_workloads(sizes):
+    """Workloads of discrete.py and continuous.py : (name, family, n, function)"""
+    rng = np.random.default_rng(0)
+    for family, G in _graphs(sizes):
+        n = G.number_of_nodes()
+        X0 = rng.uniform(-5., 5., (n, 2))
+        offsets = rng.uniform(-1., 1., (n, 2))
+        epsilon = 0.9 / max(d for _, d in G.in_degree)
+        yield 'discrete_consensus_cfunc', family, n, partial(discrete_consensus_cfunc, G, epsilon, X0, offsets)
+        yield 'discrete_consensus_step', family, n, partial(discrete_consensus_step, G, epsilon, X0, offsets)
+        yield ('discrete_consensus_sim_complete', family, n,
+               partial(discrete_consensus_sim_complete, G, epsilon, X0, offsets, steps=SIM_STEPS))
+        if n <= CONTINUOUS_MAX_SIZE:
+            t = np.linspace(0., 5., 51)
+            yield 'continuous_consensus', family, n, partial(continuous_consensus, G, X0, t, offsets)
+
+
+def cbf_workloads(obstacle_counts=(1, 10, 50, 200)):
+    """Workloads of zeroing_cbf() with both methods : (name, family, n, function), n being the number of obstacles"""
+    rng = np.random.default_rng(0)
+    for m in obstacle_counts:
+        obstacles = random_obstacles(rng, m)
+        p, v_nom = np.array([-4., -2.5]), np.array([4., 2.5])
+        for method in ('cvxopt', 'exact'):
+            yield (f'zeroing_cbf[{method}]', 'random', m,
+                   partial(zeroing_cbf, p, v_nom, 0.3, obstacles, method=method))
+
+
+def tick_workloads(team_sizes=(4, 16, 64, 256)):
+    """Full formation_orders tick on a stubbed teams_data : (name, family, n, function), n being the team size"""
+    rng = np.random.default_rng(0)
+    for R in team_sizes:
+        teams_data = stub_teams_data(rng, R)
+        orders = make_formation_orders(ring_graph(R), circle_offsets(R, radius=0.2 * R))
+        yield 'formation_orders', 'ring', R, partial(orders, teams_data)
+
+
+def run_suite(quick: bool = False, keyword: str = None, max_time: float = 2.):
+    """Runs all workloads (containing `keyword` if given), yielding the result of each one"""
+    sizes = QUICK_SIZES if quick else SIZES
+    workloads = itertools.chain(consensus_workloads(sizes), cbf_workloads(),
+                                tick_workloads((4, 16) if quick else (4, 16, 64, 256)))
+    for name, family, n, fn in workloads:
+        if keyword is not None and keyword not in name:
+            continue
+        r = measure(fn, max_time=max_time)
+        r.update(workload=name, family=family, n=n, per_second=1. / r['median_s'])
+        yield r
+
+
+def environment():
+    """Versions and machine the suite was run with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'networkx': nx.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _key(r):
+    return r['workload'], r['family'], r['n']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python3 -m src.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help="only small graphs (N <= 100) and teams")
+    parser.add_argument('-k', dest='keyword', help="only run the workloads whose name contains this keyword")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file to compare with (or to save)")
+    parser.add_argument('--save', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--max-time', type=float, default=2., help="maximum time spent measuring each workload")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = {_key(r): r for r in json.load(f)['results']}
+
+    print(f"{'workload':>34} | {'family':>14} | {'N':>6} | {'median (ms)':>11} | {'per second':>10} | {'vs baseline':>11}")
+    results = []
+    for r in run_suite(args.quick, args.keyword, args.max_time):
+        results.append(r)
+        ref = baseline.get(_key(r))
+        ratio = f"{ref['median_s'] / r['median_s']:>10.2f}x" if ref else f"{'-':>11}"
+        print(f"{r['workload']:>34} | {r['family']:>14} | {r['n']:>6} | {1e3 * r['median_s']:>11.4f} | "
+              f"{r['per_second']:>10.1f} | {ratio}")
+        sys.stdout.flush()
+
+    data = {'environment': environment(), 'results': results}
+    for path in ([args.baseline] if args.save else []) + ([args.output] if args.output else []):
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+        print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import numpy as np
+from cvxopt import matrix, solvers
+
+from src.bench import time_per_call
+from src.cbf import Obstacle, ObstacleSet, ZeroingCBFSolver, grSim_obstacles_except, team_cbf, zeroing_cbf
+from src.hocbf import DoubleIntegratorCBFSolver, LimitedCBFSolver
+from src.parallel_cbf import CBFWorkerPool, PoolStats, pack_obstacles
+from src.spatial import ObstacleIndex, sensing_radius
+
+
+def reference_zeroing_cbf(p: np.ndarray, v_nom: np.ndarray, alpha: float, obstacles):
+    """Original implementation of zeroing_cbf(), kept for comparison"""
+    P = matrix(2 * np.identity(2))
+    q = matrix(-2 * v_nom)
+
+    def gen_obstacle(obs: Obstacle):
+        D = obs.r
+        return (alpha / 2.) * (np.linalg.norm(p - obs.xy) ** 2 - D ** 2)
+
+    s = np.array([obstacles[0].xy - p])
+    for i in range(1, len(obstacles)):
+        s = np.append(s, [obstacles[i].xy - p], axis=0)
+    G = matrix(s)
+    h = matrix([gen_obstacle(o) for o in obstacles])
+    return solvers.qp(P, q, G, h, options={'show_progress': False})
+
+
+def random_obstacles(rng: np.random.Generator, m: int, size: float = 4.5, r: float = 0.3):
+    """`m` obstacles of radius r, uniformly spread over a square field of half-width `size`"""
+    return [Obstacle(rng.uniform(-size, size, 2), r) for _ in range(m)]
+
+
+def moving_robot(frames: int = 200, dt: float = 1. / 60.):
+    """Positions and nominal velocities of a robot crossing the field towards (0, 0), one per frame"""
+    start = np.array([-4., -2.5])
+    positions = [start + k * dt * np.array([1., 0.6]) for k in range(frames)]
+    return [(p, -p) for p in positions]
+
+
+def bench_zeroing_cbf(obstacle_counts=(1, 4, 16, 64), alpha: float = 0.3):
+    """
+    Per-solve latency of the ZCBF-QP along a trajectory of consecutive frames.
+    Compares the original function, zeroing_cbf(), and a ZeroingCBFSolver kept across frames (warm-started).
+    """
+    rng = np.random.default_rng(0)
+    frames = moving_robot()
+    print(f"{'M':>4} | {'original (ms)':>13} | {'function (ms)':>13} | {'solver (ms)':>11} | {'iterations':>10}")
+    for m in obstacle_counts:
+        obstacles = random_obstacles(rng, m)
+        solver = ZeroingCBFSolver(alpha)
+
+        def run(solve):
+            return [solve(p, v, obstacles) for p, v in frames]
+
+        iterations = (np.mean([s['iterations'] for s in run(lambda p, v, o: zeroing_cbf(p, v, alpha, o))]),
+                      np.mean([s['iterations'] for s in run(solver.solve)]))
+        t_ref = time_per_call(lambda: run(lambda p, v, o: reference_zeroing_cbf(p, v, alpha, o)), repeat=3)
+        t_fun = time_per_call(lambda: run(lambda p, v, o: zeroing_cbf(p, v, alpha, o)), repeat=3)
+        t_solver = time_per_call(lambda: run(solver.solve), repeat=3)
+        print(f"{m:>4} | {1e3 * t_ref / len(frames):>13.4f} | {1e3 * t_fun / len(frames):>13.4f} | "
+              f"{1e3 * t_solver / len(frames):>11.4f} | {iterations[0]:>4.1f} -> {iterations[1]:>3.1f}")
+
+
+def bench_exact(obstacle_counts=(1, 5, 10, 25, 50, 100, 200), alpha: float = 0.3):
+    """
+    Per-solve latency of the cvxopt and exact methods of zeroing_cbf() along a trajectory,
+    and maximum difference between the safe velocities they return.
+    """
+    rng = np.random.default_rng(0)
+    frames = moving_robot()
+    print(f"{'M':>4} | {'cvxopt (ms)':>11} | {'exact (ms)':>10} | {'max diff':>8}")
+    for m in obstacle_counts:
+        # keep the trajectory away from the obstacles, so that all problems are feasible
+        obstacles = [o for o in random_obstacles(rng, 4 * m)
+                     if min(np.linalg.norm(o.xy - p) for p, _ in frames) > 2 * o.r][:m]
+
+        def run(method):
+            return [zeroing_cbf(p, v, alpha, obstacles, method=method) for p, v in frames]
+
+        diff = max(np.abs(np.array(s['x']) - e['x']).max() for s, e in zip(run('cvxopt'), run('exact')))
+        t_cvxopt = time_per_call(lambda: run('cvxopt'), repeat=3)
+        t_exact = time_per_call(lambda: run('exact'), repeat=3)
+        print(f"{len(obstacles):>4} | {1e3 * t_cvxopt / len(frames):>11.4f} | {1e3 * t_exact / len(frames):>10.4f} | "
+              f"{diff:>8.1e}")
+
+
+def bench_limits(obstacle_counts=(1, 5, 25, 100), alpha: float = 0.3, v_max: float = 1.5, a_max: float = 4.,
+                 dt: float = 1. / 60.):
+    """
+    Per-solve latency along a trajectory of the base ZCBF-QP (exact method), of the same QP with velocity
+    and acceleration limits (LimitedCBFSolver), and of the ECBF of a double-integrator robot
+    (DoubleIntegratorCBFSolver), with the exact and cvxopt methods.
+    """
+    rng = np.random.default_rng(0)
+    frames = moving_robot(dt=dt)
+    print(f"{'M':>4} | {'base (ms)':>9} | {'limited (ms)':>12} | {'limited cvxopt (ms)':>19} | {'ecbf (ms)':>9} | "
+          f"{'ecbf cvxopt (ms)':>16}")
+    for m in obstacle_counts:
+        obstacles = [o for o in random_obstacles(rng, 4 * m)
+                     if min(np.linalg.norm(o.xy - p) for p, _ in frames) > 2 * o.r][:m]
+
+        def base():
+            return [zeroing_cbf(p, v, alpha, obstacles, method='exact') for p, v in frames]
+
+        def limited(method):
+            solver = LimitedCBFSolver(alpha, v_max=v_max, a_max=a_max, dt=dt, method=method)
+            return [solver.solve(p, v, obstacles) for p, v in frames]
+
+        def ecbf(method):
+            solver = DoubleIntegratorCBFSolver(np.sqrt(alpha), a_max=a_max, v_max=v_max, dt=dt, method=method)
+            return [solver.solve(p, 0.5 * v, v, obstacles) for p, v in frames]
+
+        times = [time_per_call(fn, repeat=3) / len(frames) for fn in (
+            base, lambda: limited('exact'), lambda: limited('cvxopt'), lambda: ecbf('exact'), lambda: ecbf('cvxopt'))]
+        print(f"{len(obstacles):>4} | {1e3 * times[0]:>9.4f} | {1e3 * times[1]:>12.4f} | {1e3 * times[2]:>19.4f} | "
+              f"{1e3 * times[3]:>9.4f} | {1e3 * times[4]:>16.4f}")
+
+
+def bench_team(team_sizes=(4, 8, 16, 32, 64), alpha: float = 0.3, radius: float = 0.3):
+    """
+    Latency of one control tick of CBF for a whole team of R robots avoiding each other.
+    Compares one zeroing_cbf() call per robot (cvxopt and exact methods) with team_cbf().
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'R':>4} | {'cvxopt (ms)':>11} | {'exact (ms)':>10} | {'team (ms)':>9}")
+    for R in team_sizes:
+        # robots on a grid with some noise, heading to random targets
+        side = int(np.ceil(np.sqrt(R)))
+        positions = (np.argwhere(np.ones((side, side)))[:R] * 0.9 - side * 0.45
+                     + rng.uniform(-0.1, 0.1, (R, 2)))
+        v_nom = rng.uniform(-4.5, 4.5, (R, 2)) - positions
+        obstacles = [[Obstacle(positions[j], radius) for j in range(R) if j != i] for i in range(R)]
+
+        def serial(method):
+            return [zeroing_cbf(positions[i], v_nom[i], alpha, obstacles[i], method=method) for i in range(R)]
+
+        t_cvxopt = time_per_call(lambda: serial('cvxopt'), repeat=3)
+        t_exact = time_per_call(lambda: serial('exact'), repeat=3)
+        t_team = time_per_call(lambda: team_cbf(positions, v_nom, alpha, radius))
+        print(f"{R:>4} | {1e3 * t_cvxopt:>11.3f} | {1e3 * t_exact:>10.3f} | {1e3 * t_team:>9.3f}")
+
+
+class StubRobot:
+    """Robot of a stubbed `teams_data`, only holding its position"""
+
+    def __init__(self, pos: np.ndarray):
+        self.pos = pos
+
+
+def stub_teams_data(rng: np.random.Generator, per_team: int, size=(4.5, 3.)):
+    """`teams_data` of two teams of robots spread uniformly on the field"""
+    return {team: {i: StubRobot(rng.uniform(-np.array(size), np.array(size))) for i in range(per_team)}
+            for team in ("blue", "yellow")}
+
+
+def bench_culling(team_sizes=(4, 16, 64, 128), alpha: float = 3., v_max: float = 1.5, dt: float = 1. / 60.):
+    """
+    Latency of one control tick of the blue team, with and without culling the obstacles
+    that are outside of the sensing radius (see src.spatial).
+    Compares the per-robot exact solver on all obstacles and on the obstacles near each robot,
+    as well as team_cbf() with and without sensing radius.
+    """
+    rng = np.random.default_rng(0)
+    radius = sensing_radius(v_max, alpha, 0.3, dt)
+    print(f"Sensing radius : {radius:.3f}")
+    print(f"{'R':>4} | {'all (ms)':>8} | {'culled (ms)':>11} | {'team (ms)':>9} | {'team culled (ms)':>16}")
+    for R in team_sizes:
+        teams_data = stub_teams_data(rng, R)
+        positions = np.array([teams_data["blue"][i].pos for i in range(R)])
+        v_nom = rng.uniform(-1., 1., (R, 2))
+        others = np.array([teams_data["yellow"][i].pos for i in range(R)])
+
+        def all_obstacles():
+            return [zeroing_cbf(positions[i], v_nom[i], alpha, grSim_obstacles_except(teams_data, i, "blue"),
+                                method='exact') for i in range(R)]
+
+        def culled():
+            index = ObstacleIndex.from_teams_data(teams_data)
+            solutions = []
+            for i in range(R):
+                obstacles = index.obstacles_near(positions[i], radius, exclude=("blue", i))
+                solutions.append(zeroing_cbf(positions[i], v_nom[i], alpha, obstacles, method='exact')
+                                 if obstacles else {'x': v_nom[i].reshape(2, 1)})
+            return solutions
+
+        # culling does not change the solution of feasible problems
+        assert all(np.allclose(a['x'], c['x']) for a, c in zip(all_obstacles(), culled()) if a['status'] == 'optimal')
+        t_all = time_per_call(all_obstacles, repeat=3)
+        t_culled = time_per_call(culled, repeat=3)
+        t_team = time_per_call(lambda: team_cbf(positions, v_nom, alpha, obstacles=others), repeat=3)
+        t_team_culled = time_per_call(lambda: team_cbf(positions, v_nom, alpha, obstacles=others,
+                                                       sensing_radius=radius), repeat=3)
+        print(f"{R:>4} | {1e3 * t_all:>8.3f} | {1e3 * t_culled:>11.3f} | {1e3 * t_team:>9.3f} | "
+              f"{1e3 * t_team_culled:>16.3f}")
+
+
+def bench_obstacle_set(team_sizes=(4, 16, 64, 128), alpha: float = 0.3):
+    """
+    Latency of one control tick of the blue team with the exact solver, building the obstacles of each robot
+    as a list of `Obstacle` (grSim_obstacles_except()) or as one shared ObstacleSet masking out each robot.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'R':>4} | {'list (ms)':>9} | {'set (ms)':>8}")
+    for R in team_sizes:
+        teams_data = stub_teams_data(rng, R)
+        v_nom = rng.uniform(-1., 1., (R, 2))
+
+        def with_lists():
+            return [zeroing_cbf(teams_data["blue"][i].pos, v_nom[i], alpha,
+                                grSim_obstacles_except(teams_data, i, "blue"), method='exact') for i in range(R)]
+
+        def with_set():
+            obstacles = ObstacleSet.from_teams_data(teams_data)
+            return [zeroing_cbf(teams_data["blue"][i].pos, v_nom[i], alpha, obstacles.excluding(("blue", i)),
+                                method='exact') for i in range(R)]
+
+        t_list = time_per_call(with_lists, repeat=3)
+        t_set = time_per_call(with_set, repeat=3)
+        print(f"{R:>4} | {1e3 * t_list:>9.3f} | {1e3 * t_set:>8.3f}")
+
+
+def bench_pool(team_sizes=(8, 16, 32, 64), alpha: float = 0.3, radius: float = 0.3, workers: int = None,
+               deadline: float = 0.1):
+    """
+    Latency of one control tick of cvxopt CBF for a team of R robots, solved serially and by a CBFWorkerPool.
+    The pool only pays off with several CPU cores, its queue/solve times show where the time goes.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'R':>4} | {'serial (ms)':>11} | {'pool (ms)':>9} | {'queue p50 (ms)':>14} | {'solve p50 (ms)':>14} | misses")
+    with CBFWorkerPool(alpha, max_robots=max(team_sizes), max_obstacles=max(team_sizes), workers=workers) as pool:
+        for R in team_sizes:
+            positions = rng.uniform(-4.5, 4.5, (R, 2))
+            v_nom = rng.uniform(-1., 1., (R, 2))
+            obstacles = [[Obstacle(positions[j], radius) for j in range(R) if j != i] for i in range(R)]
+            packed = pack_obstacles(obstacles)
+
+            t_serial = time_per_call(
+                lambda: [zeroing_cbf(positions[i], v_nom[i], alpha, obstacles[i]) for i in range(R)], repeat=3)
+            pool.stats = PoolStats()
+            t_pool = time_per_call(lambda: pool.solve(positions, v_nom, *packed, deadline=deadline), repeat=10)
+            summary = pool.stats.summary()
+            print(f"{R:>4} | {1e3 * t_serial:>11.3f} | {1e3 * t_pool:>9.3f} | {summary['queue_ms']['p50']:>14.3f} | "
+                  f"{summary['solve_ms']['p50']:>14.3f} | {summary['misses']}")
+
+
+if __name__ == '__main__':
+    bench_zeroing_cbf()
+    bench_exact()
+    bench_limits()
+    bench_team()
+    bench_culling()
+    bench_obstacle_set()
+    bench_pool()
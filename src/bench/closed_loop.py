@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.bench.consensus import ring_graph
+from src.cbf import make_order_single
+from src.formation import make_formation_orders
+from src.headless import HeadlessController, default_teams
+
+
+def circle_offsets(n: int, radius: float = 1.):
+    """Offsets placing n agents of a ring graph on a circle (see discrete_consensus_cfunc())"""
+    angles = 2. * np.pi * np.arange(n) / n
+    points = radius * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    return np.roll(points, -1, axis=0) - points
+
+
+def bench_formation(team_sizes=(4, 8, 16, 32), ticks: int = 300):
+    """
+    Closed-loop latency of the formation_orders callback of formation.py in the headless simulator,
+    for a ring of R agents and R robots in the other team.
+    """
+    print(f"{'R':>4} | {'mean (ms)':>9} | {'p99 (ms)':>8} | {'max (ms)':>8} | {'speedup':>7}")
+    for R in team_sizes:
+        controller = HeadlessController(default_teams(R, spacing=0.7))
+        controller.run(-1, make_formation_orders(ring_graph(R), circle_offsets(R, radius=0.2 * R)), ticks=ticks)
+        s = controller.latency_summary()
+        print(f"{R:>4} | {s['mean_ms']:>9.3f} | {s['p99_ms']:>8.3f} | {s['max_ms']:>8.3f} | {s['speedup']:>7.1f}")
+
+
+def bench_single(ticks: int = 300):
+    """Closed-loop latency of the order_single callback of cbf.py in the headless simulator"""
+    controller = HeadlessController()
+    controller.run(-1, make_order_single(np.array([3., 0.]), verbose=False), ticks=ticks)
+    s = controller.latency_summary()
+    print(f"order_single | mean {s['mean_ms']:.3f} ms | p99 {s['p99_ms']:.3f} ms | speedup {s['speedup']:.1f}")
+
+
+if __name__ == '__main__':
+    bench_formation()
+    bench_single()
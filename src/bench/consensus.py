@@ -0,0 +1,240 @@
+import networkx as nx
+import numpy as np
+
+from src.bench import time_per_call
+from src.consensus_operator import ConsensusOperator
+from src.discrete import (discrete_consensus_cfunc, discrete_consensus_step, discrete_consensus_sim_complete,
+                          discrete_consensus_states_at)
+from src.distributed import Link, distributed_consensus
+from src.dynamic_topology import DynamicConsensusOperator, proximity_edges
+from src.monte_carlo import batch_consensus_sim
+
+
+def reference_cfunc(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None,
+                    common_drift: np.ndarray = np.array(0.)):
+    """Original pure-Python implementation of discrete_consensus_cfunc(), kept for comparison"""
+    u_k = np.zeros(X0.shape)
+    for node in G.nodes():
+        s = 0
+        for neighbour in G.neighbors(node):
+            s += X0[neighbour] - X0[node]
+            if offsets is not None:
+                s -= offsets[node]
+        u_k[node] = epsilon * (s + common_drift)
+    return u_k
+
+
+def reference_step(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None):
+    """Original dense implementation of discrete_consensus_step(), kept for comparison"""
+    L = nx.laplacian_matrix(G).toarray()
+    P = np.identity(L.shape[0]) - epsilon * L
+    return P @ X0 + (epsilon * offsets if offsets is not None else 0)
+
+
+def reference_sim(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None, steps: int = 10):
+    """Original implementation of discrete_consensus_sim_complete(), kept for comparison"""
+    x = [X0]
+    last = X0
+    for _ in range(steps):
+        ctrl = reference_cfunc(G, epsilon, last, offsets)
+        x.append(last + ctrl)
+        last = x[-1]
+    return np.array(x)
+
+
+def ring_graph(n: int):
+    """Directed cycle 0 -> 1 -> ... -> n-1 -> 0"""
+    return nx.cycle_graph(n, create_using=nx.DiGraph)
+
+
+def bench_cfunc(sizes=(4, 16, 100, 1000, 10000), epsilon: float = 0.4):
+    """
+    Per-tick latency of the consensus control function, on a ring graph of N agents in 2D.
+    Compares the original loop, discrete_consensus_cfunc() (cached operator, graph checked on each call)
+    and a ConsensusOperator built once.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'loop (ms)':>10} | {'cfunc (ms)':>10} | {'operator (ms)':>13}")
+    for n in sizes:
+        G = ring_graph(n)
+        X = rng.normal(size=(n, 2))
+        offsets = rng.normal(size=(n, 2))
+        drift = np.array([0.5, 0.])
+        op = ConsensusOperator(G)
+        assert np.allclose(op.control(X, epsilon, offsets, drift),
+                           reference_cfunc(G, epsilon, X, offsets, drift))
+
+        t_loop = time_per_call(lambda: reference_cfunc(G, epsilon, X, offsets, drift), repeat=5)
+        t_cfunc = time_per_call(lambda: discrete_consensus_cfunc(G, epsilon, X, offsets, drift), repeat=5)
+        t_op = time_per_call(lambda: op.control(X, epsilon, offsets, drift))
+        print(f"{n:>6} | {1e3 * t_loop:>10.4f} | {1e3 * t_cfunc:>10.4f} | {1e3 * t_op:>13.4f}")
+
+
+def bench_step(sizes=(4, 16, 100, 1000, 5000), epsilon: float = 0.4):
+    """
+    Per-step latency of the Perron matrix version, on a ring graph of N agents in 2D.
+    Compares the original dense rebuild with discrete_consensus_step() (cached sparse matrix).
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'dense (ms)':>10} | {'cached (ms)':>11}")
+    for n in sizes:
+        G = ring_graph(n)
+        X = rng.normal(size=(n, 2))
+        offsets = rng.normal(size=(n, 2))
+        assert np.allclose(discrete_consensus_step(G, epsilon, X, offsets),
+                           reference_step(G, epsilon, X, offsets))
+
+        t_dense = time_per_call(lambda: reference_step(G, epsilon, X, offsets), repeat=3)
+        t_cached = time_per_call(lambda: discrete_consensus_step(G, epsilon, X, offsets))
+        print(f"{n:>6} | {1e3 * t_dense:>10.4f} | {1e3 * t_cached:>11.4f}")
+
+
+def bench_sim(sizes=(6, 100, 500), steps: int = 10000, epsilon: float = 0.4):
+    """
+    Duration of a complete simulation of `steps` steps, on a ring graph of N agents in 2D.
+    Compares the original loop, discrete_consensus_sim_complete() (full trajectory and final state only),
+    and discrete_consensus_states_at() jumping directly to the last step.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'loop (s)':>9} | {'full (s)':>9} | {'final (s)':>9} | {'jump (s)':>9}")
+    for n in sizes:
+        G = ring_graph(n)
+        X = rng.normal(size=(n, 2))
+        offsets = rng.normal(size=(n, 2))
+        x = discrete_consensus_sim_complete(G, epsilon, X, offsets, steps=steps)
+        assert np.allclose(x[:50], reference_sim(G, epsilon, X, offsets, steps=49))
+        assert np.allclose(x[-1], discrete_consensus_states_at(G, epsilon, X, [steps], offsets)[0])
+
+        t_loop = time_per_call(lambda: reference_sim(G, epsilon, X, offsets, steps=steps),
+                               repeat=1, min_time=0., warmup=False)
+        t_full = time_per_call(lambda: discrete_consensus_sim_complete(G, epsilon, X, offsets, steps=steps),
+                               repeat=1, min_time=0.)
+        t_final = time_per_call(lambda: discrete_consensus_sim_complete(G, epsilon, X, offsets, steps=steps,
+                                                                        final_only=True), repeat=1, min_time=0.)
+        t_jump = time_per_call(lambda: discrete_consensus_states_at(G, epsilon, X, [steps], offsets),
+                               repeat=1, min_time=0.)
+        print(f"{n:>6} | {t_loop:>9.4f} | {t_full:>9.4f} | {t_final:>9.4f} | {t_jump:>9.4f}")
+
+
+def bench_batch(batch_sizes=(10, 100, 1000), n: int = 20, steps: int = 500):
+    """
+    Duration of a Monte-Carlo sweep over random initial states and epsilons, on a ring graph of N agents in 2D.
+    Compares one discrete_consensus_sim_complete() call per configuration with batch_consensus_sim().
+    """
+    rng = np.random.default_rng(0)
+    G = ring_graph(n)
+    print(f"{'B':>6} | {'separate (s)':>12} | {'batched (s)':>11}")
+    for b in batch_sizes:
+        X0s = rng.normal(size=(b, n, 2))
+        epsilons = rng.uniform(0.1, 0.9, size=b)
+
+        def separate():
+            return [discrete_consensus_sim_complete(G, epsilons[i], X0s[i], steps=steps, final_only=True)
+                    for i in range(b)]
+
+        t_separate = time_per_call(separate, repeat=1, min_time=0., warmup=False)
+        t_batched = time_per_call(lambda: batch_consensus_sim(G, X0s, epsilons, steps=steps, tol=0.),
+                                  repeat=1, min_time=0., warmup=False)
+        print(f"{b:>6} | {t_separate:>12.4f} | {t_batched:>11.4f}")
+
+
+def bench_churn(sizes=(100, 1000, 10000), churn_rates=(0.001, 0.01, 0.1), degree: int = 6, epsilon: float = 0.05):
+    """
+    Per-tick latency of one consensus control step on a graph losing and gaining a fraction `churn` of its arcs
+    at every tick (random graph of N agents with `degree` neighbours on average).
+    Compares editing a networkx graph and rebuilding its operator (discrete_consensus_cfunc()) with
+    the incremental updates of DynamicConsensusOperator.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'churn':>6} | {'rebuild (ms)':>12} | {'incremental (ms)':>16}")
+    for n in sizes:
+        G0 = nx.fast_gnp_random_graph(n, degree / n, seed=0, directed=True)
+        X = rng.normal(size=(n, 2))
+        for churn in churn_rates:
+            k = max(1, int(churn * G0.number_of_edges()))
+            G = G0.copy()
+            op = DynamicConsensusOperator.from_graph(G0)
+            edges0 = np.array(G0.edges)
+
+            def changes():
+                # removed arcs are drawn from the initial ones, arcs that are already gone are ignored
+                return rng.integers(0, n, (k, 2)), edges0[rng.choice(len(edges0), k, replace=False)]
+
+            def rebuild():
+                added, removed = changes()
+                G.remove_edges_from(map(tuple, removed))
+                G.add_edges_from(map(tuple, added))
+                return discrete_consensus_cfunc(G, epsilon, X)
+
+            def incremental():
+                added, removed = changes()
+                op.remove_edges(removed)
+                op.add_edges(added)
+                return op.control(X, epsilon)
+
+            t_rebuild = time_per_call(rebuild, repeat=5)
+            t_incremental = time_per_call(incremental, repeat=5)
+            print(f"{n:>6} | {churn:>6.3f} | {1e3 * t_rebuild:>12.3f} | {1e3 * t_incremental:>16.3f}")
+
+
+def bench_proximity(sizes=(100, 1000, 10000), radius: float = 1., speed: float = 0.05, epsilon: float = 0.01):
+    """
+    Per-tick latency of one consensus control step on the proximity graph of moving agents
+    (density of about 6 neighbours per agent). Compares building a networkx graph and its operator on every tick
+    with DynamicConsensusOperator.set_proximity().
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'arcs':>6} | {'rebuild (ms)':>12} | {'incremental (ms)':>16}")
+    for n in sizes:
+        side = np.sqrt(n * np.pi * radius ** 2 / 6.)
+        X = rng.uniform(0., side, (n, 2))
+        op = DynamicConsensusOperator(n)
+
+        def move():
+            X[:] += rng.normal(0., speed, X.shape)
+
+        def rebuild():
+            move()
+            G = nx.DiGraph()
+            G.add_nodes_from(range(n))
+            G.add_edges_from(map(tuple, proximity_edges(X, radius)))
+            return discrete_consensus_cfunc(G, epsilon, X)
+
+        def incremental():
+            move()
+            op.set_proximity(X, radius)
+            return op.control(X, epsilon)
+
+        t_rebuild = time_per_call(rebuild, repeat=5)
+        t_incremental = time_per_call(incremental, repeat=5)
+        print(f"{n:>6} | {op.n_edges:>6} | {1e3 * t_rebuild:>12.3f} | {1e3 * t_incremental:>16.3f}")
+
+
+def bench_distributed(sizes=(100, 1000, 10000), workers=(1, 2, 4), steps: int = 100, drop_rate: float = 0.1,
+                      epsilon: float = 0.4):
+    """
+    Throughput (agent updates per second) and final formation error of distributed_consensus() on a ring
+    of N agents, with `drop_rate` of the messages lost, for each number of worker processes.
+    """
+    from src.bench.closed_loop import circle_offsets  # closed_loop imports this module
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>6} | {'workers':>7} | {'updates/s':>10} | {'dropped':>8} | {'final error':>11}")
+    for n in sizes:
+        G = ring_graph(n)
+        X0 = rng.uniform(-5., 5., (n, 2))
+        offsets = circle_offsets(n, radius=5.)
+        for w in workers:
+            r = distributed_consensus(G, epsilon, X0, offsets, steps=steps, workers=w,
+                                      link=Link(drop_rate=drop_rate), seed=0, record_every=steps)
+            print(f"{n:>6} | {w:>7} | {r.updates_per_second:>10.0f} | {r.dropped:>8} | {r.residual[-1]:>11.3e}")
+
+
+if __name__ == '__main__':
+    bench_cfunc()
+    bench_step()
+    bench_sim()
+    bench_batch()
+    bench_churn()
+    bench_proximity()
+    bench_distributed()
@@ -1,11 +1,197 @@
+import copy
+
 import numpy as np
 from cvxopt import matrix, solvers
 from collections import namedtuple
 
+from src.profiling import PROFILER
+
 Obstacle = namedtuple('Obstacle', ['xy', 'r'])
 
+WARM_START_FLOOR = 1e-4
+"""Minimum value of the slack and dual variables used to warm-start the QP solver (must be strictly positive)"""
+
+
+def obstacle_arrays(obstacles):
+    """
+    Converts a list of `Obstacle` (or the active obstacles of an ObstacleSet) into an (M, 2) array of centers
+    and an (M,) array of radii
+    """
+    if isinstance(obstacles, ObstacleSet):
+        return obstacles.active()[:2]
+    centers = np.array([o.xy for o in obstacles], dtype=float).reshape(len(obstacles), 2)
+    radii = np.array([o.r for o in obstacles], dtype=float)
+    return centers, radii
+
+
+class ObstacleSet:
+    """
+    Obstacles stored as contiguous arrays : (M, 2) centers, (M,) radii and optionally (M,) alpha values,
+    to be used instead of a list of `Obstacle` by zeroing_cbf(), ZeroingCBFSolver and team_cbf().
+
+    Obstacles can be masked out (e.g. the robot itself) with excluding(), which shares the arrays
+    of the original set instead of rebuilding them.
+    """
+
+    def __init__(self, centers: np.ndarray, radii, alphas=None, keys: list = None):
+        """
+        Args:
+            centers: (M, 2) positions of the obstacles
+            radii: Radius of the obstacles, single value or (M,)
+            alphas: (Optional) ZCBF parameter of each obstacle, single value or (M,).
+                Overrides the `alpha` given to the solvers
+            keys: (Optional) Identifier of each obstacle, e.g. (team, robot_id), used by excluding()
+        """
+        self.centers = np.ascontiguousarray(centers, dtype=float).reshape(-1, 2)
+        M = len(self.centers)
+        self.radii = np.ascontiguousarray(np.broadcast_to(np.asarray(radii, dtype=float), (M,)))
+        self.alphas = None
+        if alphas is not None:
+            self.alphas = np.ascontiguousarray(np.broadcast_to(np.asarray(alphas, dtype=float), (M,)))
+            if np.any(self.alphas <= 0.):
+                raise ValueError("alpha must be > 0.")
+        self.keys = keys if keys is not None else list(range(M))
+        self._index = None
+        self.excluded = ()
+        """Sorted indices of the obstacles masked out"""
+
+    @classmethod
+    def from_obstacles(cls, obstacles, alphas=None):
+        """Set holding the obstacles of a list of `Obstacle`"""
+        return cls(*obstacle_arrays(obstacles), alphas)
+
+    @classmethod
+    def from_teams_data(cls, teams_data, r: float = 0.3, alphas=None):
+        """
+        Set of all robots of the field (as in grSim_obstacles_except()), each of radius r.
+        Obstacles are identified by (team, robot_id), so that a robot can be masked out with excluding().
+        """
+        with PROFILER.stage('obstacles'):
+            keys = [(team, i) for team, robots in teams_data.items() for i, robot in robots.items()
+                    if robot is not None]
+            centers = np.array([teams_data[team][i].pos for team, i in keys], dtype=float).reshape(len(keys), 2)
+            return cls(centers, r, alphas, keys)
+
+    @property
+    def capacity(self):
+        """Number of obstacles, including the masked ones"""
+        return len(self.radii)
+
+    def __len__(self):
+        return self.capacity - len(self.excluded)
+
+    def excluding(self, *keys):
+        """Same set with the obstacles identified by `keys` masked out. The arrays are not copied."""
+        if self._index is None:
+            self._index = {key: j for j, key in enumerate(self.keys)}
+        excluded = set(self.excluded)
+        excluded.update(self._index[key] for key in keys if key in self._index)
+        view = copy.copy(self)
+        view.excluded = tuple(sorted(excluded))
+        return view
+
+    def active(self):
+        """
+        Tuple (centers, radii, alphas) of the obstacles that are not masked out, alphas being None if not set.
+        These are views of the arrays of the set when no obstacle is masked out.
+        """
+        if not self.excluded:
+            return self.centers, self.radii, self.alphas
+        mask = np.ones(self.capacity, dtype=bool)
+        mask[list(self.excluded)] = False
+        return self.centers[mask], self.radii[mask], None if self.alphas is None else self.alphas[mask]
+
+    def constraints(self, p: np.ndarray, alpha: float, G_out: np.ndarray = None, h_out: np.ndarray = None):
+        """
+        Constraints `G v <= h` of the obstacles that are not masked out, see cbf_constraints().
+        The constraints of all obstacles are computed (into G_out of shape (capacity, 2) and h_out of shape
+        (capacity,) if provided), then the rows of the masked obstacles are swapped to the end and left out.
+        Args:
+            alpha: ZCBF parameter of the obstacles that do not have their own
+        """
+        G, h = cbf_constraints(p, self.centers, self.radii, alpha if self.alphas is None else self.alphas,
+                               G_out, h_out)
+        m = self.capacity
+        for j in reversed(self.excluded):
+            m -= 1
+            if j != m:
+                G[j], h[j] = G[m], h[m]
+        return G[:m], h[:m]
+
+
+def _as_obstacle_set(obstacles):
+    return obstacles if isinstance(obstacles, ObstacleSet) else ObstacleSet.from_obstacles(obstacles)
+
+
+def cbf_constraints(p: np.ndarray, centers: np.ndarray, radii: np.ndarray, alpha: float,
+                    G_out: np.ndarray = None, h_out: np.ndarray = None):
+    """
+    Computes the constraints `G v <= h` of the ZCBF-QP (see zeroing_cbf()) for all obstacles at once :
+        G[i] = o_i - p
+        h[i] = (alpha_i / 2) * (||p - o_i||² - r_i²)
+    `alpha` is either a single value or one value per obstacle (M,).
+    Results are written in G_out of shape (M, 2) and h_out of shape (M,) if provided.
+    """
+    G = np.subtract(centers, p, out=G_out)
+    h = np.einsum('ij,ij->i', G, G, out=h_out)
+    h -= radii ** 2
+    h *= alpha / 2.
+    return G, h
+
+
+def project_halfplanes(v_nom: np.ndarray, G: np.ndarray, h: np.ndarray, tol: float = 1e-9):
+    """
+    Exact solver of the 2-D QP of zeroing_cbf() : projects `v_nom` onto the intersection of the half-planes
+    `G[i] @ v <= h[i]`, i.e. minimizes ||v - v_nom||² subject to `G v <= h`.
+
+    Returns `v_nom` immediately if it satisfies all constraints. Otherwise constraints are added one by one
+    (incremental algorithm, as in Seidel's LP) : when the current solution violates the next constraint,
+    the new solution lies on the boundary line of that constraint, and is found by solving
+    a 1-D problem on this line against the previous constraints.
+    Returns:
+        Tuple (v, feasible). If the constraints cannot be satisfied, `feasible` is False
+        and `v` is the last solution computed.
+    """
+    v_nom = np.asarray(v_nom, dtype=float).ravel()
+    violation = G @ v_nom - h
+    if np.all(violation <= tol):
+        return v_nom, True
+
+    v = v_nom
+    i = int(np.argmax(violation > tol))
+    while True:
+        g = G[i]
+        g_sq = g @ g
+        if g_sq == 0.:
+            # degenerate constraint 0 <= h[i]
+            return v, False
+
+        # Line g @ v = h[i], parametrized by v0 + s * direction, v0 being the projection of v_nom on it
+        v0 = v_nom - ((g @ v_nom - h[i]) / g_sq) * g
+        direction = np.array([-g[1], g[0]])
+        a = G[:i] @ direction
+        b = h[:i] - G[:i] @ v0
+        parallel = np.abs(a) <= tol * np.sqrt(g_sq)
+        if np.any(b[parallel] < -tol):
+            return v, False
+        with np.errstate(divide='ignore'):
+            bounds = b / a
+        lo = np.max(bounds[~parallel & (a < 0)], initial=-np.inf)
+        hi = np.min(bounds[~parallel & (a > 0)], initial=np.inf)
+        if lo > hi + tol:
+            return v, False
+        v = v0 + np.clip(0., lo, hi) * direction
+
+        # next constraint violated by the new solution
+        violation = G[i + 1:] @ v - h[i + 1:]
+        violated = violation > tol
+        if not np.any(violated):
+            return v, True
+        i += 1 + int(np.argmax(violated))
+
+
 def zeroing_cbf(p: np.ndarray, v_nom: np.ndarray, alpha: float,
-                obstacles):
+                obstacles, method: str = 'cvxopt'):
     """
     Zeroing CBF for robot at position `p` and with velocity `v_nom` originally applied.
 
@@ -15,31 +201,251 @@ def zeroing_cbf(p: np.ndarray, v_nom: np.ndarray, alpha: float,
     so the constraints `h'(x) + αh(x)` had to be adapted into a generic form equation
     (see https://cvxopt.org/userguide/coneprog.html#quadratic-programming)
 
-    All obstacles will have the same `alpha` parameter applied.
+    `obstacles` is either a list of `Obstacle` or an ObstacleSet.
+    All obstacles will have the same `alpha` parameter applied, unless they are given in an ObstacleSet
+    with its own alpha values.
+    To solve the QP of the same robot on every frame, prefer ZeroingCBFSolver.
+
+    Two methods are available :
+        - 'cvxopt': generic interior-point QP solver of cvxopt, returns the solution dictionary of cvxopt
+        - 'exact': dedicated 2-D solver (see project_halfplanes()), which does not use cvxopt.
+          Returns a dictionary with keys 'x' (safe velocity, as a (2, 1) array like cvxopt)
+          and 'status' ('optimal' or 'infeasible')
     """
     if alpha <= 0.:
         raise ValueError("alpha must be > 0.")
 
+    if method not in ('cvxopt', 'exact'):
+        raise ValueError(f"Unknown method '{method}', expected 'cvxopt' or 'exact'")
+
+    with PROFILER.stage('qp_build'):
+        ## Constraints
+        G, h = _as_obstacle_set(obstacles).constraints(p, alpha)
+        if method == 'cvxopt':
+            ## Objective function
+            P = matrix(2 * np.identity(2))
+            q = matrix(-2 * v_nom)
+            G, h = matrix(G), matrix(h)
+
+    if method == 'exact':
+        return _exact_solution(v_nom, G, h)
+
     # CBF solve
-    ## Objective function
-    P = matrix(2 * np.identity(2))
-    q = matrix(-2 * v_nom)
+    return _cvxopt_solution(P, q, G, h)
+
 
-    ## Constraints
-    def gen_obstacle(obs: Obstacle):
-        """Create an obstacle using the h(x) function explained above"""
-        D = obs.r
-        return (alpha / 2.) * (np.linalg.norm(p - obs.xy) ** 2 - D ** 2)
+def _exact_solution(v_nom: np.ndarray, G: np.ndarray, h: np.ndarray):
+    """Solves the QP with project_halfplanes(), and formats the result like the solution of cvxopt"""
+    with PROFILER.stage('qp_solve'):
+        v, feasible = project_halfplanes(v_nom, G, h)
+    return {'x': v.reshape(2, 1), 'status': 'optimal' if feasible else 'infeasible'}
 
-    s = np.array([obstacles[0].xy - p])
-    for i in range(1, len(obstacles)):
-        s = np.append(s, [obstacles[i].xy - p], axis=0)
-    G = matrix(s)
-    h = matrix([
-        gen_obstacle(o) for o in obstacles
-    ])
 
-    return solvers.qp(P, q, G, h, options={'show_progress': False})
+def _cvxopt_solution(P: matrix, q: matrix, G: matrix, h: matrix, initvals: dict = None):
+    """Solves the QP with cvxopt, recording the solve time and the number of iterations"""
+    with PROFILER.stage('qp_solve'):
+        sol = solvers.qp(P, q, G, h, initvals=initvals, options={'show_progress': False})
+    PROFILER.count('qp_iterations', sol['iterations'])
+    return sol
+
+
+class ZeroingCBFSolver:
+    """
+    Reusable solver of the ZCBF-QP of zeroing_cbf(), meant to be kept for one robot across frames.
+
+    Compared to calling zeroing_cbf() on every frame, it :
+        - Reuses the constant Hessian of the objective function
+        - Builds the constraints in preallocated buffers, grown only when more obstacles appear
+        - Warm-starts the solver from the solution of the previous frame,
+          when the number of obstacles has not changed
+    """
+
+    def __init__(self, alpha: float, capacity: int = 16, method: str = 'cvxopt'):
+        """
+        Args:
+            alpha: ZCBF parameter applied to all obstacles
+            capacity: Initial number of obstacles the constraint buffers can hold
+            method: 'cvxopt' or 'exact', see zeroing_cbf()
+        """
+        if alpha <= 0.:
+            raise ValueError("alpha must be > 0.")
+        if method not in ('cvxopt', 'exact'):
+            raise ValueError(f"Unknown method '{method}', expected 'cvxopt' or 'exact'")
+        self.alpha = alpha
+        self.method = method
+        self._P = matrix(2 * np.identity(2))
+        self._G = np.empty((capacity, 2))
+        self._h = np.empty(capacity)
+        self._last = None
+
+    def reset(self):
+        """Forgets the previous solution, so that the next solve starts cold"""
+        self._last = None
+
+    def _warm_start(self, m: int):
+        last = self._last
+        if last is None or last['status'] != 'optimal' or last['z'].size[0] != m:
+            return None
+        return {
+            'x': last['x'],
+            's': matrix(np.maximum(np.array(last['s']), WARM_START_FLOOR)),
+            'z': matrix(np.maximum(np.array(last['z']), WARM_START_FLOOR)),
+        }
+
+    def solve(self, p: np.ndarray, v_nom: np.ndarray, obstacles):
+        """
+        Same as zeroing_cbf(p, v_nom, alpha, obstacles, method).
+        Returns:
+            Solution dictionary, the safe velocity being `sol['x']`
+        """
+        with PROFILER.stage('qp_build'):
+            obstacles = _as_obstacle_set(obstacles)
+            capacity = obstacles.capacity
+            if capacity > len(self._h):
+                self._G = np.empty((2 * capacity, 2))
+                self._h = np.empty(2 * capacity)
+            G, h = obstacles.constraints(p, self.alpha, self._G[:capacity], self._h[:capacity])
+            m = len(h)
+            if self.method != 'exact':
+                q = matrix(-2. * np.asarray(v_nom, dtype=float))
+                G, h = matrix(G), matrix(h)
+                initvals = self._warm_start(m)
+        if self.method == 'exact':
+            return _exact_solution(v_nom, G, h)
+
+        self._last = _cvxopt_solution(self._P, q, G, h, initvals)
+        return self._last
+
+
+def team_cbf(positions: np.ndarray, v_nom: np.ndarray, alpha: float, radius: float = 0.3,
+             obstacles: np.ndarray = None, obstacle_radii=None, sensing_radius: float = None, tol: float = 1e-9,
+             return_infeasible: bool = False):
+    """
+    Solves the ZCBF-QP of zeroing_cbf() for a whole team of R robots at once.
+    Each robot avoids all other robots of the team (with radius `radius`), and the additional `obstacles`.
+
+    The constraints of all robots are computed together with NumPy broadcasting, and the QPs are solved
+    in a batched way :
+        1. Robots whose nominal velocity satisfies all of their constraints keep it
+        2. The other robots are solved with the incremental algorithm of project_halfplanes(),
+           vectorized over the robots
+    Parameters:
+        - positions: (R, 2) positions of the robots
+        - v_nom: (R, 2) nominal velocities of the robots
+        - alpha: ZCBF parameter applied to all obstacles
+        - radius: Distance to respect between two robots of the team
+        - (Optional) obstacles: (K, 2) positions of other obstacles (e.g. robots of the other team),
+          or an ObstacleSet, whose radii and alpha values are then used
+        - (Optional) obstacle_radii: Radius of the other obstacles, single value or (K,). Defaults to `radius`
+        - (Optional) sensing_radius: Obstacles further than this distance from a robot are ignored
+          (see src.spatial.sensing_radius()), so that each robot only solves against its close neighbours
+        - return_infeasible: Whether the indices of the robots whose QP is infeasible are also returned
+    Returns:
+        (R, 2) safe velocities. Robots whose QP is infeasible (e.g. already closer than `radius` to obstacles
+        on both sides) get a zero velocity, as with CBFWorkerPool(fallback='zero').
+        With `return_infeasible`, tuple (safe velocities, indices of the infeasible robots)
+    """
+    if alpha <= 0.:
+        raise ValueError("alpha must be > 0.")
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    v_nom = np.asarray(v_nom, dtype=float).reshape(-1, 2)
+    with PROFILER.stage('qp_build'):
+        G, h = _team_constraints(positions, alpha, radius, obstacles, obstacle_radii, sensing_radius)
+
+    with PROFILER.stage('qp_solve'):
+        # 1. Nominal velocities
+        v_safe = v_nom.copy()
+        violation = np.einsum('rmk,rk->rm', G, v_nom) - h
+        todo = np.flatnonzero(np.any(violation > tol, axis=1))
+        infeasible = np.empty(0, dtype=int)
+        if len(todo) > 0:
+            # 2. Incremental projection, for all remaining robots at once
+            v_safe[todo], feasible = _project_halfplanes_batch(v_nom[todo], G[todo], h[todo], tol)
+            # the last solution computed for an infeasible QP may violate the constraints, stop these robots
+            infeasible = todo[~feasible]
+            v_safe[infeasible] = 0.
+    PROFILER.count('qp_infeasible', len(infeasible))
+    return (v_safe, infeasible) if return_infeasible else v_safe
+
+
+def _team_constraints(positions: np.ndarray, alpha: float, radius: float, obstacles, obstacle_radii,
+                      sensing_radius: float):
+    """Constraints G of shape (R, M, 2) and h of shape (R, M) of all robots of team_cbf()"""
+    R = len(positions)
+
+    # Constraints of robot i : G[i, j] @ v <= h[i, j], with obstacles j = all robots, then other obstacles
+    centers = positions
+    radii = np.full(R, radius)
+    if obstacles is not None and len(obstacles) > 0:
+        obstacle_alphas = None
+        if isinstance(obstacles, ObstacleSet):
+            obstacles, obstacle_radii, obstacle_alphas = obstacles.active()
+        obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        centers = np.vstack((positions, obstacles))
+        radii = np.concatenate((radii, np.broadcast_to(radius if obstacle_radii is None else obstacle_radii,
+                                                       (len(obstacles),))))
+        if obstacle_alphas is not None:
+            alpha = np.concatenate((np.full(R, alpha), obstacle_alphas))
+    G = centers[np.newaxis, :, :] - positions[:, np.newaxis, :]  # (R, M, 2)
+    dist_sq = np.einsum('rmk,rmk->rm', G, G)
+    h = (alpha / 2.) * (dist_sq - radii ** 2)  # (R, M)
+    # a robot is not an obstacle to itself : 0 @ v <= inf
+    self_index = np.arange(R)
+    G[self_index, self_index] = 0.
+    h[self_index, self_index] = np.inf
+
+    if sensing_radius is not None:
+        # Only keep the k closest constraints of each robot, k being the largest number of obstacles
+        # within the sensing radius of a robot. Farther obstacles are disabled.
+        inactive = dist_sq > sensing_radius ** 2
+        inactive[self_index, self_index] = True
+        G[inactive] = 0.
+        h[inactive] = np.inf
+        k = max(1, int(np.max(np.sum(~inactive, axis=1))))
+        order = np.argsort(inactive, axis=1, kind='stable')[:, :k]
+        G = np.take_along_axis(G, order[:, :, np.newaxis], axis=1)
+        h = np.take_along_axis(h, order, axis=1)
+
+    return G, h
+
+
+def _project_halfplanes_batch(v_nom: np.ndarray, G: np.ndarray, h: np.ndarray, tol: float = 1e-9):
+    """
+    Batched version of project_halfplanes() for r problems with M constraints each :
+    v_nom of shape (r, 2), G of shape (r, M, 2) and h of shape (r, M).
+    Constraints are added one by one for all problems at once, and only the problems whose current
+    solution violates the new constraint are updated.
+    Returns:
+        Tuple (v of shape (r, 2), feasible of shape (r,))
+    """
+    r, M = h.shape
+    v = v_nom.copy()
+    feasible = np.ones(r, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(M):
+            g = G[:, i]
+            update = np.flatnonzero(feasible & (np.einsum('rk,rk->r', g, v) - h[:, i] > tol))
+            if len(update) == 0:
+                continue
+            g = g[update]
+            g_sq = np.einsum('rk,rk->r', g, g)
+            vn = v_nom[update]
+
+            # Line g @ v = h[i] of each problem, parametrized by v0 + s * direction
+            v0 = vn - ((np.einsum('rk,rk->r', g, vn) - h[update, i]) / g_sq)[:, np.newaxis] * g
+            direction = np.stack((-g[:, 1], g[:, 0]), axis=1)
+            a = np.einsum('rmk,rk->rm', G[update, :i], direction)
+            b = h[update, :i] - np.einsum('rmk,rk->rm', G[update, :i], v0)
+            parallel = np.abs(a) <= tol * np.sqrt(g_sq)[:, np.newaxis]
+            bounds = b / a
+            lo = np.max(np.where(~parallel & (a < 0), bounds, -np.inf), axis=1, initial=-np.inf)
+            hi = np.min(np.where(~parallel & (a > 0), bounds, np.inf), axis=1, initial=np.inf)
+            infeasible = (g_sq == 0.) | np.any(parallel & (b < -tol), axis=1) | (lo > hi + tol)
+
+            ok = ~infeasible
+            v[update[ok]] = v0[ok] + np.clip(0., lo[ok], hi[ok])[:, np.newaxis] * direction[ok]
+            feasible[update[infeasible]] = False
+    return v, feasible
 
 
 def grSim_obstacles_except(teams_data, robot_id: int, robot_team: str):
@@ -49,11 +455,45 @@ def grSim_obstacles_except(teams_data, robot_id: int, robot_team: str):
     """
     # nifty hack
     # iterate over all robot positions, except robot blue 0
-    return [Obstacle(teams_data[team][i].pos, r=0.3)
-           for team in teams_data.keys()  # foreach team
-           for i in teams_data[team]  # for each robot id
-           if i != robot_id or team != robot_team  # but not robot blue 0
-           and teams_data[team][i] is not None]
+    with PROFILER.stage('obstacles'):
+        return [Obstacle(teams_data[team][i].pos, r=0.3)
+               for team in teams_data.keys()  # foreach team
+               for i in teams_data[team]  # for each robot id
+               if (i != robot_id or team != robot_team)  # but not robot blue 0
+               and teams_data[team][i] is not None]
+
+def grSim_positions_except(teams_data, robot_ids, robot_team: str):
+    """
+    Positions of all robots on the field, except robots `robot_ids` of `robot_team`, as a (K, 2) array.
+    Used as obstacles of team_cbf().
+    """
+    with PROFILER.stage('obstacles'):
+        positions = [robot.pos
+                     for team, robots in teams_data.items()
+                     for i, robot in robots.items()
+                     if robot is not None and (team != robot_team or i not in robot_ids)]
+        return np.array(positions, dtype=float).reshape(len(positions), 2)
+
+def make_order_single(target: np.ndarray, robot_id: int = 0, robot_team: str = "blue", alpha: float = 9,
+                      verbose: bool = True):
+    """
+    Creates the `velocity_orders` callback moving robot `robot_id` of `robot_team` to `target`
+    while avoiding all other robots with CBF, to be given to `Controller.run()` (or HeadlessController.run()).
+    """
+    target = np.asarray(target)
+
+    def order_single(teams_data):
+        with PROFILER.stage('tick'):
+            obs = ObstacleSet.from_teams_data(teams_data).excluding((robot_team, robot_id))
+            robot_pos = teams_data[robot_team][robot_id].pos
+            cmd = target - robot_pos
+            sol = zeroing_cbf(robot_pos, cmd, alpha=alpha, obstacles=obs)
+        if verbose:
+            print(f"Offset : {np.linalg.norm(sol['x'] - matrix(cmd)) ** 2}")
+        return {robot_team: {robot_id: sol["x"]}}
+
+    return order_single
+
 
 if __name__ == '__main__':
     """
@@ -71,14 +511,7 @@ if __name__ == '__main__':
     #     Obstacle(xy=np.array([[0., 0.]]), r=0.1),
     #     Obstacle(xy=np.array([[0., 1.]]), r=0.1)
     # ]
-    def order_single(teams_data):
-        obs = grSim_obstacles_except(teams_data, 0, robot_team="blue")
-        blue0 = teams_data["blue"][0]
-        blue0_pos = blue0.pos
-        cmd = target - blue0_pos
-        sol = zeroing_cbf(blue0_pos, cmd, alpha=9, obstacles=obs)
-        print(f"Offset : {np.linalg.norm(sol['x'] - matrix(cmd)) ** 2}")
-        return {"blue": {0: sol["x"]}}
+    order_single = make_order_single(target)
 
     grSimController.run(
         duration=-1,
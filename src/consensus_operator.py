@@ -0,0 +1,139 @@
+import weakref
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+PERRON_CACHE_SIZE = 16
+"""Maximum number of Perron matrices (one per epsilon) kept by an operator"""
+
+
+class ConsensusOperator:
+    """
+    Sparse, precompiled form of the consensus dynamics of a graph G.
+
+    The graph is converted once into a CSR adjacency matrix `A` (A[i, j] = weight of the arc i -> j,
+    i.e. j is a neighbour of i) and an out-degree vector `D`, so that the control function
+    of discrete_consensus_cfunc() is obtained with a single sparse mat-vec :
+
+        u_k = epsilon * (A @ x_k - D * x_k - D * offsets + common_drift)
+
+    Pre-requisites:
+        Nodes of G should be labelled 0 to N-1, as for the state vector X0
+        used in src.discrete (the value of node i is X0[i]).
+        Edge weights are read from the `weight` attribute (1 if missing) as in nx.laplacian_matrix(),
+        or ignored with weight=None (every arc counts as 1), as in discrete_consensus_cfunc().
+    """
+
+    def __init__(self, G: nx.DiGraph, weight: str = 'weight'):
+        """
+        Args:
+            G: Graph of the agents
+            weight: Edge attribute holding the weights of the arcs, None to ignore weights
+        """
+        self._init_from_adjacency(nx.to_scipy_sparse_array(G, nodelist=range(G.number_of_nodes()), weight=weight,
+                                                           dtype=float, format='csr'))
+
+    def _init_from_adjacency(self, adjacency):
+        self.adjacency = sp.csr_array(adjacency, dtype=float)
+        """CSR adjacency matrix of the graph (row i holds the neighbours of node i)"""
+        self.n = self.adjacency.shape[0]
+        self.out_degree = np.asarray(self.adjacency.sum(axis=1)).ravel()
+        """Weighted number of neighbours of each node (diagonal of the Laplacian)"""
+        # number of arcs, regardless of their weights, as src.util.max_in_degree()
+        self.max_in_degree = int(np.bincount(self.adjacency.indices, minlength=self.n).max()) if self.n > 0 else 0
+        self._perron = {}  # dict[float, sp.csr_array]
+
+    @classmethod
+    def from_adjacency(cls, adjacency):
+        """Operator of the graph of a sparse adjacency matrix (A[i, j] = weight of the arc i -> j), without networkx"""
+        op = cls.__new__(cls)
+        op._init_from_adjacency(adjacency)
+        return op
+
+    def _column(self, X: np.ndarray):
+        """Out-degree vector shaped to broadcast over a state array of shape (N,) or (N, d)"""
+        return self.out_degree if X.ndim == 1 else self.out_degree[:, np.newaxis]
+
+    def laplacian_dot(self, X: np.ndarray):
+        """Computes L @ X with L = D - A, the (out-degree) Laplacian of the graph"""
+        return self._column(X) * X - self.adjacency @ X
+
+    def control(self, X: np.ndarray, epsilon: float, offsets: np.ndarray = None,
+                common_drift: np.ndarray = np.array(0.)):
+        """
+        Vectorized equivalent of discrete_consensus_cfunc().
+        Args:
+            X: Current state of the agents, of shape (N,) or (N, d)
+            epsilon: Step size
+            offsets: (Optional) Relative offsets to apply between the agents, same shape as X
+            common_drift: Used to move all agents in a certain direction
+        Returns:
+            Control function `u` of shape X to apply to all agents.
+        """
+        s = -self.laplacian_dot(X)
+        if offsets is not None:
+            s -= self._column(X) * offsets
+        return epsilon * (s + common_drift)
+
+    def perron(self, epsilon: float):
+        """
+        Sparse Perron matrix P = I - epsilon * L of the graph.
+        Matrices are cached per epsilon value, so repeated calls are free.
+        """
+        P = self._perron.get(epsilon)
+        if P is None:
+            if len(self._perron) >= PERRON_CACHE_SIZE:
+                self._perron.clear()
+            L = sp.diags_array(self.out_degree) - self.adjacency
+            P = sp.csr_array(sp.eye_array(self.n) - epsilon * L)
+            self._perron[epsilon] = P
+        return P
+
+    def step(self, X: np.ndarray, epsilon: float, offsets: np.ndarray = None):
+        """
+        Sparse equivalent of discrete_consensus_step(), using the cached Perron matrix.
+        Raises:
+            ValueError if epsilon * delta >= 1, where delta is the maximum in-degree of the graph
+        """
+        if not epsilon * self.max_in_degree < 1:
+            raise ValueError("epsilon * delta value superior to 1, change epsilon")
+        x_next = self.perron(epsilon) @ X
+        if offsets is not None:
+            x_next = x_next + epsilon * offsets
+        return x_next
+
+
+def graph_signature(G: nx.DiGraph, weight: str = 'weight'):
+    """
+    Structure of G (its nodes and edges, in insertion order, with their `weight` unless it is None),
+    which changes whenever a node or an edge is added or removed, including edits that keep the number of edges
+    (e.g. rewiring an edge), or when a weight changes.
+    Computing and comparing it costs O(N + E) : in a control loop, keep a reference to the ConsensusOperator instead.
+    """
+    return tuple(G.nodes), tuple(G.edges) if weight is None else tuple(G.edges(data=weight, default=1))
+
+
+_operators = weakref.WeakKeyDictionary()
+"""Cache of operators : dict[nx.DiGraph, dict[weight, tuple[signature, ConsensusOperator]]]"""
+
+
+def get_operator(G: nx.DiGraph, weight: str = 'weight'):
+    """
+    Returns the ConsensusOperator of graph G (see ConsensusOperator() for `weight`), building it only
+    if G has never been seen before, or if its nodes or edges have changed since the operator was built
+    (see graph_signature()).
+    Cached Perron matrices are dropped along with the outdated operator.
+    """
+    signature = graph_signature(G, weight)
+    cached = _operators.setdefault(G, {})
+    if weight in cached and cached[weight][0] == signature:
+        return cached[weight][1]
+    op = ConsensusOperator(G, weight)
+    cached[weight] = (signature, op)
+    return op
+
+
+def invalidate(G: nx.DiGraph):
+    """Drops the cached operators of graph G (e.g. after editing the graph)"""
+    _operators.pop(G, None)
@@ -1,55 +1,142 @@
 import networkx as nx
 import numpy as np
 import matplotlib.pyplot as plt
+import scipy.sparse as sp
 from scipy.integrate import odeint
+from scipy.linalg import expm
+from scipy.sparse.linalg import expm_multiply
 
+from src.consensus_operator import ConsensusOperator, get_operator
+from src.convergence import Convergence
 from src.util import example_graph1, three_agents
 
-def continuous_consensus(G: nx.DiGraph, X0: np.ndarray, t: np.ndarray, offsets: np.ndarray = None):
+DENSE_EXPM_MAX_SIZE = 2000
+"""Maximum number of agents for which the exact solver computes a dense propagator matrix"""
+
+
+CONVERGENCE_CHECK_INTERVAL = 1000
+"""Number of time steps solved between two convergence checks"""
+
+
+def continuous_consensus(G: nx.DiGraph, X0: np.ndarray, t: np.ndarray, offsets: np.ndarray = None,
+                         method: str = 'odeint', convergence: Convergence = None):
     """
     Wrapper to use the consensus solver for a start vector X0 of any NxN dimension
+    Solves the linear system dx/dt = -L x - offsets, for all dimensions of the state at once.
     Parameters:
         - G: networkx DiGraph describing the N agents
-        - X0: initial values vector
+        - X0: initial values vector, of shape (N,) or (N, d)
         - t: Sequence of time steps to solve at
         - (optional) offsets: Array of N offsets between agents
+        - method: Solver to use
+            - 'odeint': general ODE integrator on the flattened (N * d) state, using the sparse Laplacian
+            - 'expm': exact solution x(t) = exp(-L t) x(0) (+ offsets term), computed with the matrix exponential.
+              Fastest for small teams on uniform time grids such as `np.arange(0, 8, 0.0001)`
+        - (optional) convergence: Stops solving as soon as the agents have converged
+          (see src.convergence.Convergence). Its statistics are updated with the index reached in `t`.
+          Convergence is checked every CONVERGENCE_CHECK_INTERVAL time steps.
+    Returns:
+        Array of shape [Time, NumAgents] if X0 is 1D, [Time, NumAgents, xi] otherwise.
+        If solving stopped early at t[k], only the states up to t[k] are returned.
     """
 
     if offsets is not None:
         assert offsets.shape == X0.shape, "Offsets must have same shape as start vector"
 
-    def consensus_solver(init_vec: np.ndarray, t: np.ndarray):
-        """
-        Solves the consensus problem for the given initial 1D vector,
-        at time steps t
-        :param init_vec: 1xN vector of initial values
-        :param t: time steps to solve for
-        """
-
-        L = nx.laplacian_matrix(G).toarray()
+    op = get_operator(G)
+    t = np.asarray(t, dtype=float)
+    # required shape : [Time, NumAgents, xi]
+    n = X0.shape[0]
+    d = 1 if X0.ndim == 1 else X0.shape[1]
+    init = np.reshape(X0, (n, d)).astype(float)
+    offs = np.zeros((n, d)) if offsets is None else np.reshape(offsets, (n, d))
+
+    if method == 'odeint':
+        def solve(x0: np.ndarray, t: np.ndarray):
+            def model(x, _):
+                return -(op.laplacian_dot(x.reshape(n, d)) + offs).ravel()
+
+            # odeint output is (T, N * d), reshaped without copy
+            return odeint(model, x0.ravel(), t).reshape(len(t), n, d)
+    elif method == 'expm':
+        def solve(x0: np.ndarray, t: np.ndarray):
+            return _expm_solve(op, x0, t, offs)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'odeint' or 'expm'")
 
-        def model(x, t):
-            if offsets is None:
-                return np.dot(-L, x)
-            else:
-                return np.dot(-L, x) - offsets
+    if convergence is None:
+        sol = solve(init, t)
+    else:
+        sol = _solve_until_converged(op, solve, init, t, offs, convergence)
+    return sol.reshape((len(sol),) + X0.shape)
 
-        return np.array(odeint(model, init_vec, t))
 
+def _solve_until_converged(op: ConsensusOperator, solve, init: np.ndarray, t: np.ndarray, offsets: np.ndarray,
+                           convergence: Convergence):
+    """
+    Solves the time grid t by chunks of CONVERGENCE_CHECK_INTERVAL steps, using `solve(x0, t_chunk)`,
+    until the last state of a chunk satisfies the convergence criterion.
+    """
+    # Offsets of the continuous dynamics are summed over all neighbours,
+    # while criteria expect the offset to each neighbour (as in discrete_consensus_cfunc)
+    degree = op.out_degree[:, np.newaxis]
+    neighbour_offsets = np.divide(offsets, degree, out=np.zeros_like(offsets), where=degree > 0)
+
+    convergence.reset()
+    sol = np.empty((len(t),) + init.shape)
+    sol[0] = init
+    if convergence.update(0, convergence.residuals(op, sol[:1], neighbour_offsets)[0]):
+        return sol[:1]
+
+    k = 0
+    while k < len(t) - 1:
+        end = min(k + CONVERGENCE_CHECK_INTERVAL, len(t) - 1)
+        sol[k:end + 1] = solve(sol[k], t[k:end + 1])
+        residual = convergence.residuals(op, sol[end:end + 1], neighbour_offsets)[0]
+        if residual < convergence.tol:
+            # find the first converged state of the chunk
+            residuals = convergence.residuals(op, sol[k + 1:end + 1], neighbour_offsets)
+            end = k + 1 + convergence.first_converged(residuals)
+            residual = residuals[end - k - 1]
+        if convergence.update(end, residual):
+            return sol[:end + 1]
+        k = end
+    return sol
+
+
+def _expm_solve(op: ConsensusOperator, init: np.ndarray, t: np.ndarray, offsets: np.ndarray):
+    """
+    Exact solution of dx/dt = -L x - offsets at times t, with x(t[0]) = init.
 
-    if len(X0.shape) == 1:
-        sol = consensus_solver(X0, t)
-        return sol
+    The affine system is written as a linear one on the augmented state Z = [x; I] (of shape (N + d, d)) :
+        dZ/dt = A Z, with A = [[-L, -offsets], [0, 0]]
+    so that Z(t + dt) = exp(A dt) Z(t).
+    """
+    n, d = init.shape
+    A = sp.block_array([[-(sp.diags_array(op.out_degree) - op.adjacency), sp.csr_array(-offsets)],
+                        [None, sp.csr_array((d, d))]], format='csr')
+    T = len(t)
+    # Stored as [N + d, Time, xi] so that blocks of consecutive time steps are contiguous columns
+    sol = np.empty((n + d, T, d))
+    sol[:n, 0] = init
+    sol[n:, 0] = np.identity(d)
+
+    dt = np.diff(t)
+    if T > 1 and np.allclose(dt, dt[0], rtol=1e-9, atol=0.) and n + d <= DENSE_EXPM_MAX_SIZE:
+        # Uniform grid : the states are obtained by doubling, Z[k + f] = E^f Z[k] for k < f,
+        # where E = exp(A dt), so that each doubling is one dense matrix product
+        flat = sol.reshape(n + d, T * d)
+        E = expm(dt[0] * A.toarray())
+        filled = 1
+        while filled < T:
+            b = min(filled, T - filled)
+            flat[:, filled * d:(filled + b) * d] = E @ flat[:, :b * d]
+            filled += b
+            E = E @ E
     else:
-        sol = consensus_solver(X0[:, 0], t)
-
-        # required shape : [Time, NumAgents, xi]
-        sol = sol[:, :, np.newaxis]
-        for i in range(1, X0.shape[1]):
-            s = consensus_solver(X0[:, i], t)
-            s = s[:, :, np.newaxis]
-            sol = np.append(sol, s, axis=2)
-        return sol
+        for k in range(T - 1):
+            sol[:, k + 1] = expm_multiply(dt[k] * A, sol[:, k])
+    return sol[:n].transpose(1, 0, 2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+import numpy as np
+
+from src.consensus_operator import ConsensusOperator
+
+# -- Criteria
+# All criteria take states x of shape (T, N) or (T, N, d) (T states of N agents)
+# and return one residual value per state, of shape (T,).
+# Offsets follow the semantics of discrete_consensus_cfunc() : agent i wants to be at
+# `x_j - offsets[i]` from each of its neighbours j.
+
+def _as_3d(x: np.ndarray):
+    return x[:, :, np.newaxis] if x.ndim == 2 else x
+
+
+def max_disagreement(op: ConsensusOperator, x: np.ndarray, offsets: np.ndarray = None):
+    """Largest distance between two agents along any dimension (offsets are ignored)"""
+    x = _as_3d(x)
+    return np.max(x.max(axis=1) - x.min(axis=1), axis=1)
+
+
+def formation_error(op: ConsensusOperator, x: np.ndarray, offsets: np.ndarray = None):
+    """
+    Largest local error `sum_j (x_j - x_i) - deg(i) * offsets_i` over all agents i and dimensions,
+    which is the control function u_k divided by epsilon (zero once the formation is reached)
+    """
+    x = _as_3d(x)
+    T, N, d = x.shape
+    E = op.laplacian_dot(x.transpose(1, 0, 2).reshape(N, T * d)).reshape(N, T, d)
+    if offsets is not None:
+        E += op.out_degree[:, np.newaxis, np.newaxis] * np.reshape(offsets, (N, 1, d))
+    return np.abs(E).max(axis=(0, 2))
+
+
+def achievement(op: ConsensusOperator, x: np.ndarray, offsets: np.ndarray = None):
+    """
+    Achievement of each agent : `sum_j ||(x_j - x_i) - offsets_i||` over the neighbours j of agent i,
+    i.e. the L2 norm of the difference between the current offset to each neighbour and the requested offset,
+    summed over all neighbours (zero once the formation is reached). Edge weights are ignored.
+
+    This is the definition of the datasets of `src/data/` : their `achievement.npy` is obtained from
+    their `real_results.npy` with the graph 0 -> 1 -> 2 -> 0, and
+        - line: offsets [(-0.2, 0.2), (-0.2, 0.2), (0.4, -0.4)]
+        - three_formations*: the offsets of `formations.txt`, switched every 1200 ticks
+    (the graph and offsets are not stored in the datasets).
+    Returns:
+        Array of shape (T, N)
+    """
+    x = _as_3d(x)
+    T, N, d = x.shape
+    A = op.adjacency.tocoo()
+    diff = x[:, A.col] - x[:, A.row]
+    if offsets is not None:
+        diff -= np.reshape(offsets, (N, d))[A.row]
+    norms = np.linalg.norm(diff, axis=2)
+    a = np.zeros((T, N))
+    np.add.at(a, (slice(None), A.row), norms)
+    return a
+
+
+def total_achievement(op: ConsensusOperator, x: np.ndarray, offsets: np.ndarray = None):
+    """Sum of the achievement of all agents (zero once the formation is reached)"""
+    return achievement(op, x, offsets).sum(axis=1)
+
+
+CRITERIA = {
+    'disagreement': max_disagreement,
+    'formation': formation_error,
+    'achievement': total_achievement,
+}
+
+
+class Convergence:
+    """
+    Early-termination criterion for the consensus simulators.
+
+    Pass an instance to a simulator to stop it as soon as the residual of the criterion is below `tol`.
+    After the simulation, the instance holds the statistics of the run :
+        - converged: Whether the tolerance has been reached
+        - step: Index of the last state computed (step k, or index in the time grid t)
+        - residual: Residual of the last state computed
+        - rate: Estimated convergence rate, i.e. the average factor by which the residual
+          is multiplied at each step (below 1 when converging)
+    """
+
+    def __init__(self, criterion='disagreement', tol: float = 1e-6):
+        """
+        Args:
+            criterion: One of 'disagreement', 'formation' or 'achievement' (see CRITERIA),
+                or a function `f(op, x, offsets)` returning one residual per state
+            tol: Residual below which the agents are considered to have converged
+        """
+        self.criterion = CRITERIA[criterion] if isinstance(criterion, str) else criterion
+        self.tol = tol
+        self.reset()
+
+    def reset(self):
+        self.converged = False
+        self.step = 0
+        self.residual = np.inf
+        self.rate = np.nan
+        self._initial_residual = np.nan
+
+    def residuals(self, op: ConsensusOperator, x: np.ndarray, offsets: np.ndarray = None):
+        """Residuals of the states x, of shape (T, N) or (T, N, d)"""
+        return self.criterion(op, x, offsets)
+
+    def update(self, step: int, residual: float):
+        """
+        Records the residual reached at `step`.
+        Returns:
+            True if the simulation can stop
+        """
+        if step == 0:
+            self._initial_residual = residual
+        self.step = step
+        self.residual = residual
+        if step > 0 and self._initial_residual > 0. and residual > 0.:
+            self.rate = (residual / self._initial_residual) ** (1. / step)
+        self.converged = bool(residual < self.tol)
+        return self.converged
+
+    def first_converged(self, residuals: np.ndarray):
+        """Index of the first residual below the tolerance, or None"""
+        below = np.flatnonzero(residuals < self.tol)
+        return int(below[0]) if len(below) > 0 else None
@@ -2,13 +2,17 @@ import networkx as nx
 import numpy as np
 import matplotlib.pyplot as plt
 
-from src.util import example_graph1, three_agents, max_in_degree
+from src.consensus_operator import get_operator
+from src.convergence import Convergence
+from src.profiling import PROFILER
+from src.util import example_graph1, three_agents
 
 
 def discrete_consensus_cfunc(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None,
                              common_drift: np.ndarray = np.array(0.)):
     """
     Similar to discrete_consensus_step(), except it returns the control function to apply instead to the states
+    Edge weights of G are ignored (every arc counts as 1).
     Pre-requisites:
         The value of node i in graph G should be X0[i] (i.e. start node ordering at 0).
         Same for offsets array.
@@ -22,20 +26,18 @@ def discrete_consensus_cfunc(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offs
         can be used as such :
 
         `x_k_next = x_k + discrete_consensus_cfunc(...)`
+
+        The sparse operator of G is cached between calls (see get_operator()).
+        In a control loop, keeping a reference to the ConsensusOperator and calling
+        its control() method directly also avoids checking G for changes on each call.
     """
-    u_k = np.zeros(X0.shape)
-    for node in G.nodes():
-        s = 0
-        for neighbour in G.neighbors(node):
-            s += X0[neighbour] - X0[node]
-            if offsets is not None:
-                s -= offsets[node]
-        u_k[node] = epsilon * (s + common_drift)
-    return u_k
+    with PROFILER.stage('consensus'):
+        return get_operator(G, weight=None).control(X0, epsilon, offsets, common_drift)
 
 def discrete_consensus_step(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None):
     """
     Performs one iteration of the discrete consensus algorithm.
+    Edge weights of G (attribute 'weight', 1 if missing) are used, as in nx.laplacian_matrix().
     Parameters:
         - G: Graph to consider for the agents
         - epsilon: Step size. The maximum degree (delta) times epsilon should be inferior to 1
@@ -48,47 +50,144 @@ def discrete_consensus_step(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offse
         assert offsets.shape == X0.shape, (
             "Offsets must have same shape as start vector. "
             f"Different shapes detected : (offsets) {offsets.shape} != {X0.shape} (X0)")
-        offset_addon = lambda: offsets
-    else:
-        offset_addon = lambda: 0
-
-    L = nx.laplacian_matrix(G).toarray()
-
-    # Discrete-time version
-    d = max_in_degree(G)
-    if not epsilon * d < 1:
-        raise ValueError("epsilon * delta value superior to 1, change epsilon")
-    # print(f"Epsilon = {epsilon} | Max in-degree = {d}")
 
-    # Perron matrix version
-    P = np.identity(L.shape[0]) - epsilon * L
-
-    x_next = P @ X0 + epsilon * offset_addon()
+    # Perron matrix version, using the sparse matrix cached for (G, epsilon)
+    # Raises ValueError if epsilon * max in-degree >= 1
+    x_next = get_operator(G).step(X0, epsilon, offsets)
     return np.array(x_next)
 
-def discrete_consensus_sim_complete(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None, steps: int = 10):
+def discrete_consensus_sim_complete(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None,
+                                    steps: int = 10, final_only: bool = False, convergence: Convergence = None,
+                                    recorder=None):
     """
     Simulates n steps of the discrete consensus algorithm.
     You can modify the code to either use the Perron matrix version,
     or the version that returns the control function u_k to apply to all agents
     (such that `x_k_next = x_k + u_k`)
 
+    Both versions are linear, so they are written as `x_k_next = P @ x_k + c`,
+    with P the (cached, sparse) Perron matrix and c a constant term due to the offsets.
+
     Parameters:
         See discrete_consensus_step() function
         - steps: Number of steps to perform
+        - final_only: If True, only the last state x(steps) is returned,
+          without storing the whole trajectory
+        - (Optional) convergence: Stops the simulation as soon as the agents have converged
+          (see src.convergence.Convergence). Its statistics are updated with the step reached.
+        - (Optional) recorder: src.recorder.RunRecorder to which each state x(k) and control u_k are appended.
+          Combined with `final_only`, long simulations are saved to disk with constant memory usage
+    Returns:
+        Array of shape (steps + 1, *X0.shape) containing the states x(k) for k in [0, steps],
+        or the state x(steps) if `final_only` is True.
+        If the simulation stopped early at step k, only the states up to x(k) are returned.
+    """
+    P, c = _affine_dynamics(G, epsilon, X0, offsets)
+    converged = _convergence_check(G, offsets, convergence)
+    if recorder is not None:
+        converged = _recording(recorder, converged, steps)
+
+    if final_only:
+        last = np.array(X0, dtype=c.dtype)
+        if converged(0, last):
+            return last
+        for k in range(steps):
+            last = P @ last + c
+            if converged(k + 1, last):
+                break
+        return last
+
+    x = np.empty((steps + 1,) + X0.shape, dtype=c.dtype)
+    x[0] = X0
+    if converged(0, x[0]):
+        return x[:1]
+    for k in range(steps):
+        np.add(P @ x[k], c, out=x[k + 1])
+        if converged(k + 1, x[k + 1]):
+            return x[:k + 2]
+    return x
+
+def discrete_consensus_states_at(G: nx.DiGraph, epsilon: float, X0: np.ndarray, at, offsets: np.ndarray = None):
+    """
+    Computes the states x(k) of discrete_consensus_sim_complete() only for the steps k listed in `at`,
+    without simulating the intermediate steps one by one.
+
+    The affine dynamics `x_k_next = P @ x_k + c` are written as a linear system on the augmented state
+    [x_k; I], whose matrix is raised to the required powers by repeated squaring.
+    This uses a dense (N + d) x (N + d) matrix, so it is meant for graphs of up to a few thousand agents.
+
+    Parameters:
+        See discrete_consensus_step() function
+        - at: Sequence of (non-negative) steps to compute the state at
+    Returns:
+        Array of shape (len(at), *X0.shape), where the i-th element is x(at[i])
+    """
+    at = np.asarray(at, dtype=int)
+    if np.any(at < 0):
+        raise ValueError("steps must be non-negative")
+    P, c = _affine_dynamics(G, epsilon, X0, offsets)
+
+    # Augmented system : [x_k_next; I] = M @ [x_k; I] with M = [[P, c], [0, I]]
+    n = X0.shape[0]
+    d = 1 if X0.ndim == 1 else X0.shape[1]
+    M = np.identity(n + d)
+    M[:n, :n] = P.toarray()
+    M[:n, n:] = c.reshape(n, d)
+    Z = np.vstack((np.reshape(X0, (n, d)), np.identity(d)))
+
+    x = np.empty((len(at),) + X0.shape, dtype=c.dtype)
+    last_step = 0
+    for i in np.argsort(at, kind='stable'):
+        Z = np.linalg.matrix_power(M, at[i] - last_step) @ Z
+        last_step = at[i]
+        x[i] = Z[:n].reshape(X0.shape)
+    return x
+
+def _convergence_check(G: nx.DiGraph, offsets: np.ndarray, convergence: Convergence = None):
+    """
+    Returns a function `converged(k, x_k)` recording the residual of state x_k in `convergence`,
+    and telling whether the simulation can stop
+    """
+    if convergence is None:
+        return lambda k, x_k: False
+
+    op = get_operator(G, weight=None)
+    convergence.reset()
+
+    def converged(k, x_k):
+        return convergence.update(k, convergence.residuals(op, x_k[np.newaxis], offsets)[0])
+    return converged
+
+def _recording(recorder, converged, steps: int):
+    """
+    Wraps a `converged(k, x_k)` function to append each state to `recorder`, with its control u_k = x_k_next - x_k :
+    x_k is appended once x_k_next is known, the last state (step `steps` or convergence) without control
+    """
+    previous = None
+
+    def recording(k, x_k):
+        nonlocal previous
+        if previous is not None:
+            recorder.append(previous, x_k - previous)
+        stop = converged(k, x_k)
+        previous = np.array(x_k)
+        if stop or k == steps:
+            recorder.append(previous)
+        return stop
+    return recording
+
+def _affine_dynamics(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None):
+    """
+    Returns (P, c) such that one step of discrete_consensus_sim_complete() is `x_k_next = P @ x_k + c`
     """
-    x = [X0]
-    last = X0
-    for _ in range(steps):
-        # -- Perron matrix version
-        # last = discrete_consensus_step(G, epsilon, last, offsets)
-        # x.append(last)
-
-        # -- Control function version
-        ctrl = discrete_consensus_cfunc(G, epsilon, last, offsets)
-        x.append(last + ctrl)
-        last = x[-1]
-    return np.array(x)
+    # edge weights are ignored, as in discrete_consensus_cfunc()
+    op = get_operator(G, weight=None)
+    # -- Perron matrix version
+    # c = epsilon * offsets (or zero)
+
+    # -- Control function version : u_k = -epsilon * L @ x_k + u(0)
+    c = op.control(np.zeros(X0.shape), epsilon, offsets)
+    return op.perron(epsilon), c
 
 if __name__ == '__main__':
     G = three_agents()
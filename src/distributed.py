@@ -0,0 +1,321 @@
+import asyncio
+import multiprocessing as mp
+import threading
+import time
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+
+from src.consensus_operator import get_operator
+from src.convergence import formation_error
+
+DistributedResult = namedtuple('DistributedResult', ['x', 'residual', 'converged_step', 'wall_time',
+                                                     'updates_per_second', 'sent', 'delivered', 'dropped',
+                                                     'workers'])
+"""
+Result of distributed_consensus() :
+    - x: (T, N, d) or (T, N) States of the agents, x[t] holding the state of each agent after its step t * record_every
+    - residual: (T,) Formation error of each recorded state (see src.convergence.formation_error())
+    - converged_step: First step at which the residual is below the tolerance, -1 if never reached
+    - wall_time: Time taken by the slowest worker to perform all the steps of its agents, in seconds
+    - updates_per_second: Number of agent updates per second, N * steps / wall_time
+    - sent, delivered, dropped: Number of messages
+    - workers: Number of processes the agents ran on
+"""
+
+
+class Link:
+    """Model of the communication links between agents : delay of the messages and random losses"""
+
+    def __init__(self, delay: float = 0., jitter: float = 0., drop_rate: float = 0.):
+        """
+        Args:
+            delay: Minimum delay of the messages, in seconds
+            jitter: Random additional delay, uniform between 0 and `jitter` seconds
+                (messages can then arrive out of order, older states are ignored by the receiver)
+            drop_rate: Probability of a message being lost
+        """
+        if not 0. <= drop_rate < 1.:
+            raise ValueError("drop_rate must be in [0, 1)")
+        self.delay = delay
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+
+    def sample(self, rng: np.random.Generator, count: int):
+        """Returns (whether each of `count` messages is delivered (count,), delay of each message (count,))"""
+        kept = rng.random(count) >= self.drop_rate if self.drop_rate > 0. else np.ones(count, dtype=bool)
+        delays = self.delay + self.jitter * rng.random(count) if self.jitter > 0. else np.full(count, self.delay)
+        return kept, delays
+
+
+class Agent:
+    """
+    Agent computing its own control u_i from the states received from its neighbours,
+    with the semantics of discrete_consensus_cfunc() :
+
+        u_i = epsilon * (sum_j (x_j - x_i) - deg(i) * offsets_i + common_drift)
+
+    Only the latest state received from each neighbour is kept. Neighbours from which
+    no state has been received yet are ignored (deg(i) counts the neighbours heard from).
+    """
+
+    def __init__(self, i: int, x0: np.ndarray, neighbours, epsilon: float, offset: np.ndarray = None,
+                 common_drift: np.ndarray = np.array(0.), steps: int = 100, record_every: int = 1):
+        """
+        Args:
+            i: Label of the agent
+            x0: Initial state (d,)
+            neighbours: Labels of the agents j this agent listens to (arcs i -> j of the graph)
+            epsilon: Step size
+            offset: (Optional) Relative offset (d,)
+            common_drift: Used to move all agents in a certain direction
+            steps: Number of steps the agent performs
+            record_every: The state is recorded every `record_every` steps
+        """
+        self.id = i
+        self.x = np.array(x0, dtype=float)
+        self.epsilon = epsilon
+        self.offset = np.zeros_like(self.x) if offset is None else np.asarray(offset, dtype=float)
+        self.common_drift = common_drift
+        self.neighbours = np.asarray(neighbours, dtype=int)
+        self._row = {j: r for r, j in enumerate(self.neighbours.tolist())}
+        self.states = np.zeros((len(self.neighbours), *self.x.shape))
+        """Latest state received from each neighbour"""
+        self.stamps = np.full(len(self.neighbours), -1)
+        """Step of the latest state received from each neighbour, -1 if none yet"""
+        self.record_every = record_every
+        self.trajectory = np.empty((steps // record_every + 1, *self.x.shape))
+        self.trajectory[0] = self.x
+        self.delivered = 0
+
+    def receive(self, sender: int, step: int, state: np.ndarray):
+        self.delivered += 1
+        r = self._row[sender]
+        if step > self.stamps[r]:
+            self.stamps[r] = step
+            self.states[r] = state
+
+    def control(self):
+        known = self.stamps >= 0
+        s = (self.states[known] - self.x).sum(axis=0) - np.count_nonzero(known) * self.offset
+        return self.epsilon * (s + self.common_drift)
+
+    def step(self, k: int):
+        """Performs step k (k >= 1) : x_i = x_i + u_i"""
+        self.x = self.x + self.control()
+        if k % self.record_every == 0:
+            self.trajectory[k // self.record_every] = self.x
+
+
+class _AgentGroup:
+    """
+    Agents running as asyncio tasks in the same process.
+    Messages between agents of the group are delivered in place (or after their delay with the event loop),
+    messages to agents of other groups are batched per group and sent through the group's inbox queue.
+    """
+
+    def __init__(self, index: int, agents, followers, owner: np.ndarray, link: Link, seed, period: float,
+                 inboxes=None):
+        self.index = index
+        self.agents = {agent.id: agent for agent in agents}
+        self.followers = followers
+        """dict[agent, array of the agents listening to it]"""
+        self.owner = owner
+        """Index of the group of each agent"""
+        self.link = link
+        self.rng = np.random.default_rng(seed)
+        self.period = period
+        self.inboxes = inboxes
+        self._outbox = {}
+        self.sent = 0
+        self.dropped = 0
+        self.wall_time = 0.
+
+    def _receive(self, receiver: int, sender: int, step: int, state: np.ndarray):
+        self.agents[receiver].receive(sender, step, state)
+
+    def _send(self, agent: Agent, step: int):
+        followers = self.followers[agent.id]
+        kept, delays = self.link.sample(self.rng, len(followers))
+        self.sent += len(followers)
+        self.dropped += len(followers) - np.count_nonzero(kept)
+        now = self._loop.time()
+        for f, delay in zip(followers[kept].tolist(), delays[kept].tolist()):
+            group = self.owner[f]
+            if group != self.index:
+                self._outbox.setdefault(group, []).append((f, agent.id, step, now + delay, agent.x))
+            elif delay > 0.:
+                self._loop.call_later(delay, self._receive, f, agent.id, step, agent.x)
+            else:
+                self._receive(f, agent.id, step, agent.x)
+
+    def _flush(self):
+        for group, messages in self._outbox.items():
+            receivers, senders, steps, deliver_at, states = zip(*messages)
+            self.inboxes[group].put((receivers, senders, steps, deliver_at, np.array(states)))
+        self._outbox.clear()
+
+    def _deliver(self, batch):
+        # the event loop clock is time.monotonic(), shared by all processes
+        for receiver, sender, step, at, state in zip(*batch):
+            if at > self._loop.time():
+                self._loop.call_at(at, self._receive, receiver, sender, step, state)
+            else:
+                self._receive(receiver, sender, step, state)
+
+    def _read(self):
+        """Reads the inbox of the group until None is received (runs in a thread)"""
+        inbox = self.inboxes[self.index]
+        while (batch := inbox.get()) is not None:
+            self._loop.call_soon_threadsafe(self._deliver, batch)
+
+    async def _run_agent(self, agent: Agent, steps: int, start: float):
+        self._send(agent, 0)
+        for k in range(1, steps + 1):
+            await asyncio.sleep(max(0., start + k * self.period - self._loop.time()))
+            agent.step(k)
+            self._send(agent, k)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.period)
+            self._flush()
+
+    async def run(self, steps: int):
+        self._loop = asyncio.get_running_loop()
+        reader = None
+        if self.inboxes is not None:
+            reader = threading.Thread(target=self._read, daemon=True)
+            reader.start()
+            flusher = asyncio.create_task(self._flush_forever())
+        start, start_loop = time.perf_counter(), self._loop.time()
+        await asyncio.gather(*(self._run_agent(agent, steps, start_loop) for agent in self.agents.values()))
+        self.wall_time = time.perf_counter() - start
+        if reader is not None:
+            flusher.cancel()
+            self._flush()
+            self.inboxes[self.index].put(None)
+            reader.join()
+
+    def result(self):
+        ids = np.array(list(self.agents))
+        return {
+            'ids': ids,
+            'trajectories': np.stack([self.agents[i].trajectory for i in ids.tolist()]),
+            'sent': self.sent,
+            'delivered': sum(agent.delivered for agent in self.agents.values()),
+            'dropped': self.dropped,
+            'wall_time': self.wall_time,
+        }
+
+
+def _worker(group: _AgentGroup, steps: int, barrier, results):
+    for inbox in group.inboxes:
+        # other groups may still be sending when this one is done, never wait for its queues to be flushed
+        inbox.cancel_join_thread()
+    barrier.wait()
+    asyncio.run(group.run(steps))
+    results.put(group.result())
+
+
+def distributed_consensus(G: nx.DiGraph, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None,
+                          common_drift: np.ndarray = np.array(0.), steps: int = 100, workers: int = 1,
+                          link: Link = None, period: float = 0., seed: int = None, record_every: int = 1,
+                          tol: float = 1e-6):
+    """
+    Decentralized version of discrete_consensus_sim_complete() (control function version) :
+    each agent is an asyncio task computing its own control from the messages of its neighbours (see Agent),
+    and broadcasting its new state to the agents listening to it after each step.
+
+    Agents do not wait for each other : each one performs its steps with the latest states it received,
+    so that messages delayed or dropped by the `link` slow down the convergence instead of blocking it.
+    With `workers` > 1, the agents are split into `workers` processes (contiguous labels),
+    exchanging batches of messages through multiprocessing queues.
+
+    Parameters:
+        See discrete_consensus_cfunc() function
+        - steps: Number of steps performed by each agent
+        - workers: Number of processes the agents run on. 1 runs all agents in the current process
+        - (Optional) link: Delay and loss of the messages, see Link. Instantaneous and reliable by default
+        - period: Time between two steps of an agent, in seconds. 0 runs the agents as fast as possible
+        - (Optional) seed: Seed of the random losses and delays
+        - record_every: The states are recorded every `record_every` steps
+        - tol: Formation error below which the agents are considered to have converged
+    Returns:
+        A DistributedResult
+    Raises:
+        ValueError if epsilon * delta >= 1, where delta is the maximum in-degree of the graph
+    """
+    op = get_operator(G, weight=None)  # edge weights are ignored, as in discrete_consensus_cfunc()
+    if not epsilon * op.max_in_degree < 1:
+        raise ValueError("epsilon * delta value superior to 1, change epsilon")
+    link = Link() if link is None else link
+    X = np.asarray(X0, dtype=float)
+    n = len(X)
+    A = op.adjacency
+    followers = A.T.tocsr()
+    agents = [Agent(i, X[i], A.indices[A.indptr[i]:A.indptr[i + 1]], epsilon,
+                    None if offsets is None else offsets[i], common_drift, steps, record_every)
+              for i in range(n)]
+    workers = max(1, min(workers, n))
+    parts = np.array_split(np.arange(n), workers)
+    owner = np.empty(n, dtype=int)
+    for g, part in enumerate(parts):
+        owner[part] = g
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+
+    def group(g, inboxes=None):
+        return _AgentGroup(g, [agents[i] for i in parts[g]],
+                           {i: followers.indices[followers.indptr[i]:followers.indptr[i + 1]] for i in parts[g].tolist()},
+                           owner, link, seeds[g], period, inboxes)
+
+    if workers == 1:
+        g = group(0)
+        asyncio.run(g.run(steps))
+        results = [g.result()]
+    else:
+        inboxes = [mp.Queue() for _ in range(workers)]
+        barrier = mp.Barrier(workers)
+        queue = mp.Queue()
+        processes = [mp.Process(target=_worker, args=(group(g, inboxes), steps, barrier, queue))
+                     for g in range(workers)]
+        for p in processes:
+            p.start()
+        results = [queue.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+    x = np.empty((steps // record_every + 1, *X.shape))
+    for r in results:
+        x[:, r['ids']] = np.moveaxis(r['trajectories'], 0, 1)
+    residual = formation_error(op, x, offsets)
+    below = np.flatnonzero(residual < tol)
+    wall_time = max(r['wall_time'] for r in results)
+    return DistributedResult(x=x, residual=residual,
+                             converged_step=int(below[0]) * record_every if len(below) > 0 else -1,
+                             wall_time=wall_time, updates_per_second=n * steps / wall_time,
+                             sent=sum(r['sent'] for r in results), delivered=sum(r['delivered'] for r in results),
+                             dropped=sum(r['dropped'] for r in results), workers=workers)
+
+
+if __name__ == '__main__':
+    """
+    Square formation of 4 agents on a ring, with 5 % of the messages lost and 2 ms of delay,
+    compared with the centralized simulation.
+    """
+    from src.discrete import discrete_consensus_sim_complete
+
+    G = nx.DiGraph()
+    G.add_edges_from([(0, 1), (1, 2), (2, 3), (3, 0)])
+    square = np.array([(1, 1), (1, -1), (-1, -1), (-1, 1)], dtype=float)
+    offsets = np.roll(square, -1, axis=0) - square
+    X0 = np.random.default_rng(0).uniform(-5., 5., (4, 2))
+
+    central = discrete_consensus_sim_complete(G, 0.3, X0, offsets, steps=200)
+    result = distributed_consensus(G, 0.3, X0, offsets, steps=200, link=Link(delay=2e-3, drop_rate=0.05),
+                                   period=1e-3, seed=0)
+    print("Centralized final state :\n", central[-1])
+    print("Distributed final state :\n", result.x[-1])
+    print(f"Converged at step {result.converged_step}, {result.updates_per_second:.0f} updates/s, "
+          f"{result.sent} messages sent, {result.dropped} dropped")
@@ -2,10 +2,10 @@ import threading
 import typing
 
 import numpy as np
-import pygame
 
 from src.draw_formation import node_handler
 from src.draw_formation.drawer import SCREEN_SIZE
+from src.formation_spec import make_spec, save_spec, spec_reaches_consensus
 BUTTONS_Y_TOP = 650.
 
 def offsets_access():
@@ -63,6 +63,37 @@ def convert_pygame_to_world(pg_coords):
     y = y * (WORLD_MAX_Y / SCREEN_SIZE[1])
     return x, y
 
+SCREEN_TO_WORLD = np.array([
+    [WORLD_MAX_X / SCREEN_SIZE[0], 0., -WORLD_MAX_X / 2.],
+    [0., WORLD_MAX_Y / SCREEN_SIZE[1], -WORLD_MAX_Y / 2.]
+])
+"""Affine matrix of convert_pygame_to_world(), saved in the formation spec : world = SCREEN_TO_WORLD @ (x, y, 1)"""
+
+spec_path = "formation.npz"
+"""File the formation spec (see src.formation_spec) is exported to when clicking the Update button"""
+
+def current_spec():
+    """
+    Formation spec of the current drawing.
+    Nodes are relabelled 0 to N-1 in increasing order of their ids.
+    """
+    ids = sorted(node_handler.nodes)
+    label = {nid: i for i, nid in enumerate(ids)}
+    edges = [(label[nid], label[neigh_id]) for nid in ids for neigh_id in node_handler.get_node(nid).neighbours]
+    screen_positions = np.array([node_handler.get_node(nid).coords for nid in ids], dtype=float).reshape(-1, 2)
+    positions = np.array([convert_pygame_to_world(p) for p in screen_positions]).reshape(-1, 2)
+    return make_spec(edges, positions, screen_positions=screen_positions, screen_to_world=SCREEN_TO_WORLD)
+
+def export_spec(path: str):
+    """Saves the current drawing as a formation spec (see current_spec()), and returns the spec"""
+    spec = current_spec()
+    save_spec(path, spec)
+    print(f"Formation spec saved to {path}")
+    if not spec_reaches_consensus(spec):
+        print("Warning : the agents of this drawing cannot reach consensus (epsilon and rate saved as NaN), "
+              "check the links of the drawing")
+    return spec
+
 CLEAR_BUTTON_CDS = (
     10,
     BUTTONS_Y_TOP,
@@ -86,32 +117,24 @@ clear_button_clicked = in_box_generator(CLEAR_BUTTON_CDS)
 update_button_clicked = in_box_generator(UPDATE_BUTTON_CDS)
 remove_links_button_clicked = in_box_generator(REMOVE_ALL_LINKS_BUTTON_CDS)
 
-def click(event: pygame.event.Event):
+def click(event: "pygame.event.Event"):
     """
     Handles click of one button in the button area
     """
+    import pygame
     mouse_pos = pygame.mouse.get_pos()
     if clear_button_clicked(*mouse_pos):
-        node_handler.nodes.clear()
+        node_handler.clear()
     elif update_button_clicked(*mouse_pos):
-        # upload to some library
-        # retrieve node coordinates & convert them to world frame
-        num_nodes = len(node_handler.nodes)
-        node_poses = [0] * num_nodes
-        for nid in node_handler.nodes.keys():
-            node_poses[nid] = np.array(convert_pygame_to_world(node_handler.get_node(nid).coords))
-
-        # compute offsets
-        offsets = [np.zeros(2) for _ in range(num_nodes)]
-        for nid in node_handler.nodes.keys():
-            for neigh_id in node_handler.get_node(nid).neighbours:
-                offsets[nid] += node_poses[neigh_id] - node_poses[nid]
-        set_offsets(offsets)
-
+        # offsets are taken from the exported spec, so that both always hold the same values
+        # (mean of the relative positions of the neighbours, nodes labelled 0 to N-1, see current_spec())
+        if not node_handler.nodes:
+            set_offsets([])
+        else:
+            set_offsets(list(export_spec(spec_path).offsets))
 
     elif remove_links_button_clicked(*mouse_pos):
-        for i in range(len(node_handler.nodes)):
-            node_handler.nodes[i].neighbours.clear()
+        node_handler.unlink_all()
 
 def render_text_in_box(screen, draw_box, text, font):
     """Computes the center position of a draw_box to put the text in, and returns it"""
@@ -119,8 +142,9 @@ def render_text_in_box(screen, draw_box, text, font):
     textpos = text.get_rect(centerx=(draw_box[0] + (draw_box[0] + draw_box[2])) / 2., centery=(draw_box[1] + (draw_box[1] + draw_box[3])) / 2.)
     screen.blit(text, textpos)
 
-def draw(screen: pygame.Surface):
-    font = pygame.font.SysFont(pygame.font.get_default_font(), 28)
+def draw(screen: "pygame.Surface", font: "pygame.font.Font"):
+    """Draws the buttons, as they never change this is done once on the static layer of the drawer"""
+    import pygame
     pygame.draw.rect(screen, "blue", pygame.Rect(*CLEAR_BUTTON_CDS))
     pygame.draw.rect(screen, "blue", pygame.Rect(*UPDATE_BUTTON_CDS))
     pygame.draw.rect(screen, "blue", pygame.Rect(*REMOVE_ALL_LINKS_BUTTON_CDS))
@@ -3,13 +3,20 @@ import threading
 SCREEN_SIZE = (1280, 720)
 END_EVENT = threading.Event()
 
-def main(default_offsets: tuple = None):
+def main(default_offsets: tuple = None, spec_path: str = None):
+    """
+    Args:
+        default_offsets: Initial value of the offsets given by get_offsets()
+        spec_path: (Optional) File the formation spec is exported to by the Update button (see buttons.spec_path)
+    """
     # Example file showing a basic pygame "game loop"
     import pygame
     import numpy as np
 
     from src.draw_formation import node_handler, node_mover, linker, buttons
     buttons.set_offsets(default_offsets)
+    if spec_path is not None:
+        buttons.spec_path = spec_path
 
     pygame.display.set_caption("Formation drawing app (Tatusya Ibuki laboratory)")
     if not pygame.font:
@@ -24,10 +31,7 @@ def main(default_offsets: tuple = None):
         Args:
             mouse_pos: Position of the mouse
         """
-        for node in node_handler.nodes.values():
-            if np.linalg.norm(node.coords - mouse_pos) < NODE_DRAW_RADIUS:
-                return node
-        return None
+        return node_handler.node_at(mouse_pos, NODE_DRAW_RADIUS)
 
     # pygame setup
     pygame.init()
@@ -36,6 +40,35 @@ def main(default_offsets: tuple = None):
     running = True
     font = pygame.font.SysFont(pygame.font.get_default_font(), 28)
 
+    glyphs = {}  # dict[str, pygame.Surface]
+    def glyph(text: str):
+        """Surface of `text` rendered with `font`, only rendered the first time"""
+        surface = glyphs.get(text)
+        if surface is None:
+            surface = glyphs[text] = font.render(text, True, (255, 255, 255))
+        return surface
+
+    def draw_node(surface, node, pose):
+        pygame.draw.circle(surface, "red", pose, NODE_DRAW_RADIUS)
+        text = glyph(str(node.id))
+        surface.blit(text, text.get_rect(centerx=pose[0], centery=pose[1]))
+
+    # Static layer : background, links, nodes (except the one being moved) and buttons.
+    # It is only redrawn when the graph changes, each frame blits it and draws the moving node on top.
+    static_layer = pygame.Surface(SCREEN_SIZE).convert()
+    static_version = None
+
+    def draw_static_layer():
+        static_layer.fill("purple")
+        for node in node_handler.nodes.values():
+            # draw the links of the node (from center of start node, to edge)
+            for friend_id in node.neighbours:
+                pygame.draw.line(static_layer, "green", node.coords, node_handler.get_node(friend_id).coords, width=3)
+        for node in node_handler.nodes.values():
+            if not node.is_moving:
+                draw_node(static_layer, node, node.coords)
+        buttons.draw(static_layer, font)
+
     def drawing_area_click(event: pygame.event.Event):
         left_click, middle_click, right_click = pygame.mouse.get_pressed()
         near = node_near_mouse(mouse_pos)
@@ -44,8 +77,7 @@ def main(default_offsets: tuple = None):
                 if near is not None:
                     node_mover.start_moving(near)
                 else:
-                    n = node_handler.create_node()
-                    n.coords = mouse_pos
+                    node_handler.create_node(mouse_pos)
             elif right_click:
                 if near is not None:
                     node_handler.delete_node(near)
@@ -72,33 +104,22 @@ def main(default_offsets: tuple = None):
                     drawing_area_click(event)
 
         # -- Rendering
-        # fill the screen with a color to wipe away anything from last frame
-        screen.fill("purple")
+        if static_version != node_handler.version:
+            draw_static_layer()
+            static_version = node_handler.version
+        # wipe away anything from last frame
+        screen.blit(static_layer, (0, 0))
 
-        # draw all nodes
+        # draw the node being moved
         for node in node_handler.nodes.values():
-            pose = node.coords if not node.is_moving else pygame.mouse.get_pos()
-
-            # draw the node
-            pygame.draw.circle(screen, "red", pose, NODE_DRAW_RADIUS)
-            text = font.render(str(node.id), True, (255, 255, 255))
-            textpos = text.get_rect(centerx=pose[0], centery=pose[1])
-            screen.blit(text, textpos)
-
-            # draw the links of the node (from center of start node, to edge)
-            start = node.coords
-            for friend_id in node.neighbours:
-                end = node_handler.get_node(friend_id).coords
-                pygame.draw.line(screen, "green", start, end, width=3)
+            if node.is_moving:
+                draw_node(screen, node, pygame.mouse.get_pos())
 
         # highlight a given node
         highlighted = linker.get_highlighted()
         if highlighted is not None:
             pygame.draw.circle(screen, "yellow", highlighted.coords, NODE_DRAW_RADIUS + 8, width=5)
 
-        # draw buttons
-        buttons.draw(screen)
-
         # flip() the display to put your work on screen
         pygame.display.flip()
 
@@ -1,49 +1,129 @@
+from collections import defaultdict
+
+import numpy as np
+
 from src.draw_formation.log import logger
 
+CELL_SIZE = 64.
+"""Size of the cells of the spatial hash used to find the nodes under the mouse, in pixels"""
+
 # -- Node creation and handling
 class Node:
     def __init__(self, id):
         self.id = id
         self.coords = None
-        """(x, y) coordinates of the node on the screen"""
+        """(x, y) coordinates of the node on the screen, set with move_node()"""
         self.neighbours = []
+        self.followers = set()
+        """Ids of the nodes linked to this node (reverse arcs), so that deleting a node only visits its own links"""
         self.is_moving = False
         """Whether the node is currently being moved by the user"""
 
 nodes = {} # dict[int, Node]
 """Associates an integer to a node"""
 
-def create_node():
-    """Creates a new node using the latest available integer"""
-    n = Node(len(nodes))
+version = 0
+"""Incremented on every change of the nodes, their positions or their links (used to know when to redraw them)"""
+
+_grid = defaultdict(set)  # dict[cell, set of node ids]
+
+_next_id = 0
+"""Id of the next node created : ids only go up, so that a new node never takes the id of an existing one"""
+
+def mark_changed():
+    """Signals a change of the drawing (e.g. a node starting to move), so that it is redrawn"""
+    global version
+    version += 1
+
+def _cell(coords):
+    return int(coords[0] // CELL_SIZE), int(coords[1] // CELL_SIZE)
+
+def _unindex(node):
+    if node.coords is not None:
+        cell = _cell(node.coords)
+        _grid[cell].discard(node.id)
+        if not _grid[cell]:
+            del _grid[cell]
+
+def create_node(coords=None):
+    """Creates a new node using the latest available integer, at `coords` if given"""
+    global _next_id
+    n = Node(_next_id)
+    _next_id += 1
     nodes[n.id] = n
+    if coords is not None:
+        move_node(n, coords)
+    mark_changed()
     return n
 
+def move_node(node, coords):
+    """Sets the coordinates of a node on the screen"""
+    _unindex(node)
+    node.coords = np.asarray(coords)
+    _grid[_cell(node.coords)].add(node.id)
+    mark_changed()
+
+def node_at(pos, radius: float):
+    """
+    Returns the node closest to `pos` among the nodes closer than `radius`, or None.
+    Only the cells of the spatial hash around `pos` are visited.
+    """
+    cx, cy = _cell(pos)
+    reach = int(np.ceil(radius / CELL_SIZE))
+    best, best_distance = None, radius
+    for i in range(cx - reach, cx + reach + 1):
+        for j in range(cy - reach, cy + reach + 1):
+            for node_id in _grid.get((i, j), ()):
+                node = nodes[node_id]
+                distance = np.hypot(node.coords[0] - pos[0], node.coords[1] - pos[1])
+                if distance < best_distance:
+                    best, best_distance = node, distance
+    return best
+
 def delete_node(node):
     """Deletes node from the list of nodes displayed"""
     logger.info(f"Deleting node {node.id} with neighbours {node.neighbours}")
-    for other_id in nodes.keys():
-        if other_id == node.id:
-            continue
-        other = get_node(other_id)
-        if node.id in other.neighbours:
-            other.neighbours.remove(node.id)
+    for other_id in node.followers:
+        get_node(other_id).neighbours.remove(node.id)
+    for other_id in node.neighbours:
+        get_node(other_id).followers.discard(node.id)
+    _unindex(node)
     nodes.pop(node.id)
+    mark_changed()
+
+def clear():
+    """Deletes all nodes, ids start from 0 again"""
+    global _next_id
+    nodes.clear()
+    _next_id = 0
+    _grid.clear()
+    mark_changed()
 
 def are_linked(src, friend):
     """Returns True if there exists a directed arc from `src` to `friend`"""
-    return friend.id in src.neighbours
+    return src.id in friend.followers
 
 def link(src, friend):
     """Creates a directed arc from `src` to `friend`"""
     src.neighbours.append(friend.id)
+    friend.followers.add(src.id)
+    mark_changed()
     logger.info(f"Linking {src.id} to {friend.id}")
 
 def unlink(src, friend):
     """Removes the directed arc from `src` to `friend`"""
     src.neighbours.remove(friend.id)
+    friend.followers.discard(src.id)
+    mark_changed()
     logger.info(f"{src.id} unlinked from {friend.id}")
 
+def unlink_all():
+    """Removes all arcs"""
+    for node in nodes.values():
+        node.neighbours.clear()
+        node.followers.clear()
+    mark_changed()
+
 def get_node(node_id):
     """Retrieve node with the given id"""
-    return nodes[node_id]
\ No newline at end of file
+    return nodes[node_id]
@@ -1,3 +1,4 @@
+from src.draw_formation import node_handler
 from src.draw_formation.node_handler import Node
 
 _moving = None
@@ -6,10 +7,11 @@ def start_moving(node: Node):
     global _moving
     _moving = node
     _moving.is_moving = True
+    node_handler.mark_changed()
 
 def stop_moving(mouse_pos: tuple[int, int]):
     global _moving
     if _moving is not None:
-        _moving.coords = mouse_pos
         _moving.is_moving = False
+        node_handler.move_node(_moving, mouse_pos)
         _moving = None
\ No newline at end of file
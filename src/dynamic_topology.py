@@ -0,0 +1,213 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+from src.consensus_operator import ConsensusOperator
+
+COMPACT_FRACTION = 0.1
+"""Pending edge changes are merged into the CSR adjacency matrix once they exceed this fraction of its edges"""
+
+
+def proximity_edges(X: np.ndarray, radius: float):
+    """
+    Communication graph of agents at positions X (N, d) : arcs i -> j and j -> i for every pair of agents
+    closer than `radius`.
+    Returns:
+        (E, 2) array of arcs
+    """
+    pairs = cKDTree(np.asarray(X, dtype=float).reshape(len(X), -1)).query_pairs(radius, output_type='ndarray')
+    return np.concatenate((pairs, pairs[:, ::-1]))
+
+
+class DynamicConsensusOperator(ConsensusOperator):
+    """
+    ConsensusOperator of a graph whose edges change over time (links appearing and dropping).
+
+    Edge changes are applied incrementally : degrees are updated in place, and the changed arcs are kept
+    in a small list of pending changes applied on top of the CSR adjacency matrix, which is only rebuilt
+    when the pending changes exceed COMPACT_FRACTION of its edges.
+    The topology is changed with events (add_edges(), remove_edges()), or by replacing the whole edge set,
+    e.g. with a proximity rule (set_edges(), set_proximity()).
+
+    Pre-requisites:
+        Agents are labelled 0 to N-1, and the number of agents does not change.
+        Arcs have no self-loops : arcs (i, i) given to add_edges(), remove_edges() or set_edges() are ignored.
+    """
+
+    def __init__(self, n: int, edges=()):
+        """
+        Args:
+            n: Number of agents
+            edges: Initial arcs (i, j), j being a neighbour of i
+        """
+        self.n = n
+        self.adjacency = sp.csr_array((n, n), dtype=float)
+        self.out_degree = np.zeros(n)
+        self.in_degree = np.zeros(n, dtype=int)
+        self._perron = {}
+        self._keys = np.empty(0, dtype=np.int64)  # sorted i * n + j of the current arcs
+        self._pending_keys = []
+        self._pending_signs = []
+        self._pending = 0
+        self._delta = None
+        self.add_edges(edges)
+        self.compact()
+
+    @classmethod
+    def from_graph(cls, G: nx.DiGraph):
+        """
+        Operator of the current edges of G.
+        Raises:
+            ValueError if G has self-loops : ConsensusOperator(G) counts them in the out-degrees,
+            so ignoring them would give different dynamics
+        """
+        if nx.number_of_selfloops(G) > 0:
+            raise ValueError(f"Graph has {nx.number_of_selfloops(G)} self-loops, remove them first "
+                             "(e.g. G.remove_edges_from(nx.selfloop_edges(G)))")
+        return cls(G.number_of_nodes(), list(G.edges))
+
+    @property
+    def max_in_degree(self):
+        return int(self.in_degree.max()) if self.n > 0 else 0
+
+    @property
+    def n_edges(self):
+        return len(self._keys)
+
+    @property
+    def edges(self):
+        """(E, 2) array of the current arcs"""
+        return np.stack(np.divmod(self._keys, self.n), axis=1)
+
+    def to_graph(self):
+        """Current graph as a networkx DiGraph, e.g. to use the functions of src.graph_analysis"""
+        G = nx.DiGraph()
+        G.add_nodes_from(range(self.n))
+        G.add_edges_from(map(tuple, self.edges))
+        return G
+
+    def _to_keys(self, edges):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        if np.any(edges < 0) or np.any(edges >= self.n):
+            raise ValueError(f"Agents must be labelled 0 to {self.n - 1}")
+        keys = np.unique(edges[:, 0] * self.n + edges[:, 1])
+        return keys[keys // self.n != keys % self.n]  # self-loops are dropped, see the class docstring
+
+    def _apply(self, keys: np.ndarray, sign: int):
+        """Records the addition (sign 1) or removal (sign -1) of arcs that are respectively absent or present"""
+        if len(keys) == 0:
+            return
+        rows, cols = np.divmod(keys, self.n)
+        np.add.at(self.out_degree, rows, sign)
+        np.add.at(self.in_degree, cols, sign)
+        self._pending_keys.append(keys)
+        self._pending_signs.append(np.full(len(keys), float(sign)))
+        self._pending += len(keys)
+        self._delta = None
+        self._perron.clear()
+
+    def _maybe_compact(self):
+        if self._pending > COMPACT_FRACTION * max(self.adjacency.nnz, self.n):
+            self.compact()
+
+    def add_edges(self, edges):
+        """Adds the arcs (i, j) of `edges` (arcs that already exist are ignored)"""
+        keys = self._to_keys(edges)
+        keys = keys[~np.isin(keys, self._keys, assume_unique=True)]
+        self._keys = np.union1d(self._keys, keys)
+        self._apply(keys, 1)
+        self._maybe_compact()
+
+    def remove_edges(self, edges):
+        """Removes the arcs (i, j) of `edges` (arcs that do not exist are ignored)"""
+        keys = self._to_keys(edges)
+        keys = keys[np.isin(keys, self._keys, assume_unique=True)]
+        self._keys = np.setdiff1d(self._keys, keys, assume_unique=True)
+        self._apply(keys, -1)
+        self._maybe_compact()
+
+    def set_edges(self, edges):
+        """
+        Replaces the arcs of the graph by `edges`, only applying the differences with the current ones.
+        Returns:
+            Tuple (number of arcs added, number of arcs removed)
+        """
+        keys = self._to_keys(edges)
+        added = np.setdiff1d(keys, self._keys, assume_unique=True)
+        removed = np.setdiff1d(self._keys, keys, assume_unique=True)
+        self._keys = keys
+        self._apply(added, 1)
+        self._apply(removed, -1)
+        self._maybe_compact()
+        return len(added), len(removed)
+
+    def set_proximity(self, X: np.ndarray, radius: float):
+        """Replaces the arcs of the graph by the communication graph of agents at positions X, see proximity_edges()"""
+        return self.set_edges(proximity_edges(X, radius))
+
+    def compact(self):
+        """Merges the pending edge changes into the CSR adjacency matrix"""
+        if self._pending == 0:
+            return
+        rows, cols = np.divmod(self._keys, self.n)
+        self.adjacency = sp.csr_array((np.ones(len(self._keys)), (rows, cols)), shape=(self.n, self.n))
+        self._pending_keys.clear()
+        self._pending_signs.clear()
+        self._pending = 0
+        self._delta = None
+
+    def laplacian_dot(self, X: np.ndarray):
+        """Computes L @ X for the current graph, applying the pending edge changes on top of the CSR matrix"""
+        AX = self.adjacency @ X
+        if self._pending > 0:
+            if self._delta is None:
+                keys = np.concatenate(self._pending_keys)
+                rows, cols = np.divmod(keys, self.n)
+                self._delta = sp.csr_array((np.concatenate(self._pending_signs), (rows, cols)),
+                                           shape=(self.n, self.n))
+            AX += self._delta @ X
+        return self._column(X) * X - AX
+
+    def perron(self, epsilon: float):
+        self.compact()
+        return super().perron(epsilon)
+
+
+def dynamic_consensus_sim(op: DynamicConsensusOperator, epsilon: float, X0: np.ndarray, offsets: np.ndarray = None,
+                          steps: int = 10, radius: float = None, events=None):
+    """
+    Discrete-time consensus (control function version, as discrete_consensus_sim_complete())
+    on a graph whose topology changes at every step.
+    Parameters:
+        - op: Operator holding the initial topology, updated in place
+        - epsilon: Step size. Raises ValueError if epsilon * max in-degree >= 1 after a topology change
+        - X0: Initial states, of shape (N,) or (N, d)
+        - (Optional) offsets: Relative offsets, same shape as X0
+        - steps: Number of steps
+        - (Optional) radius: Communication range : before each step, the graph is replaced
+          by the proximity graph of the current states (see proximity_edges())
+        - (Optional) events: Function `events(k, x_k)` called before each step, returning a tuple
+          (arcs to add, arcs to remove), or None if the topology does not change
+    Returns:
+        Tuple (states of shape (steps + 1, *X0.shape), number of arcs of the graph at each step (steps,))
+    """
+    X = np.array(X0, dtype=float)
+    x = np.empty((steps + 1, *X.shape))
+    x[0] = X
+    arcs = np.empty(steps, dtype=int)
+    for k in range(steps):
+        if radius is not None:
+            op.set_proximity(X if X.ndim > 1 else X[:, np.newaxis], radius)
+        if events is not None:
+            change = events(k, X)
+            if change is not None:
+                added, removed = change
+                op.remove_edges(removed)
+                op.add_edges(added)
+        if not epsilon * op.max_in_degree < 1:
+            raise ValueError("epsilon * delta value superior to 1, change epsilon")
+        X = X + op.control(X, epsilon, offsets)
+        x[k + 1] = X
+        arcs[k] = op.n_edges
+    return x, arcs
@@ -2,11 +2,114 @@ import typing
 
 import networkx as nx
 import numpy as np
-from pynput import keyboard
 from threading import Lock
 
-from src.cbf import grSim_obstacles_except, zeroing_cbf
+from src.cbf import grSim_positions_except, team_cbf
+from src.consensus_operator import ConsensusOperator
 from src.discrete import discrete_consensus_step, discrete_consensus_cfunc
+from src.formation_spec import load_spec, spec_operator, spec_reaches_consensus
+from src.graph_analysis import optimal_epsilon
+from src.parallel_cbf import CBFWorkerPool, team_obstacles
+from src.profiling import PROFILER
+from src.spatial import sensing_radius
+
+
+def make_formation_orders(G: nx.DiGraph | ConsensusOperator, offsets: np.ndarray, agents: list = None, epsilon: float = None,
+                          alpha: float = 0.3, radius: float = 0.3, get_drift: typing.Callable[[], np.array] = None,
+                          team: str = "blue", cull: bool = True, cbf_pool: CBFWorkerPool = None,
+                          deadline: float = 1. / 120.):
+    """
+    Creates the `velocity_orders` callback of the formation controller, to be given to `Controller.run()`
+    (or HeadlessController.run(), see src.headless).
+    On every frame, robots `agents` of `team` are moved by discrete-time consensus towards the formation
+    given by `offsets`, while avoiding each other and all other robots on the field with CBF.
+    Parameters:
+        - G: Graph of the agents, node i controlling robot agents[i] (or its ConsensusOperator)
+        - offsets: (N, 2) relative offsets, see discrete_consensus_cfunc()
+        - agents: Robot ids of the agents, defaults to 0..N-1
+        - epsilon: Consensus step size, defaults to the fastest one for G (see optimal_epsilon()).
+          Required if G is a ConsensusOperator
+        - alpha, radius: CBF parameter and distance to respect between robots
+        - get_drift: (Optional) Function returning the common drift velocity applied to the formation
+        - cull: Whether obstacles that cannot constrain a robot on this frame are left out of the QPs.
+          The sensing radius (see src.spatial.sensing_radius()) is computed on every frame from the fastest
+          nominal velocity, so that the safe velocities are the same as without culling
+        - cbf_pool: (Optional) CBFWorkerPool solving the QP of each robot in parallel, instead of team_cbf().
+          It must have been created with the same `alpha`, and is not closed by the controller
+        - deadline: Time allowed to the `cbf_pool` to solve all QPs of a frame, in seconds
+          (robots without a solution in time get the fallback velocity of the pool)
+    """
+    if cbf_pool is not None and cbf_pool.alpha != alpha:
+        raise ValueError(f"cbf_pool was created with alpha = {cbf_pool.alpha}, expected {alpha}")
+    # built once, reused on every frame. Edge weights are ignored, as in discrete_consensus_cfunc()
+    consensus = G if isinstance(G, ConsensusOperator) else ConsensusOperator(G, weight=None)
+    if epsilon is None:
+        if isinstance(G, ConsensusOperator):
+            raise ValueError("epsilon is required when giving a ConsensusOperator")
+        epsilon, _ = optimal_epsilon(G)
+    if agents is None:
+        agents = list(range(consensus.n))
+
+    def formation_orders(teams_data):
+        with PROFILER.stage('tick'):
+            agent_positions = np.array([teams_data[team][rob_id].pos for rob_id in agents])
+
+            # -- Using Perron matrix version of discrete consensus (sparse matrix cached by the operator)
+            # PID_P = 3.
+            # target_positions = consensus.step(agent_positions, epsilon=epsilon, offsets=offsets)
+            # target_speeds = PID_P * (target_positions - agent_positions)
+
+            # -- By directly getting the speed vectors to apply
+            drift_value = get_drift() if get_drift is not None else np.array(0.)
+            with PROFILER.stage('consensus'):
+                target_speeds = consensus.control(agent_positions, epsilon=epsilon, offsets=offsets,
+                                                  common_drift=drift_value)
+
+            # Obstacles further than this distance cannot constrain any robot on this frame
+            v_max = float(np.max(np.linalg.norm(target_speeds, axis=1), initial=0.))
+            cull_radius = sensing_radius(v_max, alpha, radius) if cull else None
+
+            # -- Solving the QP of each robot separately (src.cbf.ZeroingCBFSolver, warm-started across frames
+            # when built once before this callback : cbf_solvers = {rob_id: ZeroingCBFSolver(alpha=alpha) for rob_id in agents})
+            # Define the list of obstacles as being all other robots close to it, except itself (src.spatial.ObstacleIndex)
+            # index = ObstacleIndex.from_teams_data(teams_data, r=radius)
+            # agent_obstacles = [index.obstacles_near(agent_positions[i], cull_radius, exclude=(team, rob_id))
+            #                    for i, rob_id in enumerate(agents)]
+            # solutions = [cbf_solvers[rob_id].solve(agent_positions[i], target_speeds[i], agent_obstacles[i])
+            #                 for i, rob_id in enumerate(agents)]
+            # final_speeds = [s['x'] for s in solutions] # retrieve speed values
+
+            # -- Solving the QP of all robots at once
+            # Robots of the formation avoid each other, and all other robots on the field
+            # (robots whose QP is infeasible are stopped, see team_cbf())
+            other_robots = grSim_positions_except(teams_data, agents, team)
+            if cbf_pool is None:
+                final_speeds = team_cbf(agent_positions, target_speeds, alpha=alpha, radius=radius,
+                                        obstacles=other_robots, sensing_radius=cull_radius)
+            else:
+                # -- Solving the QP of each robot in parallel, in the worker processes of the pool
+                centers, radii, counts = team_obstacles(agent_positions, other_robots, radius, cull_radius)
+                final_speeds = cbf_pool.solve(agent_positions, target_speeds, centers, radii, counts, deadline)
+            return {team: {rob_id: final_speeds[i].reshape(2, 1) for i, rob_id in enumerate(agents)}}
+
+    return formation_orders
+
+
+def formation_orders_from_spec(path: str, **kwargs):
+    """
+    make_formation_orders() for a formation spec file exported by the formation editor (see src.formation_spec) :
+    the graph, offsets and suggested epsilon are read from the file, nothing is recomputed.
+    Other parameters of make_formation_orders() can be given as keyword arguments (epsilon overrides the spec).
+    Raises:
+        ValueError if the graph of the spec cannot reach consensus and no epsilon is given
+    """
+    spec = load_spec(path)
+    if 'epsilon' not in kwargs and not spec_reaches_consensus(spec):
+        raise ValueError(f"The graph of the formation spec {path} cannot reach consensus (no suggested epsilon), "
+                         "link its agents or give epsilon")
+    kwargs.setdefault('epsilon', spec.epsilon)
+    return make_formation_orders(spec_operator(spec), spec.offsets, **kwargs)
+
 
 if __name__ == '__main__':
     """
@@ -14,9 +117,12 @@ if __name__ == '__main__':
     with the grSim simulator (must be installed separately).
     The formation can be controlled using the keys ZQSD.
     """
+    from pynput import keyboard
     from ssl_traj.main import Controller
     G = nx.DiGraph()
     G.add_edges_from([(0, 1), (1, 2), (2, 3), (3, 0)]) # connected graph
+    epsilon, rate = optimal_epsilon(G)  # fastest convergence for this graph
+    print(f"Epsilon = {epsilon:.3f} | Convergence rate = {rate:.3f}")
 
     # Reference: agent 0
     square = np.array([
@@ -85,27 +191,15 @@ if __name__ == '__main__':
 
     get_drift_value = register_keyboard_listener()
 
-    def formation_orders(teams_data):
-        agents = [i for i in range(4)]
-        agent_positions = np.array([teams_data["blue"][rob_id].pos for rob_id in agents])
-
-        # -- Using Perron matrix version of discrete consensus
-        # PID_P = 3.
-        # target_positions = discrete_consensus_step(G, epsilon=0.95, X0=agent_positions, offsets=square)
-        # target_speeds = PID_P * (target_positions - agent_positions)
-
-        # -- By directly getting the speed vectors to apply
-        drift_value = get_drift_value()
-        target_speeds = discrete_consensus_cfunc(G, epsilon=0.95, X0=agent_positions, offsets=square, common_drift=drift_value)
-
-        # Define the list of obstacles as being all other robots, except itself
-        agent_obstacles = [grSim_obstacles_except(teams_data, rob_id, "blue") for rob_id in agents]
-
-        # Solve QP to get adapted speeds for each robot
-        solutions = [zeroing_cbf(agent_positions[rob_id], target_speeds[rob_id], 0.3, agent_obstacles[rob_id])
-                        for rob_id in agents]
-        final_speeds = [s['x'] for s in solutions] # retrieve speed values
-        return {"blue": {rob_id: final_speeds[rob_id] for rob_id in agents}}
+    formation_orders = make_formation_orders(G, square, epsilon=epsilon, get_drift=get_drift_value)
+
+    # -- Formation drawn with the formation editor (Update button), see src.formation_spec
+    # formation_orders = formation_orders_from_spec("formation.npz", get_drift=get_drift_value)
+
+    # -- Computing the orders in a background thread, the simulator loop always gets the latest orders
+    # from src.runtime import ControlRuntime
+    # runtime = ControlRuntime(formation_orders)
+    # formation_orders = runtime.as_callback()  # stopped with runtime.close()
 
     grSimController = Controller()
     grSimController.run(duration=-1, velocity_orders=formation_orders)
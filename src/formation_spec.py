@@ -0,0 +1,137 @@
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from src.consensus_operator import ConsensusOperator
+from src.graph_analysis import optimal_epsilon
+
+SPEC_VERSION = 1
+"""Version of the formation spec files written by save_spec()"""
+
+FormationSpec = namedtuple('FormationSpec', ['version', 'edges', 'positions', 'offsets', 'laplacian', 'epsilon',
+                                             'rate', 'screen_positions', 'screen_to_world'])
+"""
+Formation shared between the formation editor (src.draw_formation) and the controllers :
+    - version: Version of the spec (SPEC_VERSION when it was written)
+    - edges: (E, 2) Arcs (i, j) of the graph, j being a neighbour of i. Agents are labelled 0 to N-1
+    - positions: (N, 2) Shape of the formation in the world frame, NaN if it was only given by its offsets
+    - offsets: (N, 2) Relative offsets, with the semantics of discrete_consensus_cfunc()
+    - laplacian: (N, N) Sparse (CSR) out-degree Laplacian of the graph
+    - epsilon: Suggested consensus step size (see optimal_epsilon()),
+      NaN if the graph cannot reach consensus (e.g. a drawing made of several separate groups)
+    - rate: Convergence rate obtained with this epsilon, NaN if the graph cannot reach consensus
+    - screen_positions: (N, 2) Positions of the nodes in the editor, in pixels (NaN if not drawn with the editor)
+    - screen_to_world: (2, 3) Affine conversion from screen to world coordinates used by the editor,
+      `world = screen_to_world @ [x, y, 1]`
+"""
+
+
+def formation_offsets(edges: np.ndarray, positions: np.ndarray):
+    """
+    Offsets of discrete_consensus_cfunc() reaching the formation `positions` : agent i wants
+    `sum_j (x_j - x_i) = deg(i) * offsets_i`, i.e. offsets_i is the mean of `positions_j - positions_i`
+    over its neighbours j (zero for agents without neighbours).
+    """
+    positions = np.asarray(positions, dtype=float)
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+    offsets = np.zeros_like(positions)
+    np.add.at(offsets, edges[:, 0], positions[edges[:, 1]] - positions[edges[:, 0]])
+    degree = np.bincount(edges[:, 0], minlength=len(positions))
+    return offsets / np.maximum(degree, 1)[:, np.newaxis]
+
+
+def make_spec(edges, positions: np.ndarray = None, offsets: np.ndarray = None, n: int = None,
+              screen_positions: np.ndarray = None, screen_to_world: np.ndarray = None):
+    """
+    Compiles a formation into a FormationSpec, computing its Laplacian and suggested epsilon.
+    Parameters:
+        - edges: Arcs (i, j) of the graph
+        - positions: (Optional) Shape of the formation in the world frame (N, 2)
+        - offsets: (Optional) Relative offsets (N, 2), computed from `positions` if not given (see formation_offsets())
+        - n: (Optional) Number of agents, defaults to the length of positions or offsets
+        - screen_positions, screen_to_world: (Optional) Data of the editor, see FormationSpec
+    If no epsilon makes the agents reach consensus on this graph, the spec is still built
+    but its epsilon and rate are NaN (see spec_reaches_consensus()).
+    """
+    if positions is None and offsets is None:
+        raise ValueError("A formation needs either positions or offsets")
+    n = len(positions if positions is not None else offsets) if n is None else n
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    positions = np.full((n, 2), np.nan) if positions is None else np.asarray(positions, dtype=float).reshape(n, 2)
+    if offsets is None:
+        offsets = formation_offsets(edges, positions)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(n))
+    G.add_edges_from(map(tuple, edges))
+    op = ConsensusOperator(G)
+    epsilon, rate = optimal_epsilon(G)
+    if not rate < 1.:
+        # rate 1 for every epsilon : the suggested epsilon would be meaningless
+        epsilon = rate = np.nan
+    return FormationSpec(
+        version=SPEC_VERSION,
+        edges=edges,
+        positions=positions,
+        offsets=np.asarray(offsets, dtype=float).reshape(n, 2),
+        laplacian=sp.csr_array(sp.diags_array(op.out_degree) - op.adjacency),
+        epsilon=epsilon,
+        rate=rate,
+        screen_positions=np.full((n, 2), np.nan) if screen_positions is None else np.asarray(screen_positions, float),
+        screen_to_world=np.full((2, 3), np.nan) if screen_to_world is None else np.asarray(screen_to_world, float),
+    )
+
+
+def spec_reaches_consensus(spec: FormationSpec):
+    """Whether the agents of a spec reach consensus with its suggested epsilon (see make_spec())"""
+    return not np.isnan(spec.rate)
+
+
+def save_spec(path: str, spec: FormationSpec):
+    """Writes a spec to an uncompressed .npz file of plain arrays (the Laplacian is stored as its CSR arrays)"""
+    L = spec.laplacian
+    np.savez(path, version=spec.version, edges=spec.edges, positions=spec.positions, offsets=spec.offsets,
+             laplacian_data=L.data, laplacian_indices=L.indices, laplacian_indptr=L.indptr,
+             epsilon=spec.epsilon, rate=spec.rate, screen_positions=spec.screen_positions,
+             screen_to_world=spec.screen_to_world)
+
+
+def load_spec(path: str):
+    """
+    Reads a spec written by save_spec(). Arrays are read as they are stored, nothing is recomputed.
+    Raises:
+        ValueError if the file was written by a newer version
+    """
+    with np.load(path, allow_pickle=False) as f:
+        version = int(f['version'])
+        if version > SPEC_VERSION:
+            raise ValueError(f"Formation spec version {version} is not supported (latest : {SPEC_VERSION})")
+        n = len(f['offsets'])
+        return FormationSpec(
+            version=version,
+            edges=f['edges'],
+            positions=f['positions'],
+            offsets=f['offsets'],
+            laplacian=sp.csr_array((f['laplacian_data'], f['laplacian_indices'], f['laplacian_indptr']), shape=(n, n)),
+            epsilon=float(f['epsilon']),
+            rate=float(f['rate']),
+            screen_positions=f['screen_positions'],
+            screen_to_world=f['screen_to_world'],
+        )
+
+
+def spec_operator(spec: FormationSpec):
+    """ConsensusOperator of the graph of a spec, built from its Laplacian (A = D - L)"""
+    L = spec.laplacian
+    A = sp.csr_array(sp.diags_array(L.diagonal()) - L)
+    A.eliminate_zeros()
+    return ConsensusOperator.from_adjacency(A)
+
+
+def spec_graph(spec: FormationSpec):
+    """Graph of a spec as a networkx DiGraph"""
+    G = nx.DiGraph()
+    G.add_nodes_from(range(len(spec.offsets)))
+    G.add_edges_from(map(tuple, spec.edges))
+    return G
@@ -0,0 +1,150 @@
+import weakref
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import minimize_scalar
+from scipy.sparse.linalg import ArpackNoConvergence, eigs, eigsh
+
+from src.consensus_operator import ConsensusOperator, get_operator
+
+DENSE_EIG_MAX_SIZE = 500
+"""Graphs with up to this number of agents have their full Laplacian spectrum computed with a dense solver"""
+
+SPARSE_EIG_COUNT = 6
+"""Number of eigenvalues computed at each end of the spectrum by the sparse solvers"""
+
+SPARSE_EIG_MAX_ITER = 500
+"""Maximum number of Arnoldi/Lanczos update iterations of the sparse solvers"""
+
+SHIFT = -1e-2
+"""Shift used to find the eigenvalues of the Laplacian closest to zero (shift-invert mode)"""
+
+ZERO_TOL = 1e-8
+"""Eigenvalues of modulus below ZERO_TOL * max(1, max out-degree) are considered equal to zero"""
+
+Spectrum = namedtuple('Spectrum', ['eigenvalues', 'algebraic_connectivity', 'max_in_degree', 'exact'])
+"""
+Spectral data of the Laplacian of a graph :
+    - eigenvalues: Eigenvalues of the Laplacian, except the zero eigenvalue associated to consensus
+    - algebraic_connectivity: Smallest real part of these eigenvalues (zero if the graph has no spanning tree,
+      i.e. if the zero eigenvalue is repeated)
+    - max_in_degree: Maximum in-degree of the graph, which bounds epsilon (epsilon * delta < 1)
+    - exact: False if only the extremal eigenvalues were computed (sparse solvers on large graphs)
+"""
+
+_spectra = weakref.WeakKeyDictionary()
+"""Cache of spectra : dict[ConsensusOperator, Spectrum]"""
+
+
+def spectrum(G: nx.DiGraph):
+    """
+    Computes the spectrum of the Laplacian of G.
+    Small graphs use a dense eigensolver. Larger graphs only have their extremal eigenvalues computed,
+    with Lanczos (undirected graphs) or Arnoldi (directed graphs) iterations : the largest ones in magnitude,
+    and the ones closest to zero using shift-invert mode.
+
+    Results are cached per graph, and recomputed if the graph is modified (see get_operator()).
+    """
+    op = get_operator(G)
+    s = _spectra.get(op)
+    if s is None:
+        s = _compute_spectrum(op)
+        _spectra[op] = s
+    return s
+
+
+def _compute_spectrum(op: ConsensusOperator):
+    L = sp.csc_array(sp.diags_array(op.out_degree) - op.adjacency)
+    k = min(SPARSE_EIG_COUNT, op.n - 2)
+    exact = op.n <= DENSE_EIG_MAX_SIZE or k < 1
+    if exact:
+        eigenvalues = np.linalg.eigvals(L.toarray())
+    else:
+        solver = eigsh if (L != L.T).nnz == 0 else eigs
+        largest = _extremal_eigenvalues(solver, L, k)
+        if len(largest) == 0:
+            # Clustered spectrum (e.g. directed rings), use the Gershgorin bound |λ| <= 2 * max out-degree
+            largest = np.array([2. * np.max(op.out_degree)])
+        eigenvalues = np.concatenate((largest, _extremal_eigenvalues(solver, L, k, sigma=SHIFT)))
+    eigenvalues = eigenvalues.astype(complex)
+
+    # remove the zero eigenvalue associated to the consensus value. Eigenvalues are not deduplicated :
+    # the zero eigenvalue is repeated when the graph has no spanning tree (e.g. disconnected graphs)
+    # and consensus is then never reached
+    zero = np.abs(eigenvalues) < ZERO_TOL * max(1., float(np.max(op.out_degree, initial=0.)))
+    eigenvalues = np.delete(eigenvalues, np.argmin(np.abs(eigenvalues)))
+    if len(eigenvalues) == 0 or np.count_nonzero(zero) > 1:
+        return Spectrum(eigenvalues, 0., op.max_in_degree, exact)
+    connectivity = max(0., float(np.min(eigenvalues.real)))
+    return Spectrum(eigenvalues, connectivity, op.max_in_degree, exact)
+
+
+def _extremal_eigenvalues(solver, L: sp.csc_array, k: int, sigma: float = None):
+    """
+    Eigenvalues of L of largest magnitude (or closest to sigma) found by the sparse solver.
+    If the solver does not converge, only the eigenvalues that did converge are returned.
+    """
+    try:
+        return solver(L, k=k, sigma=sigma, which='LM', tol=1e-8, maxiter=SPARSE_EIG_MAX_ITER,
+                      return_eigenvectors=False)
+    except ArpackNoConvergence as e:
+        return e.eigenvalues
+
+
+def algebraic_connectivity(G: nx.DiGraph):
+    """
+    Smallest real part of the non-zero eigenvalues of the Laplacian of G (Fiedler value for undirected graphs).
+    Consensus is reached if and only if it is strictly positive.
+    """
+    return spectrum(G).algebraic_connectivity
+
+
+def convergence_rate(G: nx.DiGraph, epsilon: float):
+    """
+    Second largest eigenvalue modulus of the Perron matrix P = I - epsilon * L, i.e. the factor
+    by which the disagreement between agents is asymptotically multiplied at each step
+    of discrete-time consensus. Values below 1 mean convergence.
+    """
+    return _rate(spectrum(G), epsilon)
+
+
+def _rate(s: Spectrum, epsilon: float):
+    if s.algebraic_connectivity == 0.:
+        return 1.
+    return float(np.max(np.abs(1. - epsilon * s.eigenvalues)))
+
+
+def optimal_epsilon(G: nx.DiGraph):
+    """
+    Step size giving the fastest discrete-time consensus on G, among the values accepted
+    by discrete_consensus_step() (epsilon * max_in_degree < 1).
+    Returns:
+        Tuple (epsilon, convergence rate obtained with this epsilon)
+    """
+    s = spectrum(G)
+    upper = (1. - 1e-6) / max(s.max_in_degree, 1)
+    if s.algebraic_connectivity == 0.:
+        return upper, 1.
+    # the rate is a maximum of convex functions of epsilon, hence convex
+    res = minimize_scalar(lambda e: _rate(s, e), bounds=(0., upper), method='bounded',
+                          options={'xatol': 1e-8})
+    return float(res.x), float(res.fun)
+
+
+def predicted_steps(G: nx.DiGraph, epsilon: float, tol: float, initial: float = 1.):
+    """
+    Predicts the number of steps of discrete-time consensus needed to reduce the disagreement
+    between agents from `initial` to `tol`, based on the convergence rate.
+    Returns:
+        Number of steps, or infinity if consensus is not reached with this epsilon
+    """
+    rate = convergence_rate(G, epsilon)
+    if tol >= initial:
+        return 0
+    if rate >= 1.:
+        return np.inf
+    if rate == 0.:
+        return 1
+    return int(np.ceil(np.log(tol / initial) / np.log(rate)))
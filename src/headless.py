@@ -0,0 +1,178 @@
+import time
+
+import numpy as np
+
+DEFAULT_DT = 1. / 60.
+"""Tick period of the headless simulator, in seconds (grSim vision runs at 60 Hz)"""
+
+
+class HeadlessRobot:
+    """Robot of the `teams_data` given to the callbacks, with the same `.pos` attribute as the robots of ssl_traj"""
+
+    def __init__(self, robot_id: int, team: str, pos: np.ndarray, vel: np.ndarray):
+        self.id = robot_id
+        self.team = team
+        self.pos = pos
+        self.vel = vel
+
+
+def default_teams(per_team: int = 6, spacing: float = 0.6):
+    """Initial positions of two teams facing each other, blue on the left and yellow on the right of the field"""
+    y = (np.arange(per_team) - (per_team - 1) / 2.) * spacing
+    return {
+        "blue": np.stack((np.full(per_team, -2.), y), axis=1),
+        "yellow": np.stack((np.full(per_team, 2.), y), axis=1),
+    }
+
+
+class HeadlessController:
+    """
+    Local kinematic stand-in for `ssl_traj.main.Controller`, which does not need grSim.
+
+    Robots are single integrators : on every tick, the velocities returned by `velocity_orders(teams_data)`
+    are integrated over `dt`. Robots without an order in a tick stop.
+    Simulated time does not depend on the wall-clock time, so runs are deterministic and,
+    unless `realtime` is set, faster than real time.
+
+    The wall-clock latency of every callback is recorded in `latencies`, see latency_summary().
+    """
+
+    def __init__(self, teams: dict = None, dt: float = DEFAULT_DT, max_speed: float = None, noise: float = 0.,
+                 seed: int = 0, realtime: bool = False, record: bool = False, recorder=None,
+                 recorded_team: str = 'blue'):
+        """
+        Args:
+            teams: dict[team, (N, 2) initial positions], defaults to default_teams()
+            dt: Tick period, in seconds of simulated time
+            max_speed: (Optional) Commanded velocities are scaled down to this norm
+            noise: Standard deviation of the Gaussian noise added to the positions given to the callbacks (vision)
+            seed: Seed of the vision noise
+            realtime: Sleeps between ticks so that simulated time follows wall-clock time, like grSim
+            record: Records the true positions of all robots on every tick in `history`
+            recorder: (Optional) src.recorder.RunRecorder to which the true positions and the applied velocities
+                of the robots of `recorded_team` are appended on every tick (constant memory, unlike `record`)
+            recorded_team: Team saved by `recorder`
+        """
+        teams = default_teams() if teams is None else teams
+        self.positions = {team: np.array(pos, dtype=float).reshape(-1, 2) for team, pos in teams.items()}
+        self.velocities = {team: np.zeros_like(pos) for team, pos in self.positions.items()}
+        self.dt = dt
+        self.max_speed = max_speed
+        self.noise = noise
+        self.realtime = realtime
+        self.record = record
+        self.recorder = recorder
+        self.recorded_team = recorded_team
+        self._rng = np.random.default_rng(seed)
+        self.time = 0.
+        self.ticks = 0
+        self.latencies = []
+        """Wall-clock duration of each call to `velocity_orders`, in seconds"""
+        self.wall_time = 0.
+        self.history = []
+        """dict[team, (N, 2) positions] of every tick, if `record` is set"""
+
+    @property
+    def teams_data(self):
+        """Current vision frame : dict[team, dict[robot_id, HeadlessRobot]]"""
+        data = {}
+        for team, pos in self.positions.items():
+            seen = pos if self.noise == 0. else pos + self._rng.normal(0., self.noise, pos.shape)
+            data[team] = {i: HeadlessRobot(i, team, seen[i].copy(), self.velocities[team][i].copy())
+                          for i in range(len(pos))}
+        return data
+
+    def apply(self, orders: dict):
+        """Integrates the velocities of `orders` (dict[team, dict[robot_id, velocity]]) over one tick"""
+        for team, vel in self.velocities.items():
+            vel[:] = 0.
+            for i, v in (orders or {}).get(team, {}).items():
+                vel[i] = np.asarray(v, dtype=float).ravel()
+            if self.max_speed is not None:
+                speed = np.linalg.norm(vel, axis=1, keepdims=True)
+                np.divide(vel * self.max_speed, speed, out=vel, where=speed > self.max_speed)
+            self.positions[team] += vel * self.dt
+
+    def step(self, velocity_orders):
+        """Runs one tick : calls `velocity_orders` on the current frame and applies its orders"""
+        data = self.teams_data
+        start = time.perf_counter()
+        orders = velocity_orders(data)
+        self.latencies.append(time.perf_counter() - start)
+        self.advance(orders)
+
+    def advance(self, orders: dict):
+        """Applies `orders` and moves the simulated time forward by one tick"""
+        if self.recorder is not None:
+            positions = self.positions[self.recorded_team].copy()
+        self.apply(orders)
+        if self.recorder is not None:
+            self.recorder.append(positions, self.velocities[self.recorded_team])
+        self.time += self.dt
+        self.ticks += 1
+        if self.record:
+            self.history.append({team: pos.copy() for team, pos in self.positions.items()})
+
+    def run(self, duration: float, velocity_orders, ticks: int = None):
+        """
+        Same contract as `Controller.run()` : calls `velocity_orders(teams_data)` on every tick,
+        and applies the returned dict[team, dict[robot_id, velocity]].
+        Args:
+            duration: Simulated time to run, in seconds. -1 runs until interrupted (or for `ticks` ticks)
+            ticks: (Optional) Number of ticks to run, overrides `duration`
+        """
+        if ticks is None:
+            ticks = -1 if duration < 0 else int(round(duration / self.dt))
+        start = time.perf_counter()
+        try:
+            k = 0
+            while ticks < 0 or k < ticks:
+                self.step(velocity_orders)
+                k += 1
+                if self.realtime:
+                    time.sleep(max(0., start + k * self.dt - time.perf_counter()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.wall_time += time.perf_counter() - start
+
+    def latency_summary(self):
+        """Dictionary of statistics of the callback latency (in milliseconds) and of the simulation speed"""
+        lat = 1e3 * np.asarray(self.latencies)
+        if len(lat) == 0:
+            return {'ticks': 0}
+        return {
+            'ticks': self.ticks,
+            'mean_ms': float(lat.mean()),
+            'p50_ms': float(np.percentile(lat, 50)),
+            'p99_ms': float(np.percentile(lat, 99)),
+            'max_ms': float(lat.max()),
+            'overruns': int(np.sum(lat > 1e3 * self.dt)),
+            'speedup': self.time / self.wall_time if self.wall_time > 0. else np.inf,
+        }
+
+
+if __name__ == '__main__':
+    """
+    Runs the formation controller of formation.py and the single robot CBF controller of cbf.py
+    for 10 seconds of simulated time, and prints the latency of their callbacks and of each stage.
+    """
+    import networkx as nx
+
+    from src.cbf import make_order_single
+    from src.formation import make_formation_orders
+    from src.profiling import PROFILER
+
+    G = nx.DiGraph()
+    G.add_edges_from([(0, 1), (1, 2), (2, 3), (3, 0)])
+    square = np.array([(1, 1), (1, -1), (-1, -1), (-1, 1)])
+
+    PROFILER.enable()
+    for name, orders in (("formation_orders", make_formation_orders(G, square)),
+                         ("order_single", make_order_single(np.array([3., 0.]), verbose=False))):
+        PROFILER.reset()
+        controller = HeadlessController()
+        controller.run(duration=10., velocity_orders=orders)
+        print(name, controller.latency_summary())
+        for stage, s in PROFILER.summary()['stages'].items():
+            print(f"    {stage:>10} | mean {s['mean_ms']:.3f} ms | p99 {s['p99_ms']:.3f} ms")
@@ -0,0 +1,192 @@
+import numpy as np
+from cvxopt import matrix, solvers
+
+from src.cbf import ObstacleSet, cbf_constraints, obstacle_arrays, project_halfplanes
+
+NORM_POLYGON_SIDES = 16
+"""Number of sides of the polygon inscribed in the disc of a norm limit ||v|| <= v_max"""
+
+
+def polygon_halfplanes(radius: float, center: np.ndarray = None, sides: int = NORM_POLYGON_SIDES):
+    """
+    Half-planes `G v <= h` of the regular polygon inscribed in the disc ||v - center|| <= radius,
+    used to express a norm limit as linear constraints of the QP
+    """
+    theta = 2. * np.pi * np.arange(sides) / sides
+    G = np.stack((np.cos(theta), np.sin(theta)), axis=1)
+    h = np.full(sides, radius * np.cos(np.pi / sides))
+    if center is not None:
+        h += G @ np.ravel(center)
+    return G, h
+
+
+def box_halfplanes(limits, center: np.ndarray = None):
+    """Half-planes `G v <= h` of the box |v_x - center_x| <= limits[0], |v_y - center_y| <= limits[1]"""
+    limits = np.broadcast_to(np.asarray(limits, dtype=float), (2,))
+    G = np.array([[1., 0.], [0., 1.], [-1., 0.], [0., -1.]])
+    h = np.concatenate((limits, limits))
+    if center is not None:
+        h += G @ np.ravel(center)
+    return G, h
+
+
+def limit_halfplanes(norm: float = None, box=None, center: np.ndarray = None):
+    """Half-planes of a norm limit and/or a box limit around `center`, (0, 2) and (0,) arrays if there is none"""
+    Gs, hs = [np.empty((0, 2))], [np.empty(0)]
+    for limit, halfplanes in ((norm, polygon_halfplanes), (box, box_halfplanes)):
+        if limit is not None:
+            G, h = halfplanes(limit, center)
+            Gs.append(G)
+            hs.append(h)
+    return np.concatenate(Gs), np.concatenate(hs)
+
+
+def solve_layers(u_nom: np.ndarray, layers, method: str = 'exact'):
+    """
+    Minimizes ||u - u_nom||² subject to the constraints of all `layers`, a list of (G, h) ordered from
+    the most important to the least important. If the QP is infeasible, the last layers are dropped
+    one by one until it is feasible (the first layer is never dropped).
+    Returns:
+        Dictionary with keys 'x' (solution, as a (2, 1) array like cvxopt), 'status' ('optimal' or 'infeasible')
+        and 'dropped' (number of layers dropped)
+    """
+    u_nom = np.asarray(u_nom, dtype=float).ravel()
+    for dropped in range(len(layers)):
+        kept = layers[:len(layers) - dropped]
+        G = np.concatenate([G for G, _ in kept])
+        h = np.concatenate([h for _, h in kept])
+        if method == 'exact':
+            u, feasible = project_halfplanes(u_nom, G, h)
+        elif method == 'cvxopt':
+            try:
+                sol = solvers.qp(matrix(2 * np.identity(2)), matrix(-2. * u_nom), matrix(G), matrix(h),
+                                 options={'show_progress': False})
+                u, feasible = np.array(sol['x']).ravel(), sol['status'] == 'optimal'
+            except ValueError:
+                # raised by cvxopt on some infeasible problems
+                u, feasible = u_nom, False
+        else:
+            raise ValueError(f"Unknown method '{method}', expected 'cvxopt' or 'exact'")
+        if feasible:
+            break
+    return {'x': u.reshape(2, 1), 'status': 'optimal' if feasible else 'infeasible', 'dropped': dropped}
+
+
+class LimitedCBFSolver:
+    """
+    ZCBF-QP of zeroing_cbf() for a single-integrator robot, with the limits of the robot as extra constraints,
+    so that the safe velocity is never saturated afterwards :
+        - Velocity limits : ||v|| <= v_max (inscribed polygon) and/or |v_x| <= box[0], |v_y| <= box[1]
+        - Acceleration limit : ||v - v_prev|| <= a_max * dt, v_prev being the previous safe velocity
+
+    The acceleration limit cannot always be satisfied together with the CBF constraints :
+    in that case it is dropped for this tick (solution key 'dropped' is 1).
+    """
+
+    def __init__(self, alpha: float, v_max: float = None, box=None, a_max: float = None, dt: float = 1. / 60.,
+                 method: str = 'exact'):
+        """
+        Args:
+            alpha: ZCBF parameter of the obstacles that do not have their own (see ObstacleSet)
+            v_max: (Optional) Maximum speed
+            box: (Optional) Maximum absolute velocity along each axis, single value or (vx_max, vy_max)
+            a_max: (Optional) Maximum acceleration
+            dt: Tick period, used for the acceleration limit
+            method: 'cvxopt' or 'exact', see zeroing_cbf()
+        """
+        if alpha <= 0.:
+            raise ValueError("alpha must be > 0.")
+        self.alpha = alpha
+        self.a_max = a_max
+        self.dt = dt
+        self.method = method
+        self._limits = limit_halfplanes(v_max, box)
+        self._v_prev = None
+
+    def reset(self):
+        """Forgets the previous velocity, e.g. when the robot was stopped"""
+        self._v_prev = None
+
+    def solve(self, p: np.ndarray, v_nom: np.ndarray, obstacles):
+        """
+        Safe velocity of the robot at position `p`, closest to `v_nom`.
+        `obstacles` is either a list of `Obstacle` or an ObstacleSet.
+        Returns:
+            Solution dictionary, see solve_layers()
+        """
+        if not isinstance(obstacles, ObstacleSet):
+            obstacles = ObstacleSet.from_obstacles(obstacles)
+        G, h = obstacles.constraints(p, self.alpha)
+        layers = [(np.concatenate((G, self._limits[0])), np.concatenate((h, self._limits[1])))]
+        if self.a_max is not None and self._v_prev is not None:
+            layers.append(polygon_halfplanes(self.a_max * self.dt, self._v_prev))
+
+        sol = solve_layers(v_nom, layers, self.method)
+        self._v_prev = sol['x'].ravel() if sol['status'] == 'optimal' else None
+        return sol
+
+
+def ecbf_constraints(p: np.ndarray, v: np.ndarray, centers: np.ndarray, radii: np.ndarray, k0, k1):
+    """
+    Constraints `G a <= h` of the exponential CBF for a double-integrator robot (p' = v, v' = a)
+    and static obstacles, with the same barrier h(p) = 1/2 (||p - o||² - r²) as zeroing_cbf().
+    Since h'' = ||v||² + (p - o) @ a, the condition h'' + k1 h' + k0 h >= 0 gives :
+        G[i] = o_i - p
+        h[i] = ||v||² + k1 (p - o_i) @ v + k0 h(p)
+    `k0` and `k1` are either single values or one value per obstacle (M,).
+    """
+    v = np.ravel(v)
+    G, barrier = cbf_constraints(p, centers, radii, 2.)  # barrier = ||p - o||² - r² = 2 h(p)
+    h = (v @ v) - k1 * (G @ v) + (k0 / 2.) * barrier
+    return G, h
+
+
+class DoubleIntegratorCBFSolver:
+    """
+    Exponential CBF (ECBF) QP for a double-integrator robot commanded in acceleration :
+        min ||a - a_nom||² subject to h'' + k1 h' + k0 h >= 0 for each obstacle
+
+    The gains are placed from a double pole `-rate` of the error dynamics : k1 = 2 * rate, k0 = rate².
+    Extra constraints :
+        - Acceleration limits : ||a|| <= a_max and/or a box
+        - Velocity limits for the next tick : v + a * dt within ||.|| <= v_max and/or a box.
+          They are dropped for this tick if the QP is infeasible with them (solution key 'dropped' is 1).
+    """
+
+    def __init__(self, rate: float, a_max: float = None, a_box=None, v_max: float = None, v_box=None,
+                 dt: float = 1. / 60., method: str = 'exact'):
+        """
+        Args:
+            rate: Pole of the ECBF, larger values let the robot get closer to the obstacles before braking.
+                Obstacles of an ObstacleSet with alpha values use them as their own rate
+            a_max, a_box: (Optional) Acceleration limits (norm, and per axis)
+            v_max, v_box: (Optional) Velocity limits (norm, and per axis)
+            dt: Tick period, used for the velocity limits
+            method: 'cvxopt' or 'exact', see zeroing_cbf()
+        """
+        if rate <= 0.:
+            raise ValueError("rate must be > 0.")
+        self.rate = rate
+        self.dt = dt
+        self.method = method
+        self._a_limits = limit_halfplanes(a_max, a_box)
+        self._v_limits = limit_halfplanes(v_max, v_box)
+
+    def solve(self, p: np.ndarray, v: np.ndarray, a_nom: np.ndarray, obstacles):
+        """
+        Safe acceleration of the robot at position `p` with velocity `v`, closest to `a_nom`.
+        `obstacles` is either a list of `Obstacle` or an ObstacleSet.
+        Returns:
+            Solution dictionary, see solve_layers()
+        """
+        centers, radii = obstacle_arrays(obstacles)
+        rate = self.rate
+        if isinstance(obstacles, ObstacleSet) and obstacles.alphas is not None:
+            rate = obstacles.active()[2]
+        G, h = ecbf_constraints(p, v, centers, radii, rate ** 2, 2. * rate)
+        layers = [(np.concatenate((G, self._a_limits[0])), np.concatenate((h, self._a_limits[1])))]
+        if len(self._v_limits[1]) > 0:
+            # G_v (v + a dt) <= h_v
+            G_v, h_v = self._v_limits
+            layers.append((G_v, (h_v - G_v @ np.ravel(v)) / self.dt))
+        return solve_layers(a_nom, layers, self.method)
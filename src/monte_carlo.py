@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+
+from src.consensus_operator import get_operator
+
+BatchResult = namedtuple('BatchResult', ['converged_step', 'disagreement', 'final'])
+"""
+Result of batch_consensus_sim(), each field has one entry per batch element :
+    - converged_step: (B,) First step k at which the disagreement is below the tolerance, -1 if never reached
+    - disagreement: (B,) Disagreement of the final state
+    - final: (B, N, d) Final state, i.e. the state at convergence or after all steps
+"""
+
+
+def batch_consensus_sim(G: nx.DiGraph, X0s: np.ndarray, epsilons=0.1, offsets: np.ndarray = None,
+                        steps: int = 1000, tol: float = 1e-6, chunk_size: int = 256):
+    """
+    Runs discrete_consensus_sim_complete() (control function version) for many initial conditions at once.
+
+    The B batch elements are stacked side by side into an (N, B * d) array, so that each step
+    of the whole batch is a single sparse-dense product with the adjacency matrix of G.
+    Batch elements stop moving as soon as they have converged.
+
+    The disagreement of a state x is the largest absolute value of the local errors
+    `sum_j (x_j - x_i) - deg(i) * offsets_i` over all agents i and dimensions,
+    i.e. the control function u_k divided by epsilon : it is zero when the agents have reached
+    consensus (or the requested formation).
+
+    Parameters:
+        - G: Graph to consider for the agents
+        - X0s: Initial states, of shape (B, N, d)
+        - epsilons: Step size, either a single value or one value per batch element (B,)
+        - (Optional) offsets: Relative offsets, either shared (N, d) or one per batch element (B, N, d)
+        - steps: Maximum number of steps to perform
+        - tol: Disagreement below which a batch element is considered converged
+        - chunk_size: Number of batch elements simulated together, to bound memory usage
+    Returns:
+        A BatchResult
+    """
+    X0s = np.asarray(X0s, dtype=float)
+    if X0s.ndim != 3:
+        raise ValueError(f"X0s must be of shape (B, N, d), got {X0s.shape}")
+    B, N, d = X0s.shape
+    epsilons = np.broadcast_to(np.asarray(epsilons, dtype=float), (B,))
+    if offsets is not None:
+        offsets = np.broadcast_to(np.asarray(offsets, dtype=float), (B, N, d))
+
+    op = get_operator(G, weight=None)  # edge weights are ignored, as in discrete_consensus_cfunc()
+    converged_step = np.full(B, -1)
+    disagreement = np.empty(B)
+    final = np.empty((B, N, d))
+
+    for start in range(0, B, chunk_size):
+        batch = slice(start, min(start + chunk_size, B))
+        b = batch.stop - batch.start
+
+        # (b, N, d) -> (N, b * d) : column block j holds batch element j
+        X = X0s[batch].transpose(1, 0, 2).reshape(N, b * d).copy()
+        eps = np.repeat(epsilons[batch], d)
+        offset_term = 0. if offsets is None else (
+            op.out_degree[:, np.newaxis] * offsets[batch].transpose(1, 0, 2).reshape(N, b * d))
+        conv = converged_step[batch]  # view, updated in-place
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            for k in range(steps + 1):
+                E = op.laplacian_dot(X) + offset_term  # local errors, u_k = -epsilon * E
+                residual = np.abs(E).reshape(N, b, d).max(axis=(0, 2))
+                newly_converged = (residual < tol) & (conv < 0)
+                if newly_converged.any():
+                    conv[newly_converged] = k
+                    eps[np.repeat(newly_converged, d)] = 0.  # freeze converged elements
+                if k == steps or np.all(conv >= 0):
+                    break
+                X -= eps * E
+
+        disagreement[batch] = residual
+        final[batch] = X.reshape(N, b, d).transpose(1, 0, 2)
+
+    return BatchResult(converged_step, disagreement, final)
@@ -0,0 +1,310 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from cvxopt import matrix, solvers
+
+from src.cbf import cbf_constraints, obstacle_arrays, project_halfplanes
+
+READY_TIMEOUT = 30.
+"""Time allowed to the workers of a CBFWorkerPool to start (attach to the shared memory, first solve), in seconds"""
+
+
+def pack_obstacles(obstacle_lists):
+    """
+    Converts one list of `Obstacle` per robot into compact arrays, as expected by CBFWorkerPool.solve()
+    Returns:
+        Tuple (centers of shape (R, M, 2), radii of shape (R, M), counts of shape (R,)),
+        M being the largest number of obstacles of a robot
+    """
+    R = len(obstacle_lists)
+    counts = np.array([len(obs) for obs in obstacle_lists], dtype=int)
+    M = int(counts.max(initial=0))
+    centers = np.zeros((R, M, 2))
+    radii = np.zeros((R, M))
+    for i, obs in enumerate(obstacle_lists):
+        if counts[i] > 0:
+            centers[i, :counts[i]], radii[i, :counts[i]] = obstacle_arrays(obs)
+    return centers, radii, counts
+
+
+def team_obstacles(positions: np.ndarray, obstacles: np.ndarray, radius: float, sensing_radius: float = None):
+    """
+    Obstacles of each robot of a team, as expected by CBFWorkerPool.solve() : the other robots of the team
+    and the other `obstacles`, as in team_cbf().
+    Parameters:
+        - positions: (R, 2) positions of the robots
+        - obstacles: (K, 2) positions of the other obstacles
+        - radius: Radius of all obstacles
+        - (Optional) sensing_radius: Obstacles further than this distance from a robot are left out
+    Returns:
+        Tuple (centers, radii, counts), see pack_obstacles()
+    """
+    R = len(positions)
+    everything = np.vstack((positions, np.reshape(obstacles, (-1, 2))))
+    keep = np.ones((R, len(everything)), dtype=bool)
+    keep[np.arange(R), np.arange(R)] = False  # a robot is not an obstacle to itself
+    if sensing_radius is not None:
+        d_sq = np.sum((everything[np.newaxis] - positions[:, np.newaxis]) ** 2, axis=2)
+        keep &= d_sq <= sensing_radius ** 2
+    counts = keep.sum(axis=1)
+    M = int(counts.max(initial=0))
+    # kept obstacles first in each row, in their original order
+    order = np.argsort(~keep, axis=1, kind='stable')[:, :M]
+    centers = np.where((np.arange(M) < counts[:, np.newaxis])[:, :, np.newaxis], everything[order], 0.)
+    return centers, np.full((R, M), float(radius)), counts
+
+
+class _SharedArrays:
+    """Set of NumPy arrays stored in shared memory, that can be attached to from another process"""
+
+    def __init__(self, specs: dict, names: dict = None):
+        """
+        Args:
+            specs: dict[name, (shape, dtype)] of the arrays
+            names: dict[name, shared memory name] to attach to existing arrays, or None to create them
+        """
+        self.specs = specs
+        self._blocks = {}
+        self.arrays = {}
+        for key, (shape, dtype) in specs.items():
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = SharedMemory(create=names is None, size=size, name=None if names is None else names[key])
+            self._blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    @property
+    def names(self):
+        return {key: block.name for key, block in self._blocks.items()}
+
+    def close(self, unlink: bool = False):
+        self.arrays.clear()
+        for block in self._blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+
+
+def _worker(specs: dict, names: dict, alpha: float, method: str, tasks: mp.Queue, results: mp.Queue):
+    """
+    Worker process : solves the QP of the robots sent through `tasks`, reading their data in shared memory.
+    Sends back (tick, robot, queue time, solve time, safe velocity or None) through `results`.
+    """
+    shared = _SharedArrays(specs, names)
+    a = shared.arrays
+    options = {'show_progress': False}
+    P = matrix(2 * np.identity(2))
+    # the first cvxopt solve is much slower than the next ones, do it before the first tick
+    solvers.qp(P, matrix(np.zeros(2)), matrix(np.identity(2)), matrix(np.ones(2)), options=options)
+    results.put(None)  # ready
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        tick, robot, sent = task
+        start = time.monotonic()
+        if tick != a['tick'][0]:
+            # a newer tick has started, do not waste time on this one
+            results.put((tick, robot, start - sent, 0., None))
+            continue
+
+        m = a['counts'][robot]
+        v_nom = a['v_nom'][robot].copy()
+        G, h = cbf_constraints(a['positions'][robot], a['centers'][robot, :m], a['radii'][robot, :m], alpha)
+        if method == 'exact':
+            v, feasible = project_halfplanes(v_nom, G, h)
+        else:
+            sol = solvers.qp(P, matrix(-2. * v_nom), matrix(G), matrix(h), options=options)
+            v, feasible = np.array(sol['x']).ravel(), sol['status'] == 'optimal'
+        results.put((tick, robot, start - sent, time.monotonic() - start, v if feasible else None))
+    shared.close()
+
+
+class PoolStats:
+    """Instrumentation of CBFWorkerPool : time spent by the tasks in the queue and being solved"""
+
+    def __init__(self):
+        self.queue_times = []
+        """Time between sending a task and a worker starting it, in seconds"""
+        self.solve_times = []
+        """Time spent by a worker solving a QP, in seconds"""
+        self.ticks = 0
+        self.misses = 0
+        """Number of robots that did not get their solution before the deadline"""
+        self.infeasible = 0
+        self.unsafe_last = 0
+        """Number of last safe velocities replaced by zero (fallback 'last'), as they violate the current constraints"""
+
+    def summary(self):
+        """Dictionary of the main statistics, times being in milliseconds"""
+        def percentiles(values):
+            if not values:
+                return {'mean': np.nan, 'p50': np.nan, 'p99': np.nan}
+            v = 1e3 * np.asarray(values)
+            return {'mean': float(v.mean()), 'p50': float(np.percentile(v, 50)), 'p99': float(np.percentile(v, 99))}
+
+        return {
+            'ticks': self.ticks,
+            'misses': self.misses,
+            'infeasible': self.infeasible,
+            'unsafe_last': self.unsafe_last,
+            'queue_ms': percentiles(self.queue_times),
+            'solve_ms': percentiles(self.solve_times),
+        }
+
+
+class CBFWorkerPool:
+    """
+    Persistent pool of worker processes solving the ZCBF-QP of zeroing_cbf() for a team of robots.
+
+    The data of each tick (positions, nominal velocities and obstacles) is written in shared memory,
+    and workers only receive the index of the robot to solve : no cvxopt matrix is pickled.
+    Solutions are collected until the deadline. Robots that did not get a solution in time
+    (or whose QP is infeasible) get a fallback velocity instead.
+
+    Use it as a context manager, or call close() to stop the workers.
+    """
+
+    def __init__(self, alpha: float, max_robots: int = 64, max_obstacles: int = 128, workers: int = None,
+                 method: str = 'cvxopt', fallback: str = 'zero'):
+        """
+        Args:
+            alpha: ZCBF parameter applied to all obstacles
+            max_robots: Maximum number of robots solved per tick
+            max_obstacles: Maximum number of obstacles per robot
+            workers: Number of worker processes, defaults to the number of CPUs
+            method: 'cvxopt' or 'exact', see zeroing_cbf()
+            fallback: Velocity given to robots without a solution :
+                'zero' (stop the robot) or 'last' (last safe velocity computed for this robot, if it still satisfies
+                the constraints of the current positions, zero otherwise)
+        Raises:
+            RuntimeError if a worker exits, or all workers are not ready within READY_TIMEOUT
+        """
+        if alpha <= 0.:
+            raise ValueError("alpha must be > 0.")
+        if method not in ('cvxopt', 'exact'):
+            raise ValueError(f"Unknown method '{method}', expected 'cvxopt' or 'exact'")
+        if fallback not in ('zero', 'last'):
+            raise ValueError(f"Unknown fallback '{fallback}', expected 'zero' or 'last'")
+        self.fallback = fallback
+        self.alpha = alpha
+        self.stats = PoolStats()
+        self._tick = 0
+        self._last = np.zeros((max_robots, 2))
+
+        specs = {
+            'tick': ((1,), np.int64),
+            'positions': ((max_robots, 2), np.float64),
+            'v_nom': ((max_robots, 2), np.float64),
+            'centers': ((max_robots, max_obstacles, 2), np.float64),
+            'radii': ((max_robots, max_obstacles), np.float64),
+            'counts': ((max_robots,), np.int64),
+        }
+        self._shared = _SharedArrays(specs)
+        self._shared.arrays['tick'][0] = 0
+        self._tasks = mp.Queue()
+        self._results = mp.Queue()
+        self._workers = [mp.Process(target=_worker, daemon=True,
+                                    args=(specs, self._shared.names, alpha, method, self._tasks, self._results))
+                         for _ in range(workers or mp.cpu_count())]
+        for w in self._workers:
+            w.start()
+        # wait for all workers to be attached to the shared memory, so that the first tick is not missed
+        ready = 0
+        end = time.monotonic() + READY_TIMEOUT
+        while ready < len(self._workers):
+            try:
+                self._results.get(timeout=min(0.5, max(0., end - time.monotonic())))
+                ready += 1
+            except queue.Empty:
+                dead = [w.pid for w in self._workers if not w.is_alive()]
+                if dead or time.monotonic() >= end:
+                    self.close()
+                    reason = f"workers {dead} exited" if dead else f"timeout after {READY_TIMEOUT} s"
+                    raise RuntimeError(f"CBF workers not ready ({ready}/{len(self._workers)}, {reason})")
+
+    def solve(self, positions: np.ndarray, v_nom: np.ndarray, centers: np.ndarray, radii: np.ndarray,
+              counts: np.ndarray, deadline: float):
+        """
+        Solves the QP of R robots in parallel.
+        Parameters:
+            - positions: (R, 2) positions of the robots
+            - v_nom: (R, 2) nominal velocities
+            - centers, radii, counts: Obstacles of each robot, see pack_obstacles()
+            - deadline: Time allowed to solve all QPs, in seconds
+        Returns:
+            (R, 2) safe velocities
+        """
+        a = self._shared.arrays
+        R = len(positions)
+        m = centers.shape[1]
+        if R > len(a['positions']) or m > a['centers'].shape[1]:
+            raise ValueError(f"Pool sized for {len(a['positions'])} robots and {a['centers'].shape[1]} obstacles, "
+                             f"got {R} robots and {m} obstacles")
+
+        self._tick += 1
+        a['positions'][:R] = positions
+        a['v_nom'][:R] = v_nom
+        a['centers'][:R, :m] = centers
+        a['radii'][:R, :m] = radii
+        a['counts'][:R] = counts
+        a['tick'][0] = self._tick
+
+        sent = time.monotonic()
+        end = sent + deadline
+        for robot in range(R):
+            self._tasks.put((self._tick, robot, sent))
+
+        v_safe = np.zeros((R, 2))
+        solved = np.zeros(R, dtype=bool)
+        pending = R
+        while pending > 0:
+            remaining = end - time.monotonic()
+            if remaining <= 0.:
+                break
+            try:
+                tick, robot, queue_time, solve_time, v = self._results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if tick != self._tick:
+                continue  # late result of a previous tick
+            pending -= 1
+            self.stats.queue_times.append(queue_time)
+            if v is None:
+                self.stats.infeasible += 1
+                continue
+            self.stats.solve_times.append(solve_time)
+            v_safe[robot] = v
+            solved[robot] = True
+            self._last[robot] = v
+
+        if self.fallback == 'last':
+            # the last velocity was computed for older positions : only keep it if it is still safe
+            for robot in np.flatnonzero(~solved):
+                m = counts[robot]
+                G, h = cbf_constraints(positions[robot], centers[robot, :m], radii[robot, :m], self.alpha)
+                if np.all(G @ self._last[robot] <= h + 1e-9):
+                    v_safe[robot] = self._last[robot]
+                else:
+                    self.stats.unsafe_last += 1
+        self.stats.ticks += 1
+        self.stats.misses += pending
+        return v_safe
+
+    def close(self):
+        """Stops the workers and releases the shared memory"""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for w in self._workers:
+            w.join(timeout=1.)
+            if w.is_alive():
+                w.terminate()
+        self._shared.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,165 @@
+import bisect
+import csv
+import json
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+import numpy as np
+
+HISTOGRAM_EDGES = list(np.logspace(-6, 0, 61))
+"""Edges of the bins of the timing histograms, in seconds : 10 bins per decade from 1 µs to 1 s"""
+
+FRAME_BUDGET = 1. / 60.
+"""Default time budget of a control tick, in seconds (grSim vision runs at 60 Hz)"""
+
+_NULL_STAGE = nullcontext()
+
+
+class TimingHistogram:
+    """Streaming histogram of durations, with log-spaced bins (see HISTOGRAM_EDGES)"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.counts = [0] * (len(HISTOGRAM_EDGES) + 1)
+        """counts[0] is below the first edge, counts[-1] above the last one"""
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.over_budget = 0
+
+    def add(self, seconds: float):
+        self.counts[bisect.bisect_right(HISTOGRAM_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds > self.budget:
+            self.over_budget += 1
+
+    def percentile(self, q: float):
+        """Upper edge of the bin holding the q-th percentile (0 <= q <= 100), in seconds"""
+        if self.count == 0:
+            return np.nan
+        rank = np.searchsorted(np.cumsum(self.counts), q / 100. * self.count)
+        return min(HISTOGRAM_EDGES[rank] if rank < len(HISTOGRAM_EDGES) else np.inf, self.max)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_ms': 1e3 * self.total / self.count if self.count else np.nan,
+            'p50_ms': 1e3 * self.percentile(50),
+            'p99_ms': 1e3 * self.percentile(99),
+            'max_ms': 1e3 * self.max,
+            'over_budget': self.over_budget,
+        }
+
+
+class _Stage:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: TimingHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_):
+        self.histogram.add(time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Per-stage timers of the control tick.
+
+    Code to profile is wrapped in `with PROFILER.stage('name'):` blocks, and discrete values
+    (e.g. QP iterations) are recorded with `PROFILER.count('name', value)`.
+    When the profiler is disabled, stage() returns a shared no-op context manager and count() returns immediately.
+
+    Stages recorded by the modules of this repository :
+        - tick: Whole `velocity_orders` callback of formation.py / cbf.py
+        - consensus: Consensus control function
+        - obstacles: Building the obstacles from `teams_data`
+        - qp_build: Building the constraints of the CBF QPs
+        - qp_solve: Solving the CBF QPs (cvxopt or exact solver)
+    and the counter `qp_iterations` (cvxopt iterations of each QP).
+    """
+
+    def __init__(self, enabled: bool = False, budget: float = FRAME_BUDGET):
+        """
+        Args:
+            enabled: Whether timings are recorded
+            budget: Time budget of a tick, the number of samples above it is reported for each stage
+        """
+        self.enabled = enabled
+        self.budget = budget
+        self.timings = {}
+        """dict[stage, TimingHistogram]"""
+        self.counters = {}
+        """dict[name, Counter of values]"""
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.timings.clear()
+        self.counters.clear()
+
+    def stage(self, name: str):
+        """Context manager timing the code of stage `name`"""
+        if not self.enabled:
+            return _NULL_STAGE
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = TimingHistogram(self.budget)
+        return _Stage(histogram)
+
+    def count(self, name: str, value: int):
+        """Records a discrete value, e.g. the number of iterations of a solver"""
+        if not self.enabled:
+            return
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter()
+        counter[int(value)] += 1
+
+    def summary(self):
+        """Dictionary of the statistics of all stages and counters, times being in milliseconds"""
+        return {
+            'budget_ms': 1e3 * self.budget,
+            'stages': {name: h.summary() for name, h in self.timings.items()},
+            'counters': {name: {'mean': sum(v * n for v, n in c.items()) / sum(c.values()), 'max': max(c),
+                                'values': dict(sorted(c.items()))}
+                         for name, c in self.counters.items()},
+        }
+
+    def to_json(self, path: str):
+        """Writes the summary and the histograms of all stages to a JSON file"""
+        data = self.summary()
+        data['histogram_edges_s'] = HISTOGRAM_EDGES
+        for name, h in self.timings.items():
+            data['stages'][name]['histogram'] = h.counts
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, default=float)
+
+    def to_csv(self, path: str):
+        """
+        Writes the histograms to a CSV file, one row per non-empty bin : kind, name, low, high, count.
+        Timing bins are in seconds, counter bins hold a single value (low = high).
+        """
+        edges = [0.] + HISTOGRAM_EDGES + [np.inf]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'low', 'high', 'count'])
+            for name, h in self.timings.items():
+                for i, n in enumerate(h.counts):
+                    if n > 0:
+                        writer.writerow(['timing', name, edges[i], edges[i + 1], n])
+            for name, c in self.counters.items():
+                for value, n in sorted(c.items()):
+                    writer.writerow(['counter', name, value, value, n])
+
+
+PROFILER = Profiler()
+"""Profiler used by the modules of this repository, disabled by default (call PROFILER.enable())"""
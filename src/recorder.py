@@ -0,0 +1,240 @@
+import json
+import os
+import struct
+import time
+from collections import namedtuple
+
+import networkx as nx
+import numpy as np
+
+from src.consensus_operator import ConsensusOperator
+from src.convergence import achievement as agent_achievement
+
+FORMAT_VERSION = 1
+"""Version of the layout of the run directories written by RunRecorder"""
+
+HEADER_SIZE = 128
+"""
+Size of the header of the .npy files written by NpyAppender, in bytes.
+The header is padded to this fixed size, so that its shape can be rewritten in place as rows are appended.
+"""
+
+CHUNK_ROWS = 1024
+"""Default number of rows by which the .npy files are extended (and mapped in memory) at once"""
+
+FLUSH_EVERY = 60
+"""Default number of ticks between two flushes of a RunRecorder (1 s at 60 Hz)"""
+
+Run = namedtuple('Run', ['positions', 'commands', 'achievement', 'params', 'meta'])
+"""
+Run recorded by RunRecorder, see open_run() :
+    - positions: (T, N, d) Positions of the agents on every tick
+    - commands: (T, N, d) Commands applied on every tick, or None if they were not recorded
+    - achievement: (T, N) Achievement of every agent on every tick (see src.convergence.achievement()),
+      or None if it was not recorded
+    - params: Parameters of the run (epsilon, alpha, offsets, graph edges...)
+    - meta: Metadata of the recording (format version, number of ticks, whether it was closed properly...)
+"""
+
+
+def _npy_header(shape: tuple, dtype: np.dtype):
+    """Header of a (version 1.0) .npy file of an array of `shape`, padded to HEADER_SIZE bytes"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': shape})
+    header = header.encode('latin1')
+    padding = HEADER_SIZE - len(np.lib.format.MAGIC_PREFIX) - 4 - len(header) - 1
+    if padding < 0:
+        raise ValueError(f"Shape {shape} does not fit in a {HEADER_SIZE} bytes .npy header")
+    header += b' ' * padding + b'\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack('<H', len(header)) + header
+
+
+class NpyAppender:
+    """
+    .npy file of shape (T, *row_shape) written one row at a time, T growing as rows are appended.
+
+    The file is extended by chunks of `chunk` rows, and only the chunk being written is mapped in memory,
+    so that memory usage does not depend on the number of rows.
+    The shape in the header is updated on every flush() : if the program crashes, the file can still be
+    loaded with np.load(), and holds all the rows appended until the last flush.
+    """
+
+    def __init__(self, path: str, row_shape: tuple, dtype=np.float64, chunk: int = CHUNK_ROWS):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk = chunk
+        self.rows = 0
+        self._row_bytes = self.dtype.itemsize * int(np.prod(self.row_shape, dtype=int))
+        self._file = open(path, 'wb+')
+        self._file.write(_npy_header((0, *self.row_shape), self.dtype))
+        self._map = None
+        self._map_start = 0
+
+    def _map_chunk(self, start: int):
+        """Extends the file to hold rows [start, start + chunk) and maps them"""
+        if self._map is not None:
+            self._map.flush()
+        self._file.truncate(HEADER_SIZE + (start + self.chunk) * self._row_bytes)
+        self._map = np.memmap(self._file, dtype=self.dtype, mode='r+', offset=HEADER_SIZE + start * self._row_bytes,
+                              shape=(self.chunk, *self.row_shape))
+        self._map_start = start
+
+    def append(self, row: np.ndarray):
+        if self._map is None or self.rows - self._map_start >= self.chunk:
+            self._map_chunk(self.rows)
+        self._map[self.rows - self._map_start] = row
+        self.rows += 1
+
+    def flush(self, sync: bool = False):
+        """Writes the mapped rows to the file and updates the shape of the header"""
+        if self._map is not None:
+            self._map.flush()
+        self._file.seek(0)
+        self._file.write(_npy_header((self.rows, *self.row_shape), self.dtype))
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """Flushes the file and removes the unused rows of the last chunk"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._map = None
+        self._file.truncate(HEADER_SIZE + self.rows * self._row_bytes)
+        self._file.close()
+
+
+def _to_json(value):
+    """Converts the parameters of a run to JSON values (arrays to lists, graphs to their edges)"""
+    if isinstance(value, nx.Graph):
+        return {'nodes': value.number_of_nodes(), 'edges': [list(e) for e in value.edges]}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+class RunRecorder:
+    """
+    Records a run tick by tick into a directory, with constant memory usage :
+        - positions.npy: (T, N, d) positions of the agents
+        - commands.npy: (T, N, d) commands applied (e.g. velocities or consensus control u_k)
+        - achievement.npy: (T, N) achievement of every agent (see src.convergence.achievement(),
+          which is the definition of the datasets of `src/data/`)
+        - meta.json: parameters of the run, and metadata of the recording
+
+    All .npy files can be loaded with np.load() (use mmap_mode='r' for long runs), or with open_run().
+    meta.json is rewritten on every flush : after a crash, it holds the number of ticks saved (`ticks`)
+    and `complete` is False.
+    """
+
+    def __init__(self, path: str, n: int, d: int = 2, G: nx.DiGraph = None, offsets: np.ndarray = None,
+                 params: dict = None, commands: bool = True, chunk: int = CHUNK_ROWS, flush_every: int = FLUSH_EVERY):
+        """
+        Args:
+            path: Directory of the run, created if needed (existing files are overwritten)
+            n: Number of agents
+            d: Dimension of the positions
+            G: (Optional) Graph of the agents. Saved in the parameters, and used to compute the achievement
+                of every tick when it is not given to append()
+            offsets: (Optional) Relative offsets (N, d), see discrete_consensus_cfunc()
+            params: (Optional) Other parameters of the run (epsilon, alpha, ...), saved in meta.json
+            commands: Whether commands are recorded
+            chunk: Number of rows by which the files are extended at once
+            flush_every: Number of ticks between two flushes, 0 only flushes on close()
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.n = n
+        self.d = d
+        self.flush_every = flush_every
+        self.offsets = None if offsets is None else np.reshape(offsets, (n, d)).astype(float)
+        self._op = None if G is None else ConsensusOperator(G)
+        self.params = {'n': n, 'd': d, 'graph': G, 'offsets': self.offsets, **(params or {})}
+        self.positions = NpyAppender(os.path.join(path, 'positions.npy'), (n, d), chunk=chunk)
+        self.commands = NpyAppender(os.path.join(path, 'commands.npy'), (n, d), chunk=chunk) if commands else None
+        self.achievement = NpyAppender(os.path.join(path, 'achievement.npy'), (n,), chunk=chunk)
+        self.created = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.ticks = 0
+        self._write_meta(complete=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _files(self):
+        return [f for f in (self.positions, self.commands, self.achievement) if f is not None]
+
+    def _write_meta(self, complete: bool):
+        meta = {
+            'version': FORMAT_VERSION,
+            'created': self.created,
+            'ticks': self.ticks,
+            'complete': complete,
+            'files': {name: os.path.basename(f.path) for name, f in
+                      (('positions', self.positions), ('commands', self.commands), ('achievement', self.achievement))
+                      if f is not None},
+            'params': _to_json(self.params),
+        }
+        # written to a temporary file first, so that meta.json is never left half-written
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def append(self, positions: np.ndarray, commands: np.ndarray = None, achievement: np.ndarray = None):
+        """
+        Records one tick.
+        Args:
+            positions: Positions of the agents (N, d)
+            commands: (Optional) Commands applied on this tick (N, d), zero if not given
+            achievement: (Optional) Achievement of every agent (N,), as defined by src.convergence.achievement().
+                Computed from the graph if not given, NaN if the recorder has no graph
+        """
+        positions = np.reshape(positions, (self.n, self.d))
+        if achievement is None:
+            achievement = (np.full(self.n, np.nan) if self._op is None
+                           else agent_achievement(self._op, positions[np.newaxis], self.offsets)[0])
+        self.positions.append(positions)
+        self.achievement.append(achievement)
+        if self.commands is not None:
+            self.commands.append(0. if commands is None else np.reshape(commands, (self.n, self.d)))
+        self.ticks += 1
+        if self.flush_every > 0 and self.ticks % self.flush_every == 0:
+            self.flush()
+
+    def flush(self, sync: bool = False):
+        """Makes the ticks recorded so far readable (see NpyAppender.flush()), `sync` also waits for the disk"""
+        for f in self._files():
+            f.flush(sync)
+        self._write_meta(complete=False)
+
+    def close(self):
+        for f in self._files():
+            f.close()
+        self._write_meta(complete=True)
+
+
+def open_run(path: str, mmap: bool = True):
+    """
+    Opens a run recorded by RunRecorder. With `mmap`, arrays are memory-mapped (read-only) instead of loaded.
+    Runs that were not closed properly are truncated to the ticks saved at their last flush.
+    Returns:
+        A Run
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    arrays = {}
+    for name in ('positions', 'commands', 'achievement'):
+        file = meta['files'].get(name)
+        arrays[name] = None if file is None else np.load(os.path.join(path, file), mmap_mode=mode)[:meta['ticks']]
+    return Run(params=meta['params'], meta=meta, **arrays)
@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from src.headless import DEFAULT_DT, HeadlessController
+
+
+class LatestFrame:
+    """
+    Single-slot mailbox between the vision reader and the controller : only the most recent frame is kept,
+    frames that were replaced before being read are counted as dropped.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (time.monotonic(), frame)
+        self.received += 1
+        self._event.set()
+
+    async def get(self):
+        """Waits for a new frame, returns (reception time, frame)"""
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class RuntimeStats:
+    """Counters of ControlRuntime"""
+
+    def __init__(self):
+        self.sends = 0
+        self.repeated = 0
+        """Sends of orders already sent, because no new frame was processed in time"""
+        self.stale = 0
+        """Sends replaced by a stop order, because the latest orders were computed from a frame older than max_age"""
+        self.overruns = 0
+        """Computations of orders longer than the period"""
+        self.compute_times = []
+        self.jitter = []
+        """Delay between the scheduled time of each send and the time it actually happened, in seconds"""
+        self.ages = []
+        """Age of the frame the sent orders were computed from, in seconds"""
+
+    def summary(self, frames: LatestFrame = None):
+        """Dictionary of the counters, times being in milliseconds"""
+        def percentiles(values):
+            if not values:
+                return {'mean': np.nan, 'p99': np.nan, 'max': np.nan}
+            v = 1e3 * np.asarray(values)
+            return {'mean': float(v.mean()), 'p99': float(np.percentile(v, 99)), 'max': float(v.max())}
+
+        summary = {
+            'sends': self.sends,
+            'repeated': self.repeated,
+            'stale': self.stale,
+            'overruns': self.overruns,
+            'compute_ms': percentiles(self.compute_times),
+            'jitter_ms': percentiles(self.jitter),
+            'age_ms': percentiles(self.ages),
+        }
+        if frames is not None:
+            summary['frames'] = frames.received
+            summary['dropped_frames'] = frames.dropped
+        return summary
+
+
+class ControlRuntime:
+    """
+    Asynchronous runtime around a `velocity_orders(teams_data)` callback (e.g. make_formation_orders()).
+
+    Three tasks run concurrently :
+        - Reading vision frames into a LatestFrame mailbox, so that the controller always uses the latest frame
+          and stale frames are dropped
+        - Computing the orders of the latest frame, in a worker thread so that reading and sending are not blocked
+        - Sending the latest orders on a fixed-rate schedule, whether or not new orders have been computed
+    """
+
+    def __init__(self, velocity_orders, period: float = DEFAULT_DT, max_age: float = None):
+        """
+        Args:
+            velocity_orders: Callback computing the orders dict[team, dict[robot_id, velocity]] of a frame
+            period: Period of the sends, in seconds
+            max_age: (Optional) Orders computed from a frame older than this (in seconds) are not sent anymore,
+                an empty order (stopping the robots) is sent instead
+        """
+        self.velocity_orders = velocity_orders
+        self.period = period
+        self.max_age = max_age
+        self.frames = None
+        self.stats = RuntimeStats()
+        self._orders = None
+        self._last_sent = None
+        self._background = None  # (loop, thread, task) of as_callback()
+
+    async def _read(self, frames):
+        async for frame in frames:
+            self.frames.put(frame)
+
+    async def _compute(self, in_executor: bool = True):
+        loop = asyncio.get_running_loop()
+        while True:
+            stamp, frame = await self.frames.get()
+            start = time.monotonic()
+            if in_executor:
+                orders = await loop.run_in_executor(None, self.velocity_orders, frame)
+            else:
+                orders = self.velocity_orders(frame)
+            duration = time.monotonic() - start
+            self.stats.compute_times.append(duration)
+            if duration > self.period:
+                self.stats.overruns += 1
+            self._orders = (stamp, orders)
+
+    def _next_orders(self):
+        """Orders to send now, updating the counters"""
+        if self._orders is None:
+            return {}
+        stamp, orders = self._orders
+        age = time.monotonic() - stamp
+        self.stats.sends += 1
+        self.stats.ages.append(age)
+        if stamp == self._last_sent:
+            self.stats.repeated += 1
+        self._last_sent = stamp
+        if self.max_age is not None and age > self.max_age:
+            self.stats.stale += 1
+            return {}
+        return orders
+
+    async def run(self, frames, send, duration: float = -1):
+        """
+        Runs the control loop.
+        Args:
+            frames: Asynchronous iterator of vision frames (teams_data)
+            send: Function sending the orders dict[team, dict[robot_id, velocity]] to the robots
+            duration: Time to run, in seconds. -1 runs until cancelled
+        """
+        self.frames = LatestFrame()
+        loop = asyncio.get_running_loop()
+        tasks = [asyncio.create_task(self._read(frames)), asyncio.create_task(self._compute())]
+        try:
+            start = loop.time()
+            k = 0
+            while duration < 0 or k * self.period < duration:
+                k += 1
+                scheduled = start + k * self.period
+                await asyncio.sleep(max(0., scheduled - loop.time()))
+                self.stats.jitter.append(loop.time() - scheduled)
+                for task in tasks:
+                    if task.done():
+                        task.result()  # raises the exception of a failed reader or controller
+                send(self._next_orders())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def as_callback(self):
+        """
+        Synchronous `velocity_orders` callback for `Controller.run()` of ssl_traj :
+        frames are handed to the controller running in a background thread, and the callback
+        immediately returns the latest orders computed, so that it never blocks the simulator loop.
+        The sending rate is then the one of the Controller.
+
+        The background thread runs until close() is called (or the end of the `with` block of the runtime).
+        Calling as_callback() again stops the thread of the previous callback.
+        """
+        self.close()
+        self.frames = LatestFrame()
+        loop = asyncio.new_event_loop()
+        # the loop has its own thread, the controller does not need to run in an executor
+        task = loop.create_task(self._compute(in_executor=False))
+
+        def run_loop():
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run_loop, daemon=True)
+        thread.start()
+        self._background = (loop, thread, task)
+
+        def velocity_orders(teams_data):
+            loop.call_soon_threadsafe(self.frames.put, teams_data)
+            return self._next_orders()
+
+        return velocity_orders
+
+    def close(self, timeout: float = 1.):
+        """
+        Stops the background thread started by as_callback() and closes its event loop.
+        Raises:
+            RuntimeError if the thread is still computing orders after `timeout` seconds
+        """
+        if self._background is None:
+            return
+        loop, thread, task = self._background
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(task.cancel)
+        thread.join(timeout)
+        if thread.is_alive():
+            raise RuntimeError(f"Controller thread still running after {timeout} s")
+        loop.close()
+        self._background = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def summary(self):
+        return self.stats.summary(self.frames)
+
+
+def run_headless(velocity_orders, duration: float, controller: HeadlessController = None, period: float = None,
+                 max_age: float = None):
+    """
+    Runs a ControlRuntime against a HeadlessController advancing in real time :
+    every `controller.dt`, the simulator applies the last orders sent and publishes a new frame.
+    Returns:
+        The ControlRuntime, holding the statistics of the run (see ControlRuntime.summary())
+    """
+    controller = HeadlessController() if controller is None else controller
+    runtime = ControlRuntime(velocity_orders, controller.dt if period is None else period, max_age)
+    sent = {}
+
+    def send(orders):
+        nonlocal sent
+        sent = orders
+
+    async def frames():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        k = 0
+        while True:
+            yield controller.teams_data
+            k += 1
+            await asyncio.sleep(max(0., start + k * controller.dt - loop.time()))
+            controller.advance(sent)
+
+    asyncio.run(runtime.run(frames(), send, duration))
+    return runtime
+
+
+if __name__ == '__main__':
+    """
+    Runs the formation controller of formation.py for 5 seconds against the headless simulator,
+    and prints the counters of the runtime.
+    """
+    import networkx as nx
+
+    from src.formation import make_formation_orders
+
+    G = nx.DiGraph()
+    G.add_edges_from([(0, 1), (1, 2), (2, 3), (3, 0)])
+    square = np.array([(1, 1), (1, -1), (-1, -1), (-1, 1)])
+    runtime = run_headless(make_formation_orders(G, square), duration=5.)
+    print(runtime.summary())
@@ -0,0 +1,69 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from src.cbf import Obstacle
+
+
+def sensing_radius(v_max: float, alpha: float, r: float, dt: float = 0., obstacle_speed: float = None):
+    """
+    Distance beyond which an obstacle can never make the ZCBF-QP of zeroing_cbf() active.
+
+    The constraint of an obstacle at distance d is `(o - p) @ v <= (alpha / 2) * (d² - r²)`, and `(o - p) @ v <= d * v_max`
+    for any velocity |v| <= v_max. It is therefore always satisfied when d * v_max <= (alpha / 2) * (d² - r²), i.e.
+        d >= (v_max + sqrt(v_max² + alpha² r²)) / alpha
+
+    Since the safe velocity is a projection of the nominal velocity on a convex set containing 0,
+    it is never faster than the nominal velocity : ignoring obstacles beyond this distance gives
+    exactly the same solution, as long as the nominal speed is below `v_max`.
+
+    Parameters:
+        - v_max: Maximum nominal speed of the robot
+        - alpha: ZCBF parameter
+        - r: Radius of the obstacles
+        - dt: Tick period. A margin is added for the distance travelled by the robot and the obstacle during a tick
+        - obstacle_speed: Maximum speed of the obstacles, defaults to `v_max`
+    """
+    if alpha <= 0.:
+        raise ValueError("alpha must be > 0.")
+    if obstacle_speed is None:
+        obstacle_speed = v_max
+    return (v_max + np.sqrt(v_max ** 2 + (alpha * r) ** 2)) / alpha + (v_max + obstacle_speed) * dt
+
+
+class ObstacleIndex:
+    """
+    Spatial index (KD-tree) over the obstacles of one frame, to only retrieve the obstacles close to a robot.
+    """
+
+    def __init__(self, centers: np.ndarray, radii: np.ndarray, keys: list = None):
+        """
+        Args:
+            centers: (M, 2) positions of the obstacles
+            radii: (M,) radii of the obstacles
+            keys: (Optional) Identifier of each obstacle, e.g. (team, robot_id)
+        """
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        self.radii = np.broadcast_to(np.asarray(radii, dtype=float), (len(self.centers),))
+        self.keys = keys if keys is not None else list(range(len(self.centers)))
+        self._tree = cKDTree(self.centers)
+
+    @classmethod
+    def from_teams_data(cls, teams_data, r: float = 0.3):
+        """Index of all robots of the field (as in grSim_obstacles_except()), each of radius r"""
+        keys = [(team, i) for team, robots in teams_data.items() for i, robot in robots.items() if robot is not None]
+        centers = np.array([teams_data[team][i].pos for team, i in keys], dtype=float).reshape(len(keys), 2)
+        return cls(centers, np.full(len(keys), r), keys)
+
+    def query(self, p: np.ndarray, radius: float):
+        """Indices of the obstacles whose center is within `radius` of `p`"""
+        return self._tree.query_ball_point(np.ravel(p), radius)
+
+    def obstacles_near(self, p: np.ndarray, radius: float, exclude=None):
+        """
+        List of `Obstacle` within `radius` of `p`, to be used with zeroing_cbf()
+        Args:
+            exclude: Key of an obstacle to ignore (e.g. the robot itself, as (team, robot_id))
+        """
+        return [Obstacle(self.centers[j], self.radii[j])
+                for j in sorted(self.query(p, radius))
+                if self.keys[j] != exclude]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from src.draw_formation import buttons, node_handler
+from src.formation_spec import load_spec, spec_reaches_consensus
+
+
+@pytest.fixture(autouse=True)
+def empty_drawing():
+    node_handler.clear()
+    yield
+    node_handler.clear()
+
+
+def test_export_after_delete(tmp_path):
+    a, b, c = (node_handler.create_node(coords) for coords in ((100, 100), (200, 100), (300, 300)))
+    node_handler.link(a, c)
+    node_handler.link(c, a)
+    node_handler.delete_node(b)
+    spec = buttons.export_spec(str(tmp_path / "formation.npz"))
+
+    world = np.array([buttons.convert_pygame_to_world(n.coords) for n in (a, c)])
+    assert spec.edges.tolist() == [[0, 1], [1, 0]]
+    np.testing.assert_allclose(spec.offsets, [world[1] - world[0], world[0] - world[1]])
+    np.testing.assert_allclose(load_spec(str(tmp_path / "formation.npz")).offsets, spec.offsets)
+
+
+def test_update_publishes_mean_offsets(tmp_path):
+    # node a has two neighbours : its offset is the mean of their relative positions, not their sum
+    a, b, c = (node_handler.create_node(coords) for coords in ((100, 100), (200, 100), (100, 300)))
+    node_handler.link(a, b)
+    node_handler.link(a, c)
+    node_handler.link(b, a)
+    node_handler.link(c, a)
+    spec = buttons.export_spec(str(tmp_path / "formation.npz"))
+    world = np.array([buttons.convert_pygame_to_world(n.coords) for n in (a, b, c)])
+    np.testing.assert_allclose(spec.offsets[0], ((world[1] - world[0]) + (world[2] - world[0])) / 2.)
+    assert spec_reaches_consensus(spec)
+
+
+def test_export_disconnected_drawing(tmp_path, capsys):
+    a, b, c = (node_handler.create_node(coords) for coords in ((100, 100), (200, 100), (300, 300)))
+    node_handler.link(a, b)
+    node_handler.link(b, a)
+    spec = buttons.export_spec(str(tmp_path / "formation.npz"))
+    assert "cannot reach consensus" in capsys.readouterr().out
+    assert np.isnan(load_spec(str(tmp_path / "formation.npz")).epsilon)
+    assert not spec_reaches_consensus(spec)
@@ -0,0 +1,241 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from cvxopt import matrix, solvers
+
+from src.cbf import (ObstacleSet, ZeroingCBFSolver, cbf_constraints, grSim_obstacles_except, project_halfplanes,
+                     team_cbf, zeroing_cbf)
+
+
+def test_team_cbf_stops_infeasible_robots():
+    # robot 0 is already inside the radius of two obstacles on both sides : no velocity satisfies both constraints
+    positions = np.array([[0., 0.], [2., 0.]])
+    v_nom = np.array([[1., 0.5], [1., 0.]])
+    obstacles = np.array([[0.1, 0.], [-0.1, 0.]])
+    v_safe, infeasible = team_cbf(positions, v_nom, alpha=1., radius=0.3, obstacles=obstacles,
+                                  return_infeasible=True)
+    assert infeasible.tolist() == [0]
+    np.testing.assert_array_equal(v_safe[0], 0.)
+    np.testing.assert_allclose(v_safe[1], v_nom[1])
+    np.testing.assert_array_equal(team_cbf(positions, v_nom, alpha=1., radius=0.3, obstacles=obstacles), v_safe)
+
+
+def test_obstacles_except_skips_missing_robots():
+    # robots not seen by the vision are None, in any team
+    robot = lambda x, y: SimpleNamespace(pos=np.array([x, y]))
+    teams_data = {'blue': {0: robot(0., 0.), 1: None, 2: robot(1., 0.)},
+                  'yellow': {0: robot(2., 0.), 1: None}}
+    obstacles = grSim_obstacles_except(teams_data, 0, 'blue')
+    assert sorted(np.ravel(o.xy).tolist() for o in obstacles) == [[1., 0.], [2., 0.]]
+
+
+def _closed_loop(solve, n_frames: int, n_obstacles: int, seed: int = 0):
+    """
+    Robot driven towards obstacles that drift slowly, with the safe velocity given by `solve(p, v_nom, centers)`,
+    as on consecutive frames of the controller. Yields (p, v_nom, centers, solution) for every frame.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-1., 1., (n_obstacles, 2)) + [1.5, 0.]
+    p = np.zeros(2)
+    for _ in range(n_frames):
+        v_nom = np.array([1., 0.]) + rng.normal(0., 0.1, 2)
+        centers = centers + rng.normal(0., 0.01, centers.shape)
+        sol = solve(p, v_nom, centers)
+        yield p.copy(), v_nom, centers, sol
+        p += 0.05 * np.array(sol['x']).ravel()
+
+
+def _assert_same_solution(warm, cold):
+    """Same QP solution, up to the accuracy of the interior-point solver of cvxopt"""
+    assert warm['status'] == cold['status'] == 'optimal'
+    np.testing.assert_allclose(warm['primal objective'], cold['primal objective'], rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(np.array(warm['x']), np.array(cold['x']), atol=1e-3)
+
+
+@pytest.mark.parametrize('n_obstacles', [1, 5, 40])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_warm_started_solver_matches_cold_solves(n_obstacles, seed):
+    # capacity 4 : the buffers also grow with 40 obstacles
+    solver = ZeroingCBFSolver(alpha=1., capacity=4)
+    frames = _closed_loop(lambda p, v_nom, centers: solver.solve(p, v_nom, ObstacleSet(centers, 0.3)),
+                          30, n_obstacles, seed)
+    for p, v_nom, centers, warm in frames:
+        _assert_same_solution(warm, zeroing_cbf(p, v_nom, 1., ObstacleSet(centers, 0.3)))
+
+
+def test_solver_after_obstacle_count_change_and_reset():
+    solver = ZeroingCBFSolver(alpha=1.)
+    frame = iter(range(30))
+
+    def solve(p, v_nom, centers):
+        k = next(frame)
+        if k == 15:
+            solver.reset()
+        # a robot leaves and comes back : the warm start of another number of obstacles is not used
+        return solver.solve(p, v_nom, ObstacleSet(centers[:5] if k % 3 == 1 else centers, 0.3))
+
+    for k, (p, v_nom, centers, warm) in enumerate(_closed_loop(solve, 30, 6, seed=1)):
+        _assert_same_solution(warm, zeroing_cbf(p, v_nom, 1., ObstacleSet(centers[:5] if k % 3 == 1 else centers, 0.3)))
+
+
+def _cvxopt_qp(v_nom, G, h):
+    """Reference solution of min ||v - v_nom||² s.t. G v <= h by cvxopt, None if it does not find one"""
+    try:
+        sol = solvers.qp(matrix(2 * np.identity(2)), matrix(-2. * np.asarray(v_nom, dtype=float)),
+                         matrix(np.asarray(G, dtype=float)), matrix(np.asarray(h, dtype=float)),
+                         options={'show_progress': False})
+    except ValueError:
+        # cvxopt fails on some infeasible problems instead of reporting them
+        return None
+    return np.array(sol['x']).ravel() if sol['status'] == 'optimal' else None
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_project_halfplanes_matches_cvxopt(seed):
+    # random half-planes all containing the point c, so that the QP is feasible
+    rng = np.random.default_rng(seed)
+    M = rng.integers(1, 12)
+    G = rng.normal(size=(M, 2))
+    c = rng.normal(size=2)
+    h = G @ c + rng.uniform(0., 1., M)
+    v_nom = rng.normal(0., 3., 2)
+    v, feasible = project_halfplanes(v_nom, G, h)
+    assert feasible
+    np.testing.assert_allclose(v, _cvxopt_qp(v_nom, G, h), atol=1e-4)
+
+
+@pytest.mark.parametrize('G, h', [
+    # v_x <= -1 and v_x >= 1
+    ([[1., 0.], [-1., 0.]], [-1., -1.]),
+    # three half-planes pointing away from each other
+    ([[1., 0.], [-0.5, 0.8], [-0.5, -0.8]], [-0.5, -0.5, -0.5]),
+    # feasible pair, then a constraint parallel to the first one
+    ([[1., 0.], [0., 1.], [-1., 0.]], [0., 0., -1.]),
+])
+def test_project_halfplanes_infeasible(G, h):
+    G, h = np.array(G), np.array(h)
+    _, feasible = project_halfplanes(np.array([2., 2.]), G, h)
+    assert not feasible
+    assert _cvxopt_qp(np.array([2., 2.]), G, h) is None
+
+
+def _separated_positions(rng, n: int, radius: float, size: float = 2.):
+    """n random positions at least `radius` apart from each other"""
+    positions = []
+    while len(positions) < n:
+        p = rng.uniform(-size, size, 2)
+        if all(np.linalg.norm(p - q) > radius for q in positions):
+            positions.append(p)
+    return np.array(positions)
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('sensing_radius', [None, 1.5])
+def test_team_cbf_matches_cvxopt(seed, sensing_radius):
+    rng = np.random.default_rng(seed)
+    R, K, radius = 6, 4, 0.3
+    everyone = _separated_positions(rng, R + K, radius)
+    positions, obstacles = everyone[:R], everyone[R:]
+    v_nom = rng.normal(0., 1.5, (R, 2))
+    v_safe = team_cbf(positions, v_nom, alpha=1., radius=radius, obstacles=obstacles,
+                      sensing_radius=sensing_radius)
+    for i in range(R):
+        others = np.delete(everyone, i, axis=0)
+        if sensing_radius is not None:
+            others = others[np.linalg.norm(others - positions[i], axis=1) <= sensing_radius]
+        if len(others) == 0:
+            np.testing.assert_allclose(v_safe[i], v_nom[i])
+            continue
+        G = others - positions[i]
+        h = 0.5 * (np.sum(G ** 2, axis=1) - radius ** 2)
+        np.testing.assert_allclose(v_safe[i], _cvxopt_qp(v_nom[i], G, h), atol=1e-4)
+
+
+def test_team_cbf_infeasible_like_cvxopt():
+    # robot 0 is squeezed between two robots of its team, robot 3 is free
+    positions = np.array([[0., 0.], [0.2, 0.], [-0.2, 0.], [2., 2.]])
+    v_nom = np.array([[0., 1.], [1., 0.], [-1., 0.], [0.5, 0.]])
+    v_safe, infeasible = team_cbf(positions, v_nom, alpha=1., radius=0.3, return_infeasible=True)
+    assert infeasible.tolist() == [0]
+    np.testing.assert_array_equal(v_safe[0], 0.)
+    G = positions[[1, 2, 3]] - positions[0]
+    h = 0.5 * (np.sum(G ** 2, axis=1) - 0.3 ** 2)
+    assert _cvxopt_qp(v_nom[0], G, h) is None
+    for i in (1, 2, 3):
+        G = np.delete(positions, i, axis=0) - positions[i]
+        h = 0.5 * (np.sum(G ** 2, axis=1) - 0.3 ** 2)
+        np.testing.assert_allclose(v_safe[i], _cvxopt_qp(v_nom[i], G, h), atol=1e-4)
+
+
+def _obstacle_set(alphas=None):
+    centers = np.array([[1., 0.], [0., 1.], [-1., 0.], [0., -1.], [1., 1.]])
+    keys = [('blue', 0), ('blue', 1), ('yellow', 0), ('yellow', 1), ('yellow', 2)]
+    return ObstacleSet(centers, [0.3, 0.3, 0.3, 0.3, 0.5], alphas, keys)
+
+
+def _rows(G, h):
+    """Constraints as a set of rows, masked rows being moved around by ObstacleSet.constraints()"""
+    return sorted(map(tuple, np.column_stack((G, h)).round(12)))
+
+
+@pytest.mark.parametrize('excluded', [(), (('blue', 0),), (('yellow', 2),), (('blue', 1), ('yellow', 0)),
+                                      (('blue', 0), ('blue', 1), ('yellow', 0), ('yellow', 1), ('yellow', 2))])
+def test_obstacle_set_masking(excluded):
+    obstacles = _obstacle_set()
+    p = np.array([0.2, -0.1])
+    view = obstacles.excluding(*excluded)
+    keep = [j for j, key in enumerate(obstacles.keys) if key not in excluded]
+    assert len(view) == len(keep)
+    G, h = view.constraints(p, 2.)
+    assert _rows(G, h) == _rows(*cbf_constraints(p, obstacles.centers[keep], obstacles.radii[keep], 2.))
+    # same obstacles as active(), arrays shared with the original set, which is not masked
+    centers, radii, _ = view.active()
+    np.testing.assert_array_equal(centers, obstacles.centers[keep])
+    np.testing.assert_array_equal(radii, obstacles.radii[keep])
+    assert view.centers is obstacles.centers
+    assert len(obstacles) == obstacles.capacity == 5
+
+
+def test_obstacle_set_masking_into_buffers():
+    obstacles = _obstacle_set()
+    p = np.array([0.2, -0.1])
+    G_out, h_out = np.empty((5, 2)), np.empty(5)
+    G, h = obstacles.excluding(('blue', 1)).excluding(('unknown', 0), ('yellow', 1)).constraints(p, 2., G_out, h_out)
+    assert np.shares_memory(G, G_out) and np.shares_memory(h, h_out)
+    assert _rows(G, h) == _rows(*cbf_constraints(p, obstacles.centers[[0, 2, 4]], obstacles.radii[[0, 2, 4]], 2.))
+
+
+def test_obstacle_set_per_obstacle_alpha():
+    alphas = np.array([0.5, 1., 2., 4., 8.])
+    p = np.array([0.2, -0.1])
+    G, h = _obstacle_set(alphas).constraints(p, alpha=100.)
+    _, h_unit = _obstacle_set().constraints(p, alpha=1.)
+    np.testing.assert_allclose(h, alphas * h_unit)
+    # masking keeps each obstacle with its own alpha
+    G, h = _obstacle_set(alphas).excluding(('blue', 1)).constraints(p, alpha=100.)
+    assert _rows(G, h) == _rows(*cbf_constraints(p, np.delete(_obstacle_set().centers, 1, axis=0),
+                                                 np.array([0.3, 0.3, 0.3, 0.5]), alphas[[0, 2, 3, 4]]))
+    with pytest.raises(ValueError):
+        _obstacle_set([1., 1., 0., 1., 1.])
+
+
+def test_solvers_use_per_obstacle_alpha():
+    p = np.array([0.2, -0.1])
+    v_nom = np.array([2., 0.5])
+    # a single alpha for all obstacles is the same as the alpha of the solvers
+    same = _obstacle_set(alphas=0.7)
+    expected = np.array(zeroing_cbf(p, v_nom, 0.7, _obstacle_set(), method='exact')['x'])
+    np.testing.assert_allclose(zeroing_cbf(p, v_nom, 100., same, method='exact')['x'], expected)
+    np.testing.assert_allclose(ZeroingCBFSolver(alpha=100., method='exact').solve(p, v_nom, same)['x'], expected)
+
+    alphas = np.array([0.5, 1., 2., 4., 8.])
+    obstacles = _obstacle_set(alphas)
+    G, h = obstacles.constraints(p, alpha=1.)
+    expected = _cvxopt_qp(v_nom, G, h)
+    np.testing.assert_allclose(np.ravel(zeroing_cbf(p, v_nom, 1., obstacles)['x']), expected, atol=1e-4)
+    np.testing.assert_allclose(np.ravel(zeroing_cbf(p, v_nom, 1., obstacles, method='exact')['x']), expected,
+                               atol=1e-4)
+    # team_cbf : a single robot avoids the obstacles of the set with their own radii and alpha values
+    v_safe = team_cbf(p[np.newaxis], v_nom[np.newaxis], alpha=1., obstacles=obstacles)
+    np.testing.assert_allclose(v_safe[0], expected, atol=1e-4)
@@ -0,0 +1,103 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.consensus_operator import ConsensusOperator, get_operator
+from src.discrete import discrete_consensus_cfunc, discrete_consensus_sim_complete, discrete_consensus_step
+
+
+def _graph(n, seed):
+    G = nx.gnp_random_graph(n, 0.3, directed=True, seed=seed)
+    G.add_edges_from((i, (i + 1) % n) for i in range(n))
+    return G
+
+
+def _loop_cfunc(G, epsilon, X0, offsets=None, common_drift=np.array(0.)):
+    """Original discrete_consensus_cfunc(), one agent and one neighbour at a time"""
+    u_k = np.zeros(X0.shape)
+    for node in G.nodes():
+        s = 0
+        for neighbour in G.neighbors(node):
+            s += X0[neighbour] - X0[node]
+            if offsets is not None:
+                s -= offsets[node]
+        u_k[node] = epsilon * (s + common_drift)
+    return u_k
+
+
+@pytest.mark.parametrize('dim', [None, 2])
+def test_operator_matches_laplacian(dim):
+    G = _graph(12, seed=1)
+    rng = np.random.default_rng(0)
+    shape = (12,) if dim is None else (12, dim)
+    X, offsets = rng.normal(size=shape), rng.normal(size=shape)
+    op = ConsensusOperator(G)
+    L = nx.laplacian_matrix(G).toarray().astype(float)
+    np.testing.assert_allclose(op.laplacian_dot(X), L @ X)
+    np.testing.assert_allclose(op.perron(0.05).toarray(), np.identity(12) - 0.05 * L)
+    np.testing.assert_allclose(op.step(X, 0.05, offsets), (np.identity(12) - 0.05 * L) @ X + 0.05 * offsets)
+    np.testing.assert_allclose(op.control(X, 0.05, offsets, np.array(0.3)), _loop_cfunc(G, 0.05, X, offsets, 0.3))
+    assert op.max_in_degree == max(d for _, d in G.in_degree)
+
+
+def test_from_adjacency_matches_graph():
+    G = _graph(20, seed=2)
+    X = np.random.default_rng(1).normal(size=(20, 2))
+    op = ConsensusOperator(G)
+    other = ConsensusOperator.from_adjacency(op.adjacency)
+    np.testing.assert_allclose(other.control(X, 0.1), op.control(X, 0.1))
+    assert other.max_in_degree == op.max_in_degree
+
+
+def test_step_rejects_large_epsilon():
+    G = _graph(6, seed=3)
+    with pytest.raises(ValueError):
+        ConsensusOperator(G).step(np.zeros(6), 1. / max(d for _, d in G.in_degree))
+
+
+def test_rewired_graph_rebuilds_operator():
+    G = nx.DiGraph([(0, 1), (1, 2), (2, 0)])
+    X = np.array([0., 1., 5.])
+    before = discrete_consensus_cfunc(G, 0.1, X)
+    op = get_operator(G)
+    G.remove_edge(0, 1)
+    G.add_edge(0, 2)  # same number of nodes and edges
+    assert get_operator(G) is not op
+    np.testing.assert_allclose(discrete_consensus_cfunc(G, 0.1, X), [0.5, 0.4, -0.5])
+    assert not np.allclose(discrete_consensus_cfunc(G, 0.1, X), before)
+
+
+def test_unchanged_graph_reuses_operator():
+    G = nx.DiGraph([(0, 1), (1, 0)])
+    assert get_operator(G) is get_operator(G)
+
+
+def test_step_uses_edge_weights():
+    G = nx.DiGraph()
+    G.add_weighted_edges_from([(0, 1, 0.5), (1, 2, 2.), (2, 0, 1.)])
+    X = np.array([[0., 1.], [1., 0.], [5., 2.]])
+    P = np.identity(3) - 0.2 * nx.laplacian_matrix(G).toarray()
+    np.testing.assert_allclose(discrete_consensus_step(G, 0.2, X), P @ X)
+    # weights are ignored by discrete_consensus_cfunc(), as in the original loop
+    np.testing.assert_allclose(discrete_consensus_cfunc(G, 0.2, X), 0.2 * (X[[1, 2, 0]] - X))
+
+
+def test_weight_change_rebuilds_operator():
+    G = nx.DiGraph()
+    G.add_weighted_edges_from([(0, 1, 1.), (1, 0, 1.)])
+    op = get_operator(G)
+    G[0][1]['weight'] = 3.
+    assert get_operator(G) is not op
+    assert get_operator(G).out_degree[0] == 3.
+
+
+def test_simulations_ignore_edge_weights():
+    # discrete_consensus_sim_complete() originally stepped with discrete_consensus_cfunc()
+    G = nx.DiGraph()
+    G.add_weighted_edges_from([(0, 1, 0.5), (1, 2, 2.), (2, 0, 1.)])
+    X = np.array([0., 1., 5.])
+    x = discrete_consensus_sim_complete(G, 0.2, X, steps=3)
+    expected = [X]
+    for _ in range(3):
+        expected.append(expected[-1] + _loop_cfunc(G, 0.2, expected[-1]))
+    np.testing.assert_allclose(x, expected)
@@ -0,0 +1,32 @@
+import os
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.consensus_operator import ConsensusOperator
+from src.convergence import achievement
+
+DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'src', 'data')
+
+CYCLE = ConsensusOperator(nx.DiGraph([(0, 1), (1, 2), (2, 0)]))
+
+
+def test_achievement_matches_line_dataset():
+    positions = np.load(os.path.join(DATA, 'line', 'real_results.npy'))
+    expected = np.load(os.path.join(DATA, 'line', 'achievement.npy'))
+    offsets = np.array([(-0.2, 0.2), (-0.2, 0.2), (0.4, -0.4)])
+    np.testing.assert_allclose(achievement(CYCLE, positions, offsets), expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('dataset', ['three_formations', 'three_formations_airconditioner'])
+def test_achievement_matches_three_formations_datasets(dataset):
+    positions = np.load(os.path.join(DATA, dataset, 'real_results.npy'))
+    expected = np.load(os.path.join(DATA, dataset, 'achievement.npy'))
+    formations = [[(0.4, 0.), (0.4, 0.), (-0.8, 0.)],  # formations.txt, one every 1200 ticks
+                  [(0.3, 0.3), (-0.6, 0.), (0.3, -0.3)],
+                  [(0.5, 0.), (-0.5, -0.5), (0., 0.5)]]
+    for k, offsets in enumerate(formations):
+        ticks = slice(1200 * k, 1200 * (k + 1) if k < 2 else None)
+        np.testing.assert_allclose(achievement(CYCLE, positions[ticks], np.array(offsets)), expected[ticks],
+                                   atol=1e-12)
@@ -0,0 +1,49 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.discrete import discrete_consensus_cfunc, discrete_consensus_sim_complete, discrete_consensus_states_at
+
+
+def _loop_sim(G, epsilon, X0, offsets=None, steps=10):
+    """Original discrete_consensus_sim_complete(), one discrete_consensus_cfunc() call per step"""
+    x = [X0]
+    last = X0
+    for _ in range(steps):
+        ctrl = discrete_consensus_cfunc(G, epsilon, last, offsets)
+        x.append(last + ctrl)
+        last = x[-1]
+    return np.array(x)
+
+
+@pytest.fixture
+def graph():
+    G = nx.gnp_random_graph(15, 0.25, directed=True, seed=4)
+    G.add_edges_from((i, (i + 1) % 15) for i in range(15))
+    return G
+
+
+@pytest.mark.parametrize('shape', [(15,), (15, 2)])
+@pytest.mark.parametrize('with_offsets', [False, True])
+def test_sim_complete_matches_loop(graph, shape, with_offsets):
+    rng = np.random.default_rng(5)
+    X0 = rng.normal(size=shape)
+    offsets = rng.normal(size=shape) if with_offsets else None
+    expected = _loop_sim(graph, 0.08, X0, offsets, steps=40)
+    np.testing.assert_allclose(discrete_consensus_sim_complete(graph, 0.08, X0, offsets, steps=40), expected)
+    np.testing.assert_allclose(discrete_consensus_sim_complete(graph, 0.08, X0, offsets, steps=40, final_only=True),
+                               expected[-1])
+
+
+@pytest.mark.parametrize('shape', [(15,), (15, 2)])
+def test_states_at_matches_loop(graph, shape):
+    rng = np.random.default_rng(6)
+    X0, offsets = rng.normal(size=shape), rng.normal(size=shape)
+    expected = _loop_sim(graph, 0.08, X0, offsets, steps=60)
+    at = [60, 0, 17, 17, 3]
+    np.testing.assert_allclose(discrete_consensus_states_at(graph, 0.08, X0, at, offsets), expected[at], atol=1e-10)
+
+
+def test_states_at_rejects_negative_steps(graph):
+    with pytest.raises(ValueError):
+        discrete_consensus_states_at(graph, 0.08, np.zeros(15), [-1])
@@ -0,0 +1,102 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+import src.dynamic_topology
+from src.consensus_operator import ConsensusOperator
+from src.dynamic_topology import DynamicConsensusOperator, dynamic_consensus_sim, proximity_edges
+
+N = 15
+
+
+def _random_arcs(rng, n_arcs):
+    return rng.integers(0, N, (n_arcs, 2))
+
+
+def _assert_same_operator(op: DynamicConsensusOperator, G: nx.DiGraph):
+    """op behaves as the ConsensusOperator rebuilt from the graph G"""
+    rebuilt = ConsensusOperator(G)
+    rng = np.random.default_rng(0)
+    X, offsets = rng.normal(size=(N, 2)), rng.normal(size=(N, 2))
+    assert sorted(map(tuple, op.edges.tolist())) == sorted(G.edges)
+    assert op.n_edges == G.number_of_edges()
+    assert op.max_in_degree == rebuilt.max_in_degree
+    np.testing.assert_allclose(op.out_degree, rebuilt.out_degree)
+    np.testing.assert_allclose(op.laplacian_dot(X), rebuilt.laplacian_dot(X))
+    np.testing.assert_allclose(op.control(X, 0.05, offsets, np.array(0.3)),
+                               rebuilt.control(X, 0.05, offsets, np.array(0.3)))
+    # step() merges the pending changes into the CSR matrix
+    np.testing.assert_allclose(op.step(X, 0.05, offsets), rebuilt.step(X, 0.05, offsets))
+
+
+@pytest.mark.parametrize('compact_fraction', [0., 0.1, np.inf])
+def test_edits_match_rebuilt_operator(compact_fraction, monkeypatch):
+    # compact_fraction 0 : CSR matrix rebuilt on every edit, inf : pending changes are never merged by the edits
+    monkeypatch.setattr(src.dynamic_topology, 'COMPACT_FRACTION', compact_fraction)
+    rng = np.random.default_rng(1)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(N))
+    op = DynamicConsensusOperator(N)
+    for k in range(30):
+        arcs = _random_arcs(rng, 6)
+        if k % 3 == 2:
+            # remove some existing arcs and some missing ones
+            arcs = np.vstack((arcs, op.edges[:4]))
+            op.remove_edges(arcs)
+            G.remove_edges_from(map(tuple, arcs.tolist()))
+        else:
+            op.add_edges(arcs)
+            G.add_edges_from((i, j) for i, j in arcs.tolist() if i != j)
+        _assert_same_operator(op, G)
+        assert nx.utils.graphs_equal(op.to_graph(), G)
+
+
+def test_set_edges_match_rebuilt_operator():
+    rng = np.random.default_rng(2)
+    op = DynamicConsensusOperator.from_graph(nx.gnp_random_graph(N, 0.3, directed=True, seed=2))
+    for _ in range(10):
+        G = nx.gnp_random_graph(N, 0.3, directed=True, seed=int(rng.integers(1000)))
+        before = {tuple(e) for e in op.edges.tolist()}
+        added, removed = op.set_edges(list(G.edges))
+        assert (added, removed) == (len(set(G.edges) - before), len(before - set(G.edges)))
+        _assert_same_operator(op, G)
+
+
+def test_proximity_edges():
+    X = np.random.default_rng(3).uniform(0., 2., (N, 2))
+    arcs = {tuple(e) for e in proximity_edges(X, 0.6).tolist()}
+    assert arcs == {(i, j) for i in range(N) for j in range(N)
+                    if i != j and np.linalg.norm(X[i] - X[j]) < 0.6}
+
+
+def test_self_loops():
+    G = nx.cycle_graph(N, create_using=nx.DiGraph)
+    G.add_edge(3, 3)
+    with pytest.raises(ValueError):
+        DynamicConsensusOperator.from_graph(G)
+    # self-loops given to the edits are ignored
+    G.remove_edge(3, 3)
+    op = DynamicConsensusOperator.from_graph(G)
+    op.add_edges([(3, 3), (4, 4)])
+    op.remove_edges([(5, 5)])
+    op.set_edges(list(G.edges) + [(6, 6)])
+    _assert_same_operator(op, G)
+    with pytest.raises(ValueError):
+        op.add_edges([(0, N)])
+
+
+def test_sim_matches_rebuilt_operators():
+    rng = np.random.default_rng(4)
+    G = nx.cycle_graph(N, create_using=nx.DiGraph)
+    events = [(_random_arcs(rng, 3), _random_arcs(rng, 3)) for _ in range(20)]
+    X0 = rng.normal(size=(N, 2))
+    x, arcs = dynamic_consensus_sim(DynamicConsensusOperator.from_graph(G), 0.05, X0, steps=20,
+                                    events=lambda k, X: events[k])
+
+    X = X0
+    for k, (added, removed) in enumerate(events):
+        G.remove_edges_from(map(tuple, removed.tolist()))
+        G.add_edges_from((i, j) for i, j in added.tolist() if i != j)
+        X = X + ConsensusOperator(G).control(X, 0.05)
+        np.testing.assert_allclose(x[k + 1], X)
+        assert arcs[k] == G.number_of_edges()
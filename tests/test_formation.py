@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import src.cbf
+from src.formation import make_formation_orders
+
+
+def _teams_data(blue, yellow):
+    robots = lambda positions: {i: SimpleNamespace(pos=np.array(p, dtype=float)) for i, p in enumerate(positions)}
+    return {'blue': robots(blue), 'yellow': robots(yellow)}
+
+
+@pytest.fixture
+def constraint_counts(monkeypatch):
+    """Number of constraints of each robot in the QPs solved by team_cbf()"""
+    counts = []
+    team_constraints = src.cbf._team_constraints
+
+    def counting(*args):
+        G, h = team_constraints(*args)
+        counts.append(h.shape[1])
+        return G, h
+
+    monkeypatch.setattr(src.cbf, '_team_constraints', counting)
+    return counts
+
+
+def test_far_obstacles_are_culled(constraint_counts):
+    G = nx.DiGraph([(0, 1), (1, 0)])
+    offsets = np.array([(0.5, 0.), (-0.5, 0.)])
+    # both robots close to their formation (slow nominal velocities) : one yellow robot close to blue 0,
+    # whose constraint is active, and four far away
+    teams_data = _teams_data([(0., 0.), (0.6, 0.)], [(0.2, 0.3), (4., 3.), (-4., 3.), (4., -3.), (-4., -3.)])
+
+    culled = make_formation_orders(G, offsets, epsilon=0.4)(teams_data)
+    full = make_formation_orders(G, offsets, epsilon=0.4, cull=False)(teams_data)
+    assert constraint_counts == [1, 7]  # close yellow robot only, against all 7 robots
+    for i in range(2):
+        np.testing.assert_allclose(culled['blue'][i], full['blue'][i])
+    assert culled['blue'][0][1, 0] < 0.  # blue 0 avoids the close yellow robot
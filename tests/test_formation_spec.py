@@ -0,0 +1,36 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.formation import formation_orders_from_spec
+from src.formation_spec import load_spec, make_spec, save_spec, spec_reaches_consensus
+from src.graph_analysis import optimal_epsilon
+
+SQUARE = np.array([(1., 1.), (1., -1.), (-1., -1.), (-1., 1.)])
+
+
+def test_connected_spec():
+    edges = [(0, 1), (1, 2), (2, 3), (3, 0)]
+    spec = make_spec(edges, SQUARE)
+    assert spec_reaches_consensus(spec)
+    assert (spec.epsilon, spec.rate) == optimal_epsilon(nx.DiGraph(edges))
+    assert spec.rate < 1.
+
+
+@pytest.mark.parametrize('edges', [
+    [],  # no links
+    [(0, 1), (1, 0), (2, 3), (3, 2)],  # two separate groups
+    [(0, 1), (1, 0), (2, 1)],  # agent 3 alone
+])
+def test_spec_without_consensus(edges, tmp_path):
+    spec = make_spec(edges, SQUARE)
+    assert not spec_reaches_consensus(spec)
+    assert np.isnan(spec.epsilon) and np.isnan(spec.rate)
+
+    path = str(tmp_path / "formation.npz")
+    save_spec(path, spec)
+    assert not spec_reaches_consensus(load_spec(path))
+    with pytest.raises(ValueError):
+        formation_orders_from_spec(path)
+    # still usable with an explicit epsilon
+    formation_orders_from_spec(path, epsilon=0.1)
@@ -0,0 +1,41 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.graph_analysis import algebraic_connectivity, convergence_rate, optimal_epsilon, predicted_steps, spectrum
+
+
+def _two_rings(n):
+    return nx.disjoint_union(nx.cycle_graph(n), nx.cycle_graph(n)).to_directed()
+
+
+@pytest.mark.parametrize('G', [
+    nx.DiGraph([(0, 1), (1, 0), (2, 3), (3, 2)]),  # two disjoint 2-cycles
+    _two_rings(5),
+    _two_rings(600),  # sparse solvers
+    nx.empty_graph(4, create_using=nx.DiGraph),  # no edges
+], ids=['2-cycles', 'rings', 'large rings', 'no edges'])
+def test_no_consensus(G):
+    assert algebraic_connectivity(G) == 0.
+    epsilon, rate = optimal_epsilon(G)
+    assert rate == 1.
+    assert convergence_rate(G, 0.5 / max(1, spectrum(G).max_in_degree)) == 1.
+    assert predicted_steps(G, epsilon, 1e-6) == np.inf
+
+
+def test_connected_matches_dense_laplacian():
+    G = nx.gnp_random_graph(30, 0.2, directed=True, seed=3)
+    G.add_edges_from((i, (i + 1) % 30) for i in range(30))  # ring, so that there is a spanning tree
+    eigenvalues = np.linalg.eigvals(nx.laplacian_matrix(G).toarray().astype(float))
+    nonzero = np.delete(eigenvalues, np.argmin(np.abs(eigenvalues)))
+    s = spectrum(G)
+    assert len(s.eigenvalues) == 29
+    assert s.algebraic_connectivity == pytest.approx(np.min(nonzero.real))
+    assert s.algebraic_connectivity > 0.
+
+
+def test_leader_follower_converges():
+    # agent 0 follows agent 1 : spanning tree rooted at 1, consensus in a single step with epsilon ~ 1
+    G = nx.DiGraph([(0, 1)])
+    assert algebraic_connectivity(G) == pytest.approx(1.)
+    assert optimal_epsilon(G)[1] < 1e-5
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.draw_formation import node_handler
+
+
+@pytest.fixture(autouse=True)
+def empty_drawing():
+    node_handler.clear()
+    yield
+    node_handler.clear()
+
+
+def _check_links():
+    """Neighbour lists and followers sets describe the same arcs, between existing nodes"""
+    for node in node_handler.nodes.values():
+        for other_id in node.neighbours:
+            assert node.id in node_handler.get_node(other_id).followers
+        for other_id in node.followers:
+            assert node.id in node_handler.get_node(other_id).neighbours
+
+
+def test_delete_create_delete():
+    n0, n1, n2 = (node_handler.create_node((100. * i, 100.)) for i in range(3))
+    node_handler.link(n2, n0)
+    node_handler.delete_node(n1)
+
+    new = node_handler.create_node((400., 100.))
+    assert new.id not in (n0.id, n2.id)
+    assert node_handler.get_node(n2.id) is n2
+    assert not node_handler.are_linked(new, n0)
+
+    node_handler.delete_node(n0)
+    assert n2.neighbours == []
+    assert set(node_handler.nodes) == {n2.id, new.id}
+    _check_links()
+
+
+def test_node_at_matches_scan():
+    rng = np.random.default_rng(0)
+    for p in rng.uniform(0., 600., (300, 2)):
+        node_handler.create_node(p)
+    for node in list(node_handler.nodes.values())[::3]:
+        node_handler.delete_node(node)
+    for pos in rng.uniform(0., 600., (200, 2)):
+        distances = {n: np.linalg.norm(n.coords - pos) for n in node_handler.nodes.values()}
+        closest = min(distances, key=distances.get)
+        expected = closest if distances[closest] < 16. else None
+        assert node_handler.node_at(pos, 16.) is expected
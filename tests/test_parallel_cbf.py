@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.cbf import team_cbf
+from src.formation import make_formation_orders
+from src.parallel_cbf import CBFWorkerPool, team_obstacles
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with CBFWorkerPool(alpha=1., max_robots=4, max_obstacles=8, workers=2, method='exact', fallback='last') as p:
+        yield p
+
+
+def _solve(pool, positions, v_nom, obstacles, deadline):
+    return pool.solve(positions, v_nom, *team_obstacles(positions, obstacles, 0.3), deadline=deadline)
+
+
+def test_pool_matches_team_cbf(pool):
+    positions = np.array([[0., 0.], [0.5, 0.], [0., 0.6]])
+    v_nom = np.array([[1., 0.], [-1., 0.2], [0.3, -1.]])
+    obstacles = np.array([[0.4, 0.4], [3., 3.]])
+    np.testing.assert_allclose(_solve(pool, positions, v_nom, obstacles, deadline=5.),
+                               team_cbf(positions, v_nom, alpha=1., radius=0.3, obstacles=obstacles), atol=1e-9)
+
+
+def test_last_fallback_is_rechecked(pool):
+    positions = np.array([[0., 0.], [3., 0.]])
+    v_nom = np.array([[1., 0.], [1., 0.]])
+    v = _solve(pool, positions, v_nom, np.empty((0, 2)), deadline=5.)
+    np.testing.assert_allclose(v, v_nom)
+    unsafe = pool.stats.unsafe_last
+    # no time to solve : robot 0 now has an obstacle right in front of it, robot 1 can keep its last velocity
+    v = _solve(pool, positions, v_nom, np.array([[0.35, 0.]]), deadline=0.)
+    np.testing.assert_array_equal(v, [[0., 0.], [1., 0.]])
+    assert pool.stats.unsafe_last == unsafe + 1
+
+
+def test_zero_fallback_by_default():
+    with CBFWorkerPool(alpha=1., max_robots=2, max_obstacles=2, workers=1, method='exact') as p:
+        v = p.solve(np.zeros((1, 2)), np.ones((1, 2)), np.zeros((1, 0, 2)), np.zeros((1, 0)), np.zeros(1, int), 0.)
+    np.testing.assert_array_equal(v, 0.)
+
+
+def test_formation_with_pool(pool):
+    G = nx.DiGraph([(0, 1), (1, 2), (2, 0)])
+    offsets = np.array([(0.5, 0.), (-0.25, 0.4), (-0.25, -0.4)])
+    robot = lambda x, y: SimpleNamespace(pos=np.array([x, y]))
+    teams_data = {'blue': {0: robot(0., 0.), 1: robot(0.5, 0.1), 2: robot(0.2, 0.6)},
+                  'yellow': {0: robot(0.4, 0.4), 1: robot(3., 3.)}}
+    with_pool = make_formation_orders(G, offsets, epsilon=0.3, alpha=1., cbf_pool=pool, deadline=5.)(teams_data)
+    serial = make_formation_orders(G, offsets, epsilon=0.3, alpha=1.)(teams_data)
+    for i in range(3):
+        np.testing.assert_allclose(with_pool['blue'][i], serial['blue'][i], atol=1e-9)
+    with pytest.raises(ValueError):
+        make_formation_orders(G, offsets, epsilon=0.3, alpha=0.3, cbf_pool=pool)
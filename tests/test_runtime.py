@@ -0,0 +1,21 @@
+import threading
+import time
+
+from src.runtime import ControlRuntime
+
+
+def test_callback_thread_is_stopped():
+    threads = threading.active_count()
+    with ControlRuntime(lambda frame: {'blue': {0: frame}}) as runtime:
+        callback = runtime.as_callback()
+        assert callback(1) == {}
+        end = time.monotonic() + 1.
+        while callback(2) == {} and time.monotonic() < end:
+            time.sleep(0.01)
+        assert callback(3)['blue'][0] in (1, 2, 3)
+        loop = runtime._background[0]
+        callback = runtime.as_callback()  # replaces the previous thread
+        assert loop.is_closed()
+        assert threading.active_count() == threads + 1
+    assert runtime._background is None
+    assert threading.active_count() == threads